@@ -0,0 +1,61 @@
+"""
+Alembic迁移环境
+
+迁移使用同步的pymysql驱动连接与应用相同的MySQL数据库
+"""
+
+from logging.config import fileConfig
+
+from alembic import context
+from sqlalchemy import engine_from_config, pool
+
+from backend.app.core.config import settings
+from backend.app.db.mysql import Base
+from backend.app import models  # noqa: F401  注册所有模型
+
+config = context.config
+
+if config.config_file_name is not None:
+    fileConfig(config.config_file_name)
+
+# 应用使用aiomysql异步驱动，迁移使用pymysql同步驱动
+config.set_main_option(
+    "sqlalchemy.url",
+    settings.MYSQL_DATABASE_URL.replace("+aiomysql", "+pymysql").replace("%", "%%"),
+)
+
+target_metadata = Base.metadata
+
+
+def run_migrations_offline() -> None:
+    """离线模式：只生成SQL，不连接数据库"""
+    context.configure(
+        url=config.get_main_option("sqlalchemy.url"),
+        target_metadata=target_metadata,
+        literal_binds=True,
+        dialect_opts={"paramstyle": "named"},
+    )
+
+    with context.begin_transaction():
+        context.run_migrations()
+
+
+def run_migrations_online() -> None:
+    """在线模式：连接数据库执行迁移"""
+    connectable = engine_from_config(
+        config.get_section(config.config_ini_section, {}),
+        prefix="sqlalchemy.",
+        poolclass=pool.NullPool,
+    )
+
+    with connectable.connect() as connection:
+        context.configure(connection=connection, target_metadata=target_metadata)
+
+        with context.begin_transaction():
+            context.run_migrations()
+
+
+if context.is_offline_mode():
+    run_migrations_offline()
+else:
+    run_migrations_online()
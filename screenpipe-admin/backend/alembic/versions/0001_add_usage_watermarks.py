@@ -0,0 +1,37 @@
+"""add usage_watermarks table
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-19
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0001"
+down_revision: Union[str, None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "usage_watermarks",
+        sa.Column("client_id", sa.String(50), primary_key=True),
+        sa.Column("last_timestamp", sa.DateTime(), nullable=False),
+        sa.Column("last_sort_timestamp", sa.BigInteger(), nullable=False),
+        sa.Column("last_monitoring_id", sa.BigInteger(), nullable=False),
+        sa.Column("last_app_name", sa.String(100), nullable=False),
+        sa.Column("updated_at", sa.DateTime(), server_default=sa.func.now()),
+        mysql_engine="InnoDB",
+        mysql_charset="utf8mb4",
+        mysql_collate="utf8mb4_unicode_ci",
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("usage_watermarks")
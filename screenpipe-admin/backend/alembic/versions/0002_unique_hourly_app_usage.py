@@ -0,0 +1,55 @@
+"""add unique key (user_id, app_name, timestamp) to hourly_app_usage
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-19
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0002"
+down_revision: Union[str, None] = "0001"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # 合并已有的重复记录：使用时间累加到ID最小的记录上，再删除其余记录
+    op.execute(
+        """
+        UPDATE hourly_app_usage h
+        JOIN (
+            SELECT MIN(id) AS keep_id, SUM(total_time_seconds) AS total_time_seconds
+            FROM hourly_app_usage
+            GROUP BY user_id, app_name, timestamp
+            HAVING COUNT(*) > 1
+        ) d ON h.id = d.keep_id
+        SET h.total_time_seconds = d.total_time_seconds
+        """
+    )
+    op.execute(
+        """
+        DELETE h FROM hourly_app_usage h
+        JOIN hourly_app_usage k
+          ON h.user_id = k.user_id
+         AND h.app_name = k.app_name
+         AND h.timestamp = k.timestamp
+         AND h.id > k.id
+        """
+    )
+
+    op.create_unique_constraint(
+        "uq_hourly_app_usage_user_app_ts",
+        "hourly_app_usage",
+        ["user_id", "app_name", "timestamp"],
+    )
+
+
+def downgrade() -> None:
+    op.drop_constraint(
+        "uq_hourly_app_usage_user_app_ts", "hourly_app_usage", type_="unique"
+    )
@@ -0,0 +1,46 @@
+"""add app_sessions table
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-19
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import mysql
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0003"
+down_revision: Union[str, None] = "0002"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "app_sessions",
+        sa.Column("id", sa.BigInteger(), primary_key=True, autoincrement=True),
+        sa.Column("user_id", sa.String(50), nullable=False),
+        sa.Column("app_name", sa.String(100), nullable=False),
+        sa.Column("window_name", sa.String(255), nullable=False),
+        sa.Column("start_time", mysql.DATETIME(fsp=6), nullable=False),
+        sa.Column("end_time", mysql.DATETIME(fsp=6), nullable=False),
+        sa.Column("duration_seconds", sa.Float(), nullable=False),
+        sa.Column("record_count", sa.Integer(), nullable=False),
+        sa.Column("created_at", sa.DateTime(), server_default=sa.func.now()),
+        sa.Column("updated_at", sa.DateTime(), server_default=sa.func.now()),
+        mysql_engine="InnoDB",
+        mysql_charset="utf8mb4",
+        mysql_collate="utf8mb4_unicode_ci",
+    )
+    op.create_index(
+        "ix_app_sessions_user_start", "app_sessions", ["user_id", "start_time"]
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_app_sessions_user_start", table_name="app_sessions")
+    op.drop_table("app_sessions")
@@ -0,0 +1,62 @@
+"""add daily_app_usage rollup table
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-19
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0004"
+down_revision: Union[str, None] = "0003"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "daily_app_usage",
+        sa.Column("id", sa.Integer(), primary_key=True, autoincrement=True),
+        sa.Column("user_id", sa.String(50), nullable=False),
+        sa.Column("usage_date", sa.Date(), nullable=False),
+        sa.Column("app_name", sa.String(100), nullable=False),
+        sa.Column(
+            "app_category_id",
+            sa.Integer(),
+            sa.ForeignKey("app_categories.id"),
+            nullable=True,
+        ),
+        sa.Column("total_time_seconds", sa.Float(), nullable=False),
+        sa.Column("switch_count", sa.Integer(), nullable=False),
+        sa.Column("created_at", sa.DateTime(), server_default=sa.func.now()),
+        sa.Column("updated_at", sa.DateTime(), server_default=sa.func.now()),
+        sa.UniqueConstraint(
+            "user_id", "app_name", "usage_date", name="uq_daily_app_usage_user_app_date"
+        ),
+        mysql_engine="InnoDB",
+        mysql_charset="utf8mb4",
+        mysql_collate="utf8mb4_unicode_ci",
+    )
+    op.create_index("ix_daily_app_usage_date", "daily_app_usage", ["usage_date"])
+
+    # 用已有的小时统计生成每日汇总
+    op.execute(
+        """
+        INSERT INTO daily_app_usage
+            (user_id, usage_date, app_name, app_category_id, total_time_seconds, switch_count)
+        SELECT user_id, DATE(timestamp), app_name, MAX(app_category_id),
+               SUM(total_time_seconds), SUM(COALESCE(switch_count, 0))
+        FROM hourly_app_usage
+        GROUP BY user_id, DATE(timestamp), app_name
+        """
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_daily_app_usage_date", table_name="daily_app_usage")
+    op.drop_table("daily_app_usage")
@@ -0,0 +1,36 @@
+"""add composite indexes for per-client usage range queries
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-19
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0005"
+down_revision: Union[str, None] = "0004"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # 按客户端过滤后按时间范围扫描，app_name用于分组时不必回表取值
+    op.create_index(
+        "ix_hourly_app_usage_user_ts_app",
+        "hourly_app_usage",
+        ["user_id", "timestamp", "app_name"],
+    )
+    op.create_index(
+        "ix_daily_app_usage_user_date",
+        "daily_app_usage",
+        ["user_id", "usage_date"],
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_daily_app_usage_user_date", table_name="daily_app_usage")
+    op.drop_index("ix_hourly_app_usage_user_ts_app", table_name="hourly_app_usage")
@@ -0,0 +1,36 @@
+"""add covering index for the day-of-week x hour heatmap
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-19
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0006"
+down_revision: Union[str, None] = "0005"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index(
+        "ix_hourly_app_usage_heatmap",
+        "hourly_app_usage",
+        [
+            "user_id",
+            "timestamp",
+            "day_of_week",
+            "hour_of_day",
+            "app_category_id",
+            "total_time_seconds",
+        ],
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_hourly_app_usage_heatmap", table_name="hourly_app_usage")
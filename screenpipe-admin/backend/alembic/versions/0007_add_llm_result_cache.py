@@ -0,0 +1,56 @@
+"""add llm_result_cache table
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2026-10-19
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import mysql
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0007"
+down_revision: Union[str, None] = "0006"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "llm_result_cache",
+        sa.Column("id", sa.BigInteger(), primary_key=True, autoincrement=True),
+        sa.Column("cache_key", sa.String(64), nullable=False),
+        sa.Column("analysis_type", sa.String(50), nullable=False),
+        sa.Column("client_id", sa.String(50), nullable=False),
+        sa.Column("window_start", sa.DateTime(), nullable=False),
+        sa.Column("window_end", sa.DateTime(), nullable=False),
+        sa.Column("prompt_version", sa.String(20), nullable=False),
+        sa.Column("input_hash", sa.String(64), nullable=False),
+        sa.Column("result", mysql.LONGTEXT(), nullable=False),
+        sa.Column("created_at", sa.DateTime(), server_default=sa.func.now()),
+        sa.Column("expires_at", sa.DateTime(), nullable=False),
+        sa.UniqueConstraint("cache_key"),
+        mysql_engine="InnoDB",
+        mysql_charset="utf8mb4",
+        mysql_collate="utf8mb4_unicode_ci",
+    )
+    op.create_index(
+        "ix_llm_result_cache_client_type_window",
+        "llm_result_cache",
+        ["client_id", "analysis_type", "window_start"],
+    )
+    op.create_index(
+        "ix_llm_result_cache_expires_at", "llm_result_cache", ["expires_at"]
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_llm_result_cache_expires_at", table_name="llm_result_cache")
+    op.drop_index(
+        "ix_llm_result_cache_client_type_window", table_name="llm_result_cache"
+    )
+    op.drop_table("llm_result_cache")
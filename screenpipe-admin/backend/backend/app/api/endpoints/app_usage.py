@@ -1,4 +1,4 @@
-from datetime import date, datetime, timedelta
+from datetime import date, datetime
 from typing import List, Optional
 
 from fastapi import APIRouter, Depends, HTTPException, Query
@@ -8,12 +8,14 @@ from ...db.mysql import get_db
 from ...models.api_models import (
     AppCategoryCreate,
     AppCategoryResponse,
+    AppSessionResponse,
     HourlyAppUsageSummary,
     PaginatedResponse,
     ProductivitySummary,
     ProductivityTypeEnum,
+    UsageHeatmapResponse,
 )
-from ...services.app_usage_service import AppUsageService
+from ...services.app_usage_service import AppUsageService, ProductivityType
 
 router = APIRouter()
 
@@ -134,114 +136,119 @@ async def delete_app_category(category_id: int, db: AsyncSession = Depends(get_d
         raise HTTPException(status_code=400, detail=f"删除应用类别失败: {str(e)}")
 
 
+def _build_productivity_summary(
+    start_date: date, end_date: date, dashboard: dict
+) -> ProductivitySummary:
+    """根据get_productivity_dashboard的统计数据计算生产力统计摘要"""
+    productive_minutes, neutral_minutes, distracting_minutes = dashboard["current"]
+
+    total_minutes = productive_minutes + neutral_minutes + distracting_minutes
+    
+    # 计算生产力百分比
+    productive_percentage = (
+        round(productive_minutes / total_minutes * 100, 2)
+        if total_minutes > 0
+        else 0
+    )
+    neutral_percentage = (
+        round(neutral_minutes / total_minutes * 100, 2)
+        if total_minutes > 0
+        else 0
+    )
+    distracting_percentage = (
+        round(distracting_minutes / total_minutes * 100, 2)
+        if total_minutes > 0
+        else 0
+    )
+    
+    # 前一天的数据，用于比较
+    yesterday_productive_minutes, yesterday_neutral_minutes, yesterday_distracting_minutes = (
+        dashboard["previous"]
+    )
+    
+    yesterday_total_minutes = yesterday_productive_minutes + yesterday_neutral_minutes + yesterday_distracting_minutes
+    
+    # 计算前一天的生产力百分比
+    yesterday_productive_percentage = (
+        round(yesterday_productive_minutes / yesterday_total_minutes * 100, 2)
+        if yesterday_total_minutes > 0
+        else 0
+    )
+    
+    # 计算变化百分比
+    total_minutes_change_percentage = (
+        round((total_minutes - yesterday_total_minutes) / yesterday_total_minutes * 100, 2)
+        if yesterday_total_minutes > 0
+        else 0
+    )
+    
+    # 计算效率指数变化（百分点）
+    productive_percentage_change = round(productive_percentage - yesterday_productive_percentage, 2)
+    
+    # 最常用应用及其占比
+    most_used_app_data = dashboard["most_used_app"]
+    most_used_app = most_used_app_data["app_name"] if most_used_app_data else None
+    most_used_app_percentage = (
+        round(most_used_app_data["total_minutes"] / total_minutes * 100, 2)
+        if most_used_app_data and total_minutes > 0
+        else 0
+    )
+
+    # 异常检测（简单实现）
+    anomaly_count = 0
+    anomaly_description = "一切正常"
+    
+    # 检查是否有异常情况
+    if distracting_percentage > 30:
+        anomaly_count += 1
+        anomaly_description = "干扰型应用使用时间过长"
+    elif total_minutes > 720:  # 12小时
+        anomaly_count += 1
+        anomaly_description = "使用时间过长，请注意休息"
+    
+    return ProductivitySummary(
+        start_date=start_date,
+        end_date=end_date,
+        productive_minutes=productive_minutes,
+        neutral_minutes=neutral_minutes,
+        distracting_minutes=distracting_minutes,
+        total_minutes=total_minutes,
+        productive_percentage=productive_percentage,
+        neutral_percentage=neutral_percentage,
+        distracting_percentage=distracting_percentage,
+        # 新增字段
+        yesterday_total_minutes=yesterday_total_minutes,
+        yesterday_productive_minutes=yesterday_productive_minutes,
+        yesterday_neutral_minutes=yesterday_neutral_minutes,
+        yesterday_distracting_minutes=yesterday_distracting_minutes,
+        yesterday_productive_percentage=yesterday_productive_percentage,
+        total_minutes_change_percentage=total_minutes_change_percentage,
+        productive_percentage_change=productive_percentage_change,
+        most_used_app=most_used_app,
+        most_used_app_percentage=most_used_app_percentage,
+        switch_count=dashboard["switch_count"],
+        anomaly_count=anomaly_count,
+        anomaly_description=anomaly_description,
+    )
+
+
 @router.get("/productivity-summary", response_model=ProductivitySummary)
 async def get_productivity_summary(
     start_date: date = Query(..., description="开始日期"),
     end_date: date = Query(..., description="结束日期"),
-    db: AsyncSession = Depends(get_db),
+    client_id: Optional[str] = Query(None, description="客户端ID，为空时统计所有客户端"),
 ):
-    """获取生产力统计摘要"""
-    service = AppUsageService(db)
-    try:
-        # 获取当前日期范围的生产力数据
-        productive_minutes, neutral_minutes, distracting_minutes = (
-            await service.get_productivity_summary(
-                start_date=start_date, end_date=end_date
-            )
-        )
+    """
+    获取生产力统计摘要
 
-        total_minutes = productive_minutes + neutral_minutes + distracting_minutes
-        
-        # 计算生产力百分比
-        productive_percentage = (
-            round(productive_minutes / total_minutes * 100, 2)
-            if total_minutes > 0
-            else 0
-        )
-        neutral_percentage = (
-            round(neutral_minutes / total_minutes * 100, 2)
-            if total_minutes > 0
-            else 0
-        )
-        distracting_percentage = (
-            round(distracting_minutes / total_minutes * 100, 2)
-            if total_minutes > 0
-            else 0
-        )
-        
-        # 获取前一天的数据进行比较
-        yesterday_start = start_date - timedelta(days=1)
-        yesterday_end = end_date - timedelta(days=1)
-        
-        yesterday_productive_minutes, yesterday_neutral_minutes, yesterday_distracting_minutes = (
-            await service.get_productivity_summary(
-                start_date=yesterday_start, end_date=yesterday_end
-            )
-        )
-        
-        yesterday_total_minutes = yesterday_productive_minutes + yesterday_neutral_minutes + yesterday_distracting_minutes
-        
-        # 计算前一天的生产力百分比
-        yesterday_productive_percentage = (
-            round(yesterday_productive_minutes / yesterday_total_minutes * 100, 2)
-            if yesterday_total_minutes > 0
-            else 0
-        )
-        
-        # 计算变化百分比
-        total_minutes_change_percentage = (
-            round((total_minutes - yesterday_total_minutes) / yesterday_total_minutes * 100, 2)
-            if yesterday_total_minutes > 0
-            else 0
-        )
-        
-        # 计算效率指数变化（百分点）
-        productive_percentage_change = round(productive_percentage - yesterday_productive_percentage, 2)
-        
-        # 获取最常用应用及其占比
-        most_used_app_data = await service.get_most_used_app(start_date, end_date)
-        most_used_app = most_used_app_data["app_name"] if most_used_app_data else None
-        most_used_app_percentage = (
-            round(most_used_app_data["total_minutes"] / total_minutes * 100, 2)
-            if most_used_app_data and total_minutes > 0
-            else 0
-        )
-        
-        # 异常检测（简单实现）
-        anomaly_count = 0
-        anomaly_description = "一切正常"
-        
-        # 检查是否有异常情况
-        if distracting_percentage > 30:
-            anomaly_count += 1
-            anomaly_description = "干扰型应用使用时间过长"
-        elif total_minutes > 720:  # 12小时
-            anomaly_count += 1
-            anomaly_description = "使用时间过长，请注意休息"
-        
-        return ProductivitySummary(
-            start_date=start_date,
-            end_date=end_date,
-            productive_minutes=productive_minutes,
-            neutral_minutes=neutral_minutes,
-            distracting_minutes=distracting_minutes,
-            total_minutes=total_minutes,
-            productive_percentage=productive_percentage,
-            neutral_percentage=neutral_percentage,
-            distracting_percentage=distracting_percentage,
-            # 新增字段
-            yesterday_total_minutes=yesterday_total_minutes,
-            yesterday_productive_minutes=yesterday_productive_minutes,
-            yesterday_neutral_minutes=yesterday_neutral_minutes,
-            yesterday_distracting_minutes=yesterday_distracting_minutes,
-            yesterday_productive_percentage=yesterday_productive_percentage,
-            total_minutes_change_percentage=total_minutes_change_percentage,
-            productive_percentage_change=productive_percentage_change,
-            most_used_app=most_used_app,
-            most_used_app_percentage=most_used_app_percentage,
-            anomaly_count=anomaly_count,
-            anomaly_description=anomaly_description,
+    指定client_id时只统计该客户端的数据，环比、最常用应用和异常检测都在该客户端内计算；
+    为空时汇总所有客户端
+    """
+    try:
+        dashboard = await AppUsageService.get_productivity_dashboard(
+            start_date, end_date, user_id=client_id
         )
+        return _build_productivity_summary(start_date, end_date, dashboard)
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"获取生产力统计摘要失败: {str(e)}")
 
@@ -250,13 +257,17 @@ async def get_productivity_summary(
 async def get_daily_app_usage(
     start_date: date = Query(..., description="开始日期"),
     end_date: date = Query(..., description="结束日期"),
+    top_n: Optional[int] = Query(
+        None, ge=1, le=100, description="每天只返回使用时间最长的应用数量，其余合并为“其他”"
+    ),
+    client_id: Optional[str] = Query(None, description="客户端ID，为空时统计所有客户端"),
     db: AsyncSession = Depends(get_db),
 ):
     """获取每日应用使用时间统计"""
     service = AppUsageService(db)
     try:
         daily_usage = await service.get_daily_app_usage(
-            start_date=start_date, end_date=end_date
+            start_date=start_date, end_date=end_date, top_n=top_n, user_id=client_id
         )
 
         return daily_usage
@@ -268,14 +279,85 @@ async def get_daily_app_usage(
 
 @router.get("/hourly-app-usage", response_model=List[HourlyAppUsageSummary])
 async def get_hourly_app_usage(
-    date: date = Query(..., description="日期"), db: AsyncSession = Depends(get_db)
+    date: date = Query(..., description="日期"),
+    client_id: Optional[str] = Query(None, description="客户端ID，为空时统计所有客户端"),
+    db: AsyncSession = Depends(get_db),
 ):
     """获取按应用分组的每小时使用统计"""
     service = AppUsageService(db)
     try:
-        hourly_app_usage = await service.get_hourly_app_usage_summary(date=date)
+        hourly_app_usage = await service.get_hourly_app_usage_summary(
+            date=date, user_id=client_id
+        )
         return hourly_app_usage
     except Exception as e:
         raise HTTPException(
             status_code=400, detail=f"获取按应用分组的每小时使用统计失败: {str(e)}"
         )
+
+
+@router.get("/heatmap", response_model=UsageHeatmapResponse)
+async def get_usage_heatmap(
+    client_id: str = Query(..., description="客户端ID"),
+    start_date: date = Query(..., description="开始日期"),
+    end_date: date = Query(..., description="结束日期"),
+    db: AsyncSession = Depends(get_db),
+):
+    """获取指定客户端按星期和小时分布的使用时间热力图"""
+    service = AppUsageService(db)
+    try:
+        heatmap = await service.get_usage_heatmap(
+            start_date, end_date, user_id=client_id
+        )
+        return UsageHeatmapResponse(
+            client_id=client_id,
+            start_date=start_date,
+            end_date=end_date,
+            productive_minutes=heatmap[ProductivityType.PRODUCTIVE],
+            neutral_minutes=heatmap[ProductivityType.NEUTRAL],
+            distracting_minutes=heatmap[ProductivityType.DISTRACTING],
+        )
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"获取使用时间热力图失败: {str(e)}")
+
+
+@router.get("/sessions", response_model=PaginatedResponse[AppSessionResponse])
+async def get_app_sessions(
+    client_id: str = Query(..., description="客户端ID"),
+    start_time: datetime = Query(..., description="开始时间（北京时间）"),
+    end_time: datetime = Query(..., description="结束时间（北京时间）"),
+    app_name: Optional[str] = Query(None, description="应用名称"),
+    skip: int = 0,
+    limit: int = Query(100, ge=1, le=1000),
+    db: AsyncSession = Depends(get_db),
+):
+    """获取客户端在时间范围内的应用会话，每个会话是连续使用同一应用窗口的一段时间"""
+    service = AppUsageService(db)
+    try:
+        sessions, total = await service.get_app_sessions(
+            client_id=client_id,
+            start_time=start_time,
+            end_time=end_time,
+            app_name=app_name,
+            skip=skip,
+            limit=limit,
+        )
+
+        results = [
+            AppSessionResponse(
+                id=session.id,
+                app_name=session.app_name,
+                window_name=session.window_name,
+                start_time=session.start_time,
+                end_time=session.end_time,
+                duration_seconds=session.duration_seconds,
+                record_count=session.record_count,
+            )
+            for session in sessions
+        ]
+
+        return PaginatedResponse[AppSessionResponse](
+            items=results, total=total, page=skip // limit + 1, size=limit
+        )
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"获取应用会话失败: {str(e)}")
@@ -4,10 +4,13 @@ import os
 from datetime import datetime, timedelta
 
 from elasticsearch import AsyncElasticsearch
+from sqlalchemy.ext.asyncio import AsyncSession
 
+from ...services.llm_result_cache import LLMResultCacheService, snap_window
 from ...services.pattern_recognition_service import PatternRecognitionService
 from ...core.config import settings
 from ...db.elasticsearch import get_es_client
+from ...db.mysql import get_db
 
 router = APIRouter()
 
@@ -17,7 +20,8 @@ async def analyze_ocr_data_from_db(
     start_time: Optional[int] = None,
     end_time: Optional[int] = None,
     limit: int = Query(1000, description="最大记录数"),
-    es_client: AsyncElasticsearch = Depends(get_es_client)
+    es_client: AsyncElasticsearch = Depends(get_es_client),
+    db: AsyncSession = Depends(get_db)
 ):
     """
     从数据库获取OCR数据并分析模式
@@ -39,9 +43,9 @@ async def analyze_ocr_data_from_db(
             "setup_instructions": "请设置环境变量OPENAI_API_KEY"
         }
     
-    # 设置默认时间范围（如果未提供）
+    # 设置默认时间范围（如果未提供），结束时间对齐到缓存粒度，粒度内的重复请求可以复用分析结果
     if not end_time:
-        end_time_dt = datetime.utcnow()
+        end_time_dt = snap_window(datetime.utcnow(), timedelta(0))[1]
     else:
         end_time_dt = datetime.fromtimestamp(end_time)
         
@@ -53,7 +57,7 @@ async def analyze_ocr_data_from_db(
     
     try:
         # 创建服务实例
-        service = PatternRecognitionService(openai_api_key=openai_api_key, es_client=es_client)
+        service = PatternRecognitionService(openai_api_key=openai_api_key, es_client=es_client, db=db)
         
         # 从ES获取数据并分析
         result = await service.analyze_client_data(
@@ -73,7 +77,8 @@ async def analyze_client_patterns(
     start_time: Optional[int] = None,
     end_time: Optional[int] = None,
     limit: int = Query(1000, description="最大记录数"),
-    es_client: AsyncElasticsearch = Depends(get_es_client)
+    es_client: AsyncElasticsearch = Depends(get_es_client),
+    db: AsyncSession = Depends(get_db)
 ):
     """
     分析特定客户端的行为模式
@@ -95,9 +100,9 @@ async def analyze_client_patterns(
             "setup_instructions": "请设置环境变量OPENAI_API_KEY"
         }
     
-    # 设置默认时间范围（如果未提供）
+    # 设置默认时间范围（如果未提供），结束时间对齐到缓存粒度，粒度内的重复请求可以复用分析结果
     if not end_time:
-        end_time_dt = datetime.now()
+        end_time_dt = snap_window(datetime.now(), timedelta(0))[1]
     else:
         end_time_dt = datetime.fromtimestamp(end_time)
         
@@ -109,7 +114,7 @@ async def analyze_client_patterns(
     
     try:
         # 创建服务实例
-        service = PatternRecognitionService(openai_api_key=openai_api_key, es_client=es_client)
+        service = PatternRecognitionService(openai_api_key=openai_api_key, es_client=es_client, db=db)
         
         # 从ES获取数据并分析
         result = await service.analyze_client_data(
@@ -121,4 +126,24 @@ async def analyze_client_patterns(
         
         return result
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"模式识别分析失败: {str(e)}") 
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"模式识别分析失败: {str(e)}") 
+
+@router.delete("/clients/{client_id}/patterns/cache")
+async def invalidate_client_patterns_cache(
+    client_id: str,
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    删除特定客户端缓存的模式识别结果
+    
+    参数:
+    - client_id: 客户端ID
+    
+    返回:
+    - 删除的缓存条目数
+    """
+    try:
+        deleted = await LLMResultCacheService(db).invalidate(client_id, analysis_type="patterns")
+        return {"status": "success", "deleted": deleted}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"删除模式识别缓存失败: {str(e)}")
@@ -1,15 +1,29 @@
-from fastapi import APIRouter, Depends, Query
+from fastapi import APIRouter, Depends, HTTPException, Query
 from elasticsearch import AsyncElasticsearch
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 import logging
 from typing import List, Optional
 
 from ...db.elasticsearch import get_es_client
-from ...services.query_service import QueryService
+from ...services.query_service import QueryService, TIMELINE_SOURCES
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
 
+def _resolve_track_total_hits(exact_total: bool, total_cap: Optional[int]):
+    """将接口的计数参数转换为ES的track_total_hits"""
+    if total_cap is not None:
+        return total_cap
+    if not exact_total:
+        return False
+    return None
+
+def _to_naive_utc(value: Optional[datetime]) -> Optional[datetime]:
+    """带时区的时间转换为不带时区的UTC时间，与utcnow()补齐的时间保持一致"""
+    if value is not None and value.tzinfo is not None:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
 @router.get("/ui-monitoring")
 async def get_ui_monitoring(
     client_id: Optional[str] = None,
@@ -20,6 +34,8 @@ async def get_ui_monitoring(
     limit: int = Query(100, ge=1, le=1000),
     offset: int = Query(0, ge=0),
     sort_order: str = Query("desc", regex="^(asc|desc)$"),
+    exact_total: bool = Query(True, description="是否统计精确总数，为false时只返回has_more"),
+    total_cap: Optional[int] = Query(None, ge=1, le=10000, description="总数统计上限，超过时total_relation为gte"),
     es_client: AsyncElasticsearch = Depends(get_es_client)
 ):
     """
@@ -43,7 +59,8 @@ async def get_ui_monitoring(
             window=window,
             limit=limit,
             offset=offset,
-            sort_order=sort_order
+            sort_order=sort_order,
+            track_total_hits=_resolve_track_total_hits(exact_total, total_cap)
         )
         
         return result
@@ -98,6 +115,59 @@ async def get_ui_monitoring_windows(
         logger.error(f"Error in UI monitoring windows query API: {e}")
         raise
 
+@router.get("/activity-histogram")
+async def get_activity_histogram(
+    client_id: Optional[str] = None,
+    start_time: Optional[datetime] = None,
+    end_time: Optional[datetime] = None,
+    app: Optional[str] = None,
+    window: Optional[str] = None,
+    interval: str = Query("1h", regex="^([1-9][0-9]*(ms|s|m|h|d)|1[wMqy]|minute|hour|day|week|month|quarter|year)$"),
+    time_zone: str = Query("+08:00", description="分桶时区，如+08:00或Asia/Shanghai"),
+    group_by: Optional[str] = Query(None, regex="^(app|window)$"),
+    group_size: int = Query(10, ge=1, le=100),
+    es_client: AsyncElasticsearch = Depends(get_es_client)
+):
+    """
+    获取UI监控活动直方图，在ES端按时间间隔分桶，可按应用或窗口细分
+    
+    时间范围内的桶数量过多时返回400
+    """
+    try:
+        # 参数可能带时区（如以Z结尾），先统一为UTC再补齐和计算桶数量
+        start_time = _to_naive_utc(start_time)
+        end_time = _to_naive_utc(end_time)
+        
+        # 未指定的时间范围按最近24小时补齐，保证桶数量可以估算
+        if not end_time:
+            end_time = datetime.utcnow()
+        if not start_time:
+            start_time = end_time - timedelta(hours=24)
+        
+        # 创建查询服务
+        query_service = QueryService(es_client)
+        
+        # 执行查询
+        result = await query_service.get_ui_monitoring_activity_histogram(
+            client_id=client_id,
+            start_time=start_time,
+            end_time=end_time,
+            app=app,
+            window=window,
+            interval=interval,
+            time_zone=time_zone,
+            group_by=group_by,
+            group_size=group_size
+        )
+        
+        return result
+        
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error in activity histogram query API: {e}")
+        raise
+
 @router.get("/ocr-text")
 async def get_ocr_text(
     client_id: Optional[str] = None,
@@ -109,6 +179,8 @@ async def get_ocr_text(
     limit: int = Query(100, ge=1, le=1000),
     offset: int = Query(0, ge=0),
     sort_order: str = Query("desc", regex="^(asc|desc)$"),
+    exact_total: bool = Query(True, description="是否统计精确总数，为false时只返回has_more"),
+    total_cap: Optional[int] = Query(None, ge=1, le=10000, description="总数统计上限，超过时total_relation为gte"),
     es_client: AsyncElasticsearch = Depends(get_es_client)
 ):
     """
@@ -133,7 +205,8 @@ async def get_ocr_text(
             focused=focused,
             limit=limit,
             offset=offset,
-            sort_order=sort_order
+            sort_order=sort_order,
+            track_total_hits=_resolve_track_total_hits(exact_total, total_cap)
         )
         
         return result
@@ -186,4 +259,143 @@ async def get_ocr_text_windows(
         
     except Exception as e:
         logger.error(f"Error in OCR text windows query API: {e}")
-        raise 
\ No newline at end of file
+        raise
+
+@router.get("/audio-transcriptions")
+async def get_audio_transcriptions(
+    client_id: Optional[str] = None,
+    start_time: Optional[datetime] = None,
+    end_time: Optional[datetime] = None,
+    device: Optional[str] = None,
+    is_input_device: Optional[bool] = None,
+    speaker_id: Optional[int] = None,
+    limit: int = Query(100, ge=1, le=1000),
+    cursor: Optional[str] = Query(None, description="上一页返回的next_cursor"),
+    sort_order: str = Query("desc", regex="^(asc|desc)$"),
+    exact_total: bool = Query(True, description="是否统计精确总数，为false时只返回has_more"),
+    total_cap: Optional[int] = Query(None, ge=1, le=10000, description="总数统计上限，超过时total_relation为gte"),
+    es_client: AsyncElasticsearch = Depends(get_es_client)
+):
+    """
+    获取音频转录数据，支持按设备和说话人过滤，使用游标分页
+    """
+    try:
+        # 如果没有指定时间范围，默认查询最近24小时
+        if not start_time and not end_time:
+            end_time = datetime.utcnow()
+            start_time = end_time - timedelta(hours=24)
+        
+        # 创建查询服务
+        query_service = QueryService(es_client)
+        
+        # 执行查询
+        result = await query_service.get_audio_transcriptions_by_time(
+            client_id=client_id,
+            start_time=start_time,
+            end_time=end_time,
+            device=device,
+            is_input_device=is_input_device,
+            speaker_id=speaker_id,
+            limit=limit,
+            cursor=cursor,
+            sort_order=sort_order,
+            track_total_hits=_resolve_track_total_hits(exact_total, total_cap)
+        )
+        
+        return result
+        
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error in audio transcriptions query API: {e}")
+        raise
+
+@router.get("/audio-transcriptions/talk-time")
+async def get_audio_talk_time(
+    client_id: Optional[str] = None,
+    start_time: Optional[datetime] = None,
+    end_time: Optional[datetime] = None,
+    device: Optional[str] = None,
+    is_input_device: Optional[bool] = None,
+    speaker_id: Optional[int] = None,
+    size: int = Query(100, ge=1, le=1000),
+    es_client: AsyncElasticsearch = Depends(get_es_client)
+):
+    """
+    按说话人和设备统计讲话时长
+    """
+    try:
+        # 如果没有指定时间范围，默认查询最近24小时
+        if not start_time and not end_time:
+            end_time = datetime.utcnow()
+            start_time = end_time - timedelta(hours=24)
+        
+        # 创建查询服务
+        query_service = QueryService(es_client)
+        
+        # 执行查询
+        result = await query_service.get_audio_talk_time(
+            client_id=client_id,
+            start_time=start_time,
+            end_time=end_time,
+            device=device,
+            is_input_device=is_input_device,
+            speaker_id=speaker_id,
+            size=size
+        )
+        
+        return result
+        
+    except Exception as e:
+        logger.error(f"Error in audio talk time query API: {e}")
+        raise
+
+@router.get("/timeline")
+async def get_timeline(
+    client_id: str,
+    start_time: Optional[datetime] = None,
+    end_time: Optional[datetime] = None,
+    sources: Optional[List[str]] = Query(None, description="数据源：ui、ocr、audio，默认全部"),
+    limit: int = Query(100, ge=1, le=1000),
+    cursor: Optional[str] = Query(None, description="上一页返回的next_cursor"),
+    sort_order: str = Query("asc", regex="^(asc|desc)$"),
+    es_client: AsyncElasticsearch = Depends(get_es_client)
+):
+    """
+    获取UI监控、OCR文本和音频转录按时间合并后的时间线，使用游标分页
+    """
+    try:
+        # 校验数据源
+        if sources:
+            invalid = [source for source in sources if source not in TIMELINE_SOURCES]
+            if invalid:
+                raise HTTPException(status_code=400, detail=f"未知数据源: {', '.join(invalid)}")
+        
+        # 如果没有指定时间范围，默认查询最近24小时
+        if not start_time and not end_time:
+            end_time = datetime.utcnow()
+            start_time = end_time - timedelta(hours=24)
+        
+        # 创建查询服务
+        query_service = QueryService(es_client)
+        
+        # 执行查询
+        result = await query_service.get_timeline(
+            client_id=client_id,
+            start_time=start_time,
+            end_time=end_time,
+            sources=sources,
+            limit=limit,
+            cursor=cursor,
+            sort_order=sort_order
+        )
+        
+        return result
+        
+    except HTTPException:
+        raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error in timeline query API: {e}")
+        raise
@@ -1,10 +1,13 @@
 from fastapi import APIRouter, Depends, Query, HTTPException
 from elasticsearch import AsyncElasticsearch
+from sqlalchemy.ext.asyncio import AsyncSession
 from datetime import datetime, timedelta
 import logging
 from typing import Optional
 
 from ...db.elasticsearch import get_es_client
+from ...db.mysql import get_db
+from ...services.llm_result_cache import LLMResultCacheService
 from ...services.work_summary_service import WorkSummaryService
 from ...core.config import settings
 
@@ -15,14 +18,20 @@ logger = logging.getLogger(__name__)
 async def analyze_work_content(
     client_id: str,
     hours: int = Query(4, ge=1, le=24),
-    es_client: AsyncElasticsearch = Depends(get_es_client)
+    refresh: bool = Query(False, description="忽略已保存的总结并重新分析"),
+    es_client: AsyncElasticsearch = Depends(get_es_client),
+    db: AsyncSession = Depends(get_db)
 ):
     """
     分析用户在指定时间范围内的工作内容
     
+    优先返回定时任务预先生成的最新总结，没有可用的总结时才即时分析。定时任务只预先
+    生成WORK_SUMMARY_PERIODS中的窗口，其他hours取值直接即时生成总结
+    
     Args:
         client_id: 客户端ID
-        hours: 要分析的小时数，默认为4小时，最大24小时
+        hours: 要分析的小时数，取值1-24，默认为4小时
+        refresh: 是否忽略已保存的总结并重新分析
         
     Returns:
         工作内容分析结果
@@ -31,13 +40,15 @@ async def analyze_work_content(
         # 创建工作内容总结服务
         service = WorkSummaryService(
             openai_api_key=settings.OPENAI_API_KEY,
-            es_client=es_client
+            es_client=es_client,
+            db=db
         )
         
         # 分析工作内容
         result = await service.analyze_work_content(
             client_id=client_id,
-            hours=hours
+            hours=hours,
+            refresh=refresh
         )
         
         if not result.get("success", False):
@@ -59,7 +70,8 @@ async def analyze_work_content(
 async def get_work_stats(
     client_id: str,
     hours: int = Query(4, ge=1, le=24),
-    es_client: AsyncElasticsearch = Depends(get_es_client)
+    es_client: AsyncElasticsearch = Depends(get_es_client),
+    db: AsyncSession = Depends(get_db)
 ):
     """
     获取用户在指定时间范围内的工作统计数据
@@ -74,7 +86,8 @@ async def get_work_stats(
     try:
         # 创建工作内容总结服务
         service = WorkSummaryService(
-            es_client=es_client
+            es_client=es_client,
+            db=db
         )
         
         # 设置时间范围
@@ -85,7 +98,8 @@ async def get_work_stats(
         work_data = await service.get_work_data(
             client_id=client_id,
             start_time=start_time,
-            end_time=end_time
+            end_time=end_time,
+            include_records=False
         )
         
         if not work_data:
@@ -99,6 +113,7 @@ async def get_work_stats(
             "total_records": work_data["total_records"],
             "app_stats": work_data["app_stats"],
             "window_stats": work_data["window_stats"][:20],  # 只返回前20个最活跃的窗口
+            "switch_count": work_data["switch_count"],
             "time_range": {
                 "start": start_time.isoformat(),
                 "end": end_time.isoformat()
@@ -110,4 +125,30 @@ async def get_work_stats(
         raise HTTPException(
             status_code=500,
             detail=f"获取工作统计数据失败: {str(e)}"
-        ) 
\ No newline at end of file
+        ) 
+
+@router.delete("/cache")
+async def invalidate_work_summary_cache(
+    client_id: str,
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    删除用户缓存的工作内容分析结果
+    
+    Args:
+        client_id: 客户端ID
+        
+    Returns:
+        删除的缓存条目数
+    """
+    try:
+        deleted = await LLMResultCacheService(db).invalidate(
+            client_id, analysis_type="work_summary"
+        )
+        return {"status": "success", "deleted": deleted}
+    except Exception as e:
+        logger.error(f"删除工作内容分析缓存API错误: {str(e)}")
+        raise HTTPException(
+            status_code=500,
+            detail=f"删除工作内容分析缓存失败: {str(e)}"
+        )
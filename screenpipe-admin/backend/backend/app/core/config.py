@@ -48,6 +48,10 @@ class Settings(BaseSettings):
     
     # 定时任务配置
     ENABLE_SCHEDULED_TASKS: bool = os.getenv("ENABLE_SCHEDULED_TASKS", "True").lower() == "true"
+    USAGE_RECALC_CONCURRENCY: int = int(os.getenv("USAGE_RECALC_CONCURRENCY", "8"))  # 小时统计并发处理的客户端数量
+    APP_CATEGORY_CACHE_TTL: int = int(os.getenv("APP_CATEGORY_CACHE_TTL", "300"))  # 应用类别匹配规则缓存时间（秒）
+    DAILY_ROLLUP_THRESHOLD_DAYS: int = int(os.getenv("DAILY_ROLLUP_THRESHOLD_DAYS", "7"))  # 查询超过该天数时读取每日汇总表
+    USAGE_QUERY_CACHE_TTL: int = int(os.getenv("USAGE_QUERY_CACHE_TTL", "300"))  # 应用使用统计查询结果缓存时间（秒）
     
     # WebSocket配置
     WEBSOCKET_PATH: str = "/ws"
@@ -82,6 +86,15 @@ class Settings(BaseSettings):
 
     # OpenAI API配置
     OPENAI_API_KEY: str = os.getenv("OPENAI_API_KEY", "")
+    LLM_MAX_CONCURRENCY: int = int(os.getenv("LLM_MAX_CONCURRENCY", "4"))  # 同时进行的LLM请求数量上限
+    LLM_MAX_CONNECTIONS: int = int(os.getenv("LLM_MAX_CONNECTIONS", "10"))  # LLM连接池大小
+    LLM_TIMEOUT: float = float(os.getenv("LLM_TIMEOUT", "60"))  # 单次LLM请求超时时间（秒）
+    LLM_CACHE_TTL: int = int(os.getenv("LLM_CACHE_TTL", "86400"))  # LLM分析结果缓存时间（秒）
+    LLM_CACHE_WINDOW_SECONDS: int = int(os.getenv("LLM_CACHE_WINDOW_SECONDS", "300"))  # 分析时间窗口对齐的粒度（秒）
+    LLM_PROMPT_TOKEN_BUDGET: int = int(os.getenv("LLM_PROMPT_TOKEN_BUDGET", "6000"))  # 提示中UI活动记录部分的token预算
+    WORK_SUMMARY_PERIODS: str = os.getenv("WORK_SUMMARY_PERIODS", "1,4,24")  # 定时生成工作内容总结的时间窗口（小时），逗号分隔，为空时不生成
+    WORK_SUMMARY_CONCURRENCY: int = int(os.getenv("WORK_SUMMARY_CONCURRENCY", "2"))  # 定时生成工作内容总结时并发处理的客户端数量
+    WORK_SUMMARY_RECENT_RECORDS: int = int(os.getenv("WORK_SUMMARY_RECENT_RECORDS", "200"))  # 工作内容分析提示使用的最近UI监控记录数
     
     class Config:
         case_sensitive = True
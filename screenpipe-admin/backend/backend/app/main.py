@@ -8,6 +8,7 @@ from .core.config import settings
 from .db.elasticsearch import init_es, close_es
 from .services.scheduled_tasks import schedule_tasks
 from .services.remote_control_service import remote_control_service
+from .services.llm_client import llm_client
 
 # 配置日志
 logging.basicConfig(
@@ -64,6 +65,9 @@ async def shutdown_event():
     
     await close_es()
 
+    # 关闭LLM连接池
+    await llm_client.close()
+
 @app.get("/")
 async def root():
     return {"message": "Welcome to Time Glass API"}
@@ -1,6 +1,7 @@
 """数据模型包""" 
 from .data import *
 from .app_usage import *
+from .analysis import *
 from .api_models import *
 from .remote_control import *
 from .plugin import *
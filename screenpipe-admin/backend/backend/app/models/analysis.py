@@ -0,0 +1,73 @@
+from sqlalchemy import (
+    BigInteger,
+    Column,
+    DateTime,
+    Index,
+    Integer,
+    String,
+    Text,
+    UniqueConstraint,
+)
+from sqlalchemy.dialects import mysql
+from sqlalchemy.sql import func
+
+from ..db.mysql import Base
+
+
+class LLMResultCache(Base):
+    """LLM分析结果缓存表，相同客户端、时间窗口、提示模板版本和输入数据的分析只调用一次模型"""
+
+    __tablename__ = "llm_result_cache"
+
+    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    cache_key = Column(String(64), nullable=False, unique=True)  # 以下各字段的SHA-256
+    analysis_type = Column(String(50), nullable=False)  # 分析类型，如work_summary、patterns
+    client_id = Column(String(50), nullable=False)
+    window_start = Column(DateTime, nullable=False)  # 对齐后的时间窗口（UTC）
+    window_end = Column(DateTime, nullable=False)
+    prompt_version = Column(String(20), nullable=False)
+    input_hash = Column(String(64), nullable=False)  # 输入记录的SHA-256
+    result = Column(Text().with_variant(mysql.LONGTEXT(), "mysql"), nullable=False)  # JSON
+    created_at = Column(DateTime, server_default=func.now())
+    expires_at = Column(DateTime, nullable=False)
+
+    __table_args__ = (
+        Index(
+            "ix_llm_result_cache_client_type_window",
+            "client_id",
+            "analysis_type",
+            "window_start",
+        ),
+        Index("ix_llm_result_cache_expires_at", "expires_at"),
+        {
+            "mysql_engine": "InnoDB",
+            "mysql_charset": "utf8mb4",
+            "mysql_collate": "utf8mb4_unicode_ci",
+        },
+    )
+
+
+class WorkSummary(Base):
+    """工作内容总结表，保存定时任务预先生成和按需生成的工作内容分析结果"""
+
+    __tablename__ = "work_summaries"
+
+    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    client_id = Column(String(50), nullable=False)
+    hours = Column(Integer, nullable=False)  # 分析的时间窗口长度（小时）
+    window_start = Column(DateTime, nullable=False)  # 分析的时间窗口（UTC）
+    window_end = Column(DateTime, nullable=False)
+    prompt_version = Column(String(20), nullable=False)
+    result = Column(Text().with_variant(mysql.LONGTEXT(), "mysql"), nullable=False)  # JSON
+    created_at = Column(DateTime, server_default=func.now())
+
+    __table_args__ = (
+        UniqueConstraint(
+            "client_id", "hours", "window_end", name="uq_work_summaries_client_hours_end"
+        ),
+        {
+            "mysql_engine": "InnoDB",
+            "mysql_charset": "utf8mb4",
+            "mysql_collate": "utf8mb4_unicode_ci",
+        },
+    )
@@ -65,6 +65,7 @@ class ProductivitySummary(BaseModel):
     # 应用统计
     most_used_app: Optional[str] = None  # 最常用应用
     most_used_app_percentage: Optional[float] = None  # 最常用应用占比
+    switch_count: Optional[int] = None  # 应用切换次数
     
     # 异常信息
     anomaly_count: Optional[int] = None  # 异常行为数量
@@ -104,6 +105,28 @@ class HourlyAppUsageSummary(BaseModel):
     productivity_type: ProductivityTypeEnum
 
 
+# 应用会话响应模型
+class AppSessionResponse(BaseModel):
+    id: int
+    app_name: str
+    window_name: str
+    start_time: datetime  # 北京时间
+    end_time: datetime  # 北京时间
+    duration_seconds: float
+    record_count: int
+
+
+# 星期×小时使用热力图响应模型
+class UsageHeatmapResponse(BaseModel):
+    client_id: str
+    start_date: date
+    end_date: date
+    # 7×24矩阵，行是星期（0为周一），列是小时（北京时间），值为分钟数
+    productive_minutes: List[List[float]]
+    neutral_minutes: List[List[float]]
+    distracting_minutes: List[List[float]]
+
+
 # 插件相关模型
 
 # 插件基础模型
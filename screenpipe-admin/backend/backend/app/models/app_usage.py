@@ -1,6 +1,7 @@
 import enum
 
 from sqlalchemy import (
+    BigInteger,
     Boolean,
     Column,
     Date,
@@ -8,10 +9,13 @@ from sqlalchemy import (
     Enum,
     Float,
     ForeignKey,
+    Index,
     Integer,
     String,
     Text,
+    UniqueConstraint,
 )
+from sqlalchemy.dialects import mysql
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 
@@ -61,8 +65,106 @@ class HourlyAppUsage(Base):
     # 关系
     category = relationship("AppCategory", back_populates="hourly_usages")
 
-    # 唯一约束
+    # 唯一约束，批量写入依赖它执行INSERT ... ON DUPLICATE KEY UPDATE
     __table_args__ = (
+        UniqueConstraint(
+            "user_id", "app_name", "timestamp", name="uq_hourly_app_usage_user_app_ts"
+        ),
+        # 按客户端和时间范围查询的复合索引
+        Index("ix_hourly_app_usage_user_ts_app", "user_id", "timestamp", "app_name"),
+        # 热力图查询的覆盖索引，分组和求和所需的列都在索引中，不必回表
+        Index(
+            "ix_hourly_app_usage_heatmap",
+            "user_id",
+            "timestamp",
+            "day_of_week",
+            "hour_of_day",
+            "app_category_id",
+            "total_time_seconds",
+        ),
+        {
+            "mysql_engine": "InnoDB",
+            "mysql_charset": "utf8mb4",
+            "mysql_collate": "utf8mb4_unicode_ci",
+        },
+    )
+
+
+class DailyAppUsage(Base):
+    """每日应用使用统计表，由小时统计汇总而来，供长时间范围的报表查询"""
+
+    __tablename__ = "daily_app_usage"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    user_id = Column(String(50), nullable=False)
+    usage_date = Column(Date, nullable=False)  # 北京时间的日期
+    app_name = Column(String(100), nullable=False)
+    app_category_id = Column(Integer, ForeignKey("app_categories.id"), nullable=True)
+    total_time_seconds = Column(Float, nullable=False)
+    switch_count = Column(Integer, nullable=False, default=0)
+    created_at = Column(DateTime, server_default=func.now())
+    updated_at = Column(DateTime, server_default=func.now(), onupdate=func.now())
+
+    # 唯一约束，增量汇总依赖它执行INSERT ... ON DUPLICATE KEY UPDATE
+    __table_args__ = (
+        UniqueConstraint(
+            "user_id", "app_name", "usage_date", name="uq_daily_app_usage_user_app_date"
+        ),
+        Index("ix_daily_app_usage_date", "usage_date"),
+        Index("ix_daily_app_usage_user_date", "user_id", "usage_date"),
+        {
+            "mysql_engine": "InnoDB",
+            "mysql_charset": "utf8mb4",
+            "mysql_collate": "utf8mb4_unicode_ci",
+        },
+    )
+
+
+class UsageWatermark(Base):
+    """小时应用使用统计增量计算水位表，记录每个客户端最后处理的UI监控记录"""
+
+    __tablename__ = "usage_watermarks"
+
+    client_id = Column(String(50), primary_key=True)
+    last_timestamp = Column(DateTime, nullable=False)  # 最后处理记录的时间（北京时间）
+    last_sort_timestamp = Column(BigInteger, nullable=False)  # ES排序值（毫秒时间戳）
+    last_monitoring_id = Column(BigInteger, nullable=False)  # ES排序值（时间相同时的排序字段）
+    last_app_name = Column(String(100), nullable=False)
+    updated_at = Column(DateTime, server_default=func.now(), onupdate=func.now())
+
+    __table_args__ = (
+        {
+            "mysql_engine": "InnoDB",
+            "mysql_charset": "utf8mb4",
+            "mysql_collate": "utf8mb4_unicode_ci",
+        },
+    )
+
+
+class AppSession(Base):
+    """应用会话表，每行是客户端连续使用同一应用窗口的一段时间"""
+
+    __tablename__ = "app_sessions"
+
+    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    user_id = Column(String(50), nullable=False)
+    app_name = Column(String(100), nullable=False)
+    window_name = Column(String(255), nullable=False, default="")
+    # 北京时间，保留微秒以便时长与小时统计一致
+    start_time = Column(
+        DateTime().with_variant(mysql.DATETIME(fsp=6), "mysql"), nullable=False
+    )
+    # 切换到下一个应用窗口的时间；最后一个会话尚未结束，为最后一条记录的时间
+    end_time = Column(
+        DateTime().with_variant(mysql.DATETIME(fsp=6), "mysql"), nullable=False
+    )
+    duration_seconds = Column(Float, nullable=False)
+    record_count = Column(Integer, nullable=False)
+    created_at = Column(DateTime, server_default=func.now())
+    updated_at = Column(DateTime, server_default=func.now(), onupdate=func.now())
+
+    __table_args__ = (
+        Index("ix_app_sessions_user_start", "user_id", "start_time"),
         {
             "mysql_engine": "InnoDB",
             "mysql_charset": "utf8mb4",
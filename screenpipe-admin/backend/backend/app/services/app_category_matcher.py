@@ -0,0 +1,214 @@
+import asyncio
+import bisect
+import logging
+import time
+from collections import deque
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..core.config import settings
+from ..models.app_usage import AppCategory
+
+logger = logging.getLogger(__name__)
+
+
+class _CompiledCategories:
+    """
+    编译后的应用类别匹配规则
+
+    匹配顺序与原先的SQL实现一致：
+    1. 名称完全相同（忽略大小写）
+    2. 类别名称包含于应用名称中，或应用名称包含于类别名称中，取ID最小的类别
+    """
+
+    def __init__(self, categories: List[Tuple[int, str]]):
+        # categories按ID升序排列，下标即优先级
+        self.category_ids = [category_id for category_id, _ in categories]
+        names = [name.lower() for _, name in categories]
+
+        # 完全匹配表，同名时保留ID最小的类别
+        self.exact: Dict[str, int] = {}
+        for index, name in enumerate(names):
+            self.exact.setdefault(name, index)
+
+        # 空名称的类别包含于任何应用名称中
+        self.empty_index = next(
+            (index for index, name in enumerate(names) if not name), None
+        )
+
+        # 类别名称 ⊂ 应用名称：Aho-Corasick自动机，一次扫描找出所有出现的类别名称
+        self._build_automaton(names)
+
+        # 应用名称 ⊂ 类别名称：在拼接后的类别名称中查找，按偏移量定位类别
+        self.joined = "\0".join(names)
+        self.offsets = []
+        self.ends = []
+        offset = 0
+        for name in names:
+            self.offsets.append(offset)
+            self.ends.append(offset + len(name))
+            offset += len(name) + 1
+
+    def _build_automaton(self, names: List[str]):
+        self.goto: List[Dict[str, int]] = [{}]
+        self.fail: List[int] = [0]
+        # 每个状态输出的类别中优先级最高（下标最小）的一个
+        self.output: List[Optional[int]] = [None]
+
+        for index, name in enumerate(names):
+            if not name:
+                continue
+            state = 0
+            for char in name:
+                next_state = self.goto[state].get(char)
+                if next_state is None:
+                    next_state = len(self.goto)
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.output.append(None)
+                    self.goto[state][char] = next_state
+                state = next_state
+            if self.output[state] is None or index < self.output[state]:
+                self.output[state] = index
+
+        # 广度优先构建失败指针，并沿失败链合并输出
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self.goto[state].items():
+                queue.append(next_state)
+                fallback = self.fail[state]
+                while fallback and char not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[next_state] = self.goto[fallback].get(char, 0)
+                inherited = self.output[self.fail[next_state]]
+                if inherited is not None and (
+                    self.output[next_state] is None
+                    or inherited < self.output[next_state]
+                ):
+                    self.output[next_state] = inherited
+
+    def match(self, app_name: str) -> Optional[int]:
+        """返回匹配的类别ID，没有匹配时返回None"""
+        if not self.category_ids:
+            return None
+
+        app_name_lower = app_name.lower()
+
+        # 完全匹配
+        index = self.exact.get(app_name_lower)
+        if index is not None:
+            return self.category_ids[index]
+
+        best = self.empty_index
+
+        # 类别名称包含于应用名称中
+        state = 0
+        for char in app_name_lower:
+            while state and char not in self.goto[state]:
+                state = self.fail[state]
+            state = self.goto[state].get(char, 0)
+            found = self.output[state]
+            if found is not None and (best is None or found < best):
+                best = found
+
+        # 应用名称包含于类别名称中
+        if "\0" not in app_name_lower:
+            position = self.joined.find(app_name_lower)
+            while position != -1:
+                found = bisect.bisect_right(self.offsets, position) - 1
+                if best is not None and found >= best:
+                    break
+                # 匹配不能跨越类别名称之间的分隔符
+                if position + len(app_name_lower) <= self.ends[found]:
+                    best = found
+                    break
+                position = self.joined.find(app_name_lower, position + 1)
+
+        return self.category_ids[best] if best is not None else None
+
+
+class AppCategoryMatcher:
+    """
+    应用类别匹配器
+
+    类别规则从数据库加载一次后编译到内存中，匹配结果按应用名称缓存，
+    类别发生增删改时调用invalidate()使缓存失效；多进程部署时另由TTL兜底
+    """
+
+    def __init__(self, ttl_seconds: int, max_cached_apps: int = 10000):
+        self.ttl_seconds = ttl_seconds
+        self.max_cached_apps = max_cached_apps
+        self._compiled: Optional[_CompiledCategories] = None
+        self._loaded_at = 0.0
+        self._generation = 0
+        self._cache: Dict[str, Optional[int]] = {}
+        self._lock = asyncio.Lock()
+
+    def invalidate(self):
+        """使已编译的规则和匹配缓存失效"""
+        self._generation += 1
+        self._compiled = None
+        self._cache.clear()
+
+    async def match(self, db: AsyncSession, app_name: str) -> Optional[int]:
+        """
+        匹配应用类别
+
+        Args:
+            db: 数据库会话，仅在需要加载类别时使用
+            app_name: 应用名称
+
+        Returns:
+            Optional[int]: 类别ID，没有匹配时返回None
+        """
+        compiled = await self._get_compiled(db)
+
+        if app_name in self._cache:
+            return self._cache[app_name]
+
+        category_id = compiled.match(app_name)
+
+        if len(self._cache) >= self.max_cached_apps:
+            self._cache.clear()
+        self._cache[app_name] = category_id
+
+        return category_id
+
+    async def get_by_name(self, db: AsyncSession, name: str) -> Optional[int]:
+        """按名称（忽略大小写）精确查找类别ID，不存在时返回None"""
+        compiled = await self._get_compiled(db)
+        index = compiled.exact.get(name.lower())
+        return compiled.category_ids[index] if index is not None else None
+
+    async def _get_compiled(self, db: AsyncSession) -> _CompiledCategories:
+        if self._compiled is not None and (
+            time.monotonic() - self._loaded_at < self.ttl_seconds
+        ):
+            return self._compiled
+
+        async with self._lock:
+            if self._compiled is not None and (
+                time.monotonic() - self._loaded_at < self.ttl_seconds
+            ):
+                return self._compiled
+
+            generation = self._generation
+            result = await db.execute(
+                select(AppCategory.id, AppCategory.name).order_by(AppCategory.id)
+            )
+            compiled = _CompiledCategories([(row.id, row.name) for row in result])
+
+            # 加载期间类别被修改时，不保存本次加载的结果
+            if generation == self._generation:
+                self._compiled = compiled
+                self._loaded_at = time.monotonic()
+                self._cache.clear()
+                logger.info(f"已加载 {len(compiled.category_ids)} 个应用类别匹配规则")
+
+            return compiled
+
+
+app_category_matcher = AppCategoryMatcher(ttl_seconds=settings.APP_CATEGORY_CACHE_TTL)
@@ -1,17 +1,34 @@
+import asyncio
 import logging
 from datetime import date, datetime, timedelta, time
 from typing import Any, Dict, List, Optional, Tuple
 
 from elasticsearch import AsyncElasticsearch
-from sqlalchemy import and_, asc, desc, func, or_, select
+from sqlalchemy import and_, asc, case, delete, desc, func, or_, select, update
+from sqlalchemy.dialects.mysql import insert as mysql_insert
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
 from ..core.config import settings
-from ..models.app_usage import AppCategory, HourlyAppUsage, ProductivityType
+from ..db.mysql import AsyncSessionLocal
+from ..models.app_usage import (
+    AppCategory,
+    AppSession,
+    DailyAppUsage,
+    HourlyAppUsage,
+    ProductivityType,
+)
+from .app_category_matcher import app_category_matcher
+from .usage_query_cache import usage_query_cache
 
 logger = logging.getLogger(__name__)
 
+# 批量写入时每条INSERT语句包含的最大行数
+BULK_UPSERT_CHUNK_SIZE = 1000
+
+# 每日应用使用统计中排名之外的应用合并后的名称
+OTHER_APP_NAME = "其他"
+
 
 class AppUsageService:
     def __init__(
@@ -40,6 +57,10 @@ class AppUsageService:
         await self.db.commit()
         await self.db.refresh(new_category)
 
+        # 类别变化后使匹配缓存失效
+        app_category_matcher.invalidate()
+        usage_query_cache.invalidate()
+
         return new_category
 
     async def get_app_categories(
@@ -105,6 +126,10 @@ class AppUsageService:
         await self.db.commit()
         await self.db.refresh(category)
 
+        # 类别变化后使匹配缓存失效
+        app_category_matcher.invalidate()
+        usage_query_cache.invalidate()
+
         return category
 
     async def delete_app_category(self, category_id: int) -> bool:
@@ -130,6 +155,10 @@ class AppUsageService:
         await self.db.delete(category)
         await self.db.commit()
 
+        # 类别变化后使匹配缓存失效
+        app_category_matcher.invalidate()
+        usage_query_cache.invalidate()
+
         return True
 
     # 小时应用使用统计相关方法
@@ -188,24 +217,28 @@ class AppUsageService:
         # 转换为秒
         total_time_seconds = duration_minutes * 60
 
-        # 检查是否已存在相同记录
+        # 检查是否已存在相同记录（同一客户端、同一应用、同一小时）
         stmt = select(HourlyAppUsage).where(
             and_(
+                HourlyAppUsage.user_id == client_id,
                 HourlyAppUsage.app_name == app_name,
-                HourlyAppUsage.app_category_id == category_id,
                 HourlyAppUsage.timestamp == timestamp,
-                HourlyAppUsage.hour_of_day == hour,
             )
         )
         result = await self.db.execute(stmt)
         existing = result.scalars().first()
 
         if existing:
-            # 更新现有记录 - 累加而非覆盖
+            # 更新现有记录 - 累加而非覆盖，增量计算依赖这一行为
             existing.total_time_seconds += total_time_seconds
+            existing.app_category_id = category_id
             # 更新最后修改时间
             existing.updated_at = datetime.utcnow()
+            await self._accumulate_daily_app_usage(
+                [self._daily_delta(existing, total_time_seconds)]
+            )
             await self.db.commit()
+            usage_query_cache.invalidate(client_id)
             await self.db.refresh(existing)
             return existing
 
@@ -222,33 +255,354 @@ class AppUsageService:
         )
 
         self.db.add(new_usage)
+        await self._accumulate_daily_app_usage(
+            [self._daily_delta(new_usage, total_time_seconds)]
+        )
         await self.db.commit()
+        usage_query_cache.invalidate(client_id)
         await self.db.refresh(new_usage)
         
         return new_usage
 
     async def batch_record_hourly_app_usage(
-        self, usage_records: List[Dict[str, Any]]
-    ) -> List[HourlyAppUsage]:
-        """批量记录应用使用时间"""
-        results = []
+        self, usage_records: List[Dict[str, Any]], commit: bool = True
+    ) -> int:
+        """
+        批量记录应用使用时间
+
+        依赖(user_id, app_name, timestamp)唯一键，每批数据使用一条多行
+        INSERT ... ON DUPLICATE KEY UPDATE写入，已存在的小时记录累加使用时间
+
+        Args:
+            usage_records: 应用使用记录列表
+            commit: 是否提交事务，为False时由调用方统一提交，并在提交后使查询缓存失效
 
+        Returns:
+            int: 写入的记录数
+        """
+        if not usage_records:
+            return 0
+
+        now = datetime.utcnow()
+        rows = []
         for record in usage_records:
-            try:
-                usage = await self.record_hourly_app_usage(
-                    app_name=record["app_name"],
-                    category_id=record["category_id"],
-                    usage_date=record["usage_date"],
-                    hour=record["hour"],
-                    duration_minutes=record["duration_minutes"],
-                    client_id=record["client_id"],
+            # 创建时间戳
+            timestamp = datetime.combine(record["usage_date"], time(hour=record["hour"]))
+            day_of_week = timestamp.weekday()
+
+            rows.append(
+                {
+                    "user_id": record["client_id"],
+                    "app_name": record["app_name"],
+                    "app_category_id": record["category_id"],
+                    "timestamp": timestamp,  # 北京时间的小时时间戳
+                    "hour_of_day": record["hour"],
+                    "day_of_week": day_of_week,
+                    "is_working_hour": 9 <= record["hour"] < 18 and day_of_week < 5,  # 工作日9点到18点
+                    "total_time_seconds": record["duration_minutes"] * 60,
+                    "switch_count": record.get("switch_count", 0),
+                    "updated_at": now,
+                }
+            )
+
+        try:
+            for i in range(0, len(rows), BULK_UPSERT_CHUNK_SIZE):
+                stmt = mysql_insert(HourlyAppUsage).values(
+                    rows[i : i + BULK_UPSERT_CHUNK_SIZE]
+                )
+                # 已存在的记录累加而非覆盖，增量计算依赖这一行为
+                stmt = stmt.on_duplicate_key_update(
+                    total_time_seconds=HourlyAppUsage.total_time_seconds
+                    + stmt.inserted.total_time_seconds,
+                    switch_count=func.coalesce(HourlyAppUsage.switch_count, 0)
+                    + stmt.inserted.switch_count,
+                    app_category_id=stmt.inserted.app_category_id,
+                    updated_at=stmt.inserted.updated_at,
+                )
+                await self.db.execute(stmt)
+
+            # 同一事务中把增量累加到每日汇总
+            await self._accumulate_daily_app_usage(rows)
+
+            if commit:
+                await self.db.commit()
+                for client_id in {row["user_id"] for row in rows}:
+                    usage_query_cache.invalidate(client_id)
+        except Exception as e:
+            logger.error(f"批量记录应用使用时间失败: {str(e)}")
+            await self.db.rollback()
+            raise
+
+        return len(rows)
+
+    @staticmethod
+    def _daily_delta(usage: HourlyAppUsage, total_time_seconds: float) -> Dict[str, Any]:
+        """单条小时统计变化对应的每日汇总增量"""
+        return {
+            "user_id": usage.user_id,
+            "app_name": usage.app_name,
+            "app_category_id": usage.app_category_id,
+            "timestamp": usage.timestamp,
+            "total_time_seconds": total_time_seconds,
+            "switch_count": 0,
+            "updated_at": datetime.utcnow(),
+        }
+
+    async def _accumulate_daily_app_usage(self, hourly_rows: List[Dict[str, Any]]):
+        """
+        将小时统计的增量累加到每日汇总，由调用方提交事务
+
+        Args:
+            hourly_rows: 小时统计的增量行，与写入hourly_app_usage的行格式相同
+        """
+        # 先在内存中按(客户端, 应用, 日期)合并，每个汇总行只写一次
+        daily_rows: Dict[Tuple[str, str, date], Dict[str, Any]] = {}
+        for row in hourly_rows:
+            key = (row["user_id"], row["app_name"], row["timestamp"].date())
+            daily = daily_rows.get(key)
+            if daily is None:
+                daily_rows[key] = {
+                    "user_id": row["user_id"],
+                    "usage_date": key[2],
+                    "app_name": row["app_name"],
+                    "app_category_id": row["app_category_id"],
+                    "total_time_seconds": row["total_time_seconds"],
+                    "switch_count": row["switch_count"] or 0,
+                    "updated_at": row["updated_at"],
+                }
+            else:
+                daily["total_time_seconds"] += row["total_time_seconds"]
+                daily["switch_count"] += row["switch_count"] or 0
+                daily["app_category_id"] = row["app_category_id"]
+
+        rows = list(daily_rows.values())
+        for i in range(0, len(rows), BULK_UPSERT_CHUNK_SIZE):
+            stmt = mysql_insert(DailyAppUsage).values(rows[i : i + BULK_UPSERT_CHUNK_SIZE])
+            stmt = stmt.on_duplicate_key_update(
+                total_time_seconds=DailyAppUsage.total_time_seconds
+                + stmt.inserted.total_time_seconds,
+                switch_count=DailyAppUsage.switch_count + stmt.inserted.switch_count,
+                app_category_id=stmt.inserted.app_category_id,
+                updated_at=stmt.inserted.updated_at,
+            )
+            await self.db.execute(stmt)
+
+    async def refresh_daily_app_usage(
+        self, client_id: str, start_date: date, end_date: date, commit: bool = True
+    ):
+        """
+        根据小时统计重新生成客户端在日期范围内的每日汇总
+
+        小时统计被删除后无法按增量维护，需要整天重新汇总
+
+        Args:
+            client_id: 客户端ID
+            start_date: 开始日期（北京时间）
+            end_date: 结束日期（北京时间，包含）
+            commit: 是否提交事务，为False时由调用方统一提交
+        """
+        try:
+            await self.db.execute(
+                delete(DailyAppUsage).where(
+                    DailyAppUsage.user_id == client_id,
+                    DailyAppUsage.usage_date >= start_date,
+                    DailyAppUsage.usage_date <= end_date,
                 )
-                results.append(usage)
-            except Exception as e:
-                # 记录错误但继续处理其他记录
-                print(f"记录应用使用时间失败: {str(e)}")
+            )
+
+            usage_date = func.date(HourlyAppUsage.timestamp)
+            summary = (
+                select(
+                    HourlyAppUsage.user_id,
+                    usage_date,
+                    HourlyAppUsage.app_name,
+                    func.max(HourlyAppUsage.app_category_id),
+                    func.sum(HourlyAppUsage.total_time_seconds),
+                    func.sum(func.coalesce(HourlyAppUsage.switch_count, 0)),
+                )
+                .where(
+                    HourlyAppUsage.user_id == client_id,
+                    HourlyAppUsage.timestamp >= datetime.combine(start_date, time.min),
+                    HourlyAppUsage.timestamp
+                    < datetime.combine(end_date + timedelta(days=1), time.min),
+                )
+                .group_by(HourlyAppUsage.user_id, usage_date, HourlyAppUsage.app_name)
+            )
+            await self.db.execute(
+                DailyAppUsage.__table__.insert().from_select(
+                    [
+                        "user_id",
+                        "usage_date",
+                        "app_name",
+                        "app_category_id",
+                        "total_time_seconds",
+                        "switch_count",
+                    ],
+                    summary,
+                )
+            )
 
-        return results
+            if commit:
+                await self.db.commit()
+        except Exception as e:
+            logger.error(f"重新生成每日应用使用汇总失败: {str(e)}")
+            await self.db.rollback()
+            raise
+
+    @staticmethod
+    def _hourly_range(
+        start_date: date, end_date: date, user_id: Optional[str] = None
+    ) -> List[Any]:
+        """
+        小时统计的日期范围条件
+
+        使用左闭右开的时间范围而不是对timestamp调用DATE()，
+        查询可以使用(user_id, timestamp, app_name)和timestamp索引
+
+        Args:
+            start_date: 开始日期（北京时间）
+            end_date: 结束日期（北京时间，包含）
+            user_id: 客户端ID，为None时不限制客户端
+        """
+        conditions = [
+            HourlyAppUsage.timestamp >= datetime.combine(start_date, time.min),
+            HourlyAppUsage.timestamp
+            < datetime.combine(end_date + timedelta(days=1), time.min),
+        ]
+        if user_id:
+            conditions.insert(0, HourlyAppUsage.user_id == user_id)
+        return conditions
+
+    def _usage_source(
+        self, start_date: date, end_date: date, user_id: Optional[str] = None
+    ):
+        """
+        选择统计查询读取的表
+
+        日期范围超过DAILY_ROLLUP_THRESHOLD_DAYS天时读取每日汇总表，否则读取小时统计表。
+        两张表都有app_name、app_category_id和total_time_seconds列
+
+        Returns:
+            Tuple: (表模型, 日期范围条件, 北京时间日期表达式)
+        """
+        if (end_date - start_date).days + 1 > settings.DAILY_ROLLUP_THRESHOLD_DAYS:
+            conditions = [
+                DailyAppUsage.usage_date >= start_date,
+                DailyAppUsage.usage_date <= end_date,
+            ]
+            if user_id:
+                conditions.insert(0, DailyAppUsage.user_id == user_id)
+            return DailyAppUsage, and_(*conditions), DailyAppUsage.usage_date
+
+        return (
+            HourlyAppUsage,
+            and_(*self._hourly_range(start_date, end_date, user_id)),
+            func.date(HourlyAppUsage.timestamp),
+        )
+
+    async def save_app_sessions(
+        self, client_id: str, sessions: List[Dict[str, Any]], commit: bool = True
+    ) -> int:
+        """
+        保存应用会话
+
+        带id的会话是已存在的未结束会话，更新其结束时间和时长；其余会话批量插入
+
+        Args:
+            client_id: 客户端ID
+            sessions: 会话列表，包含app_name、window_name、start_time、end_time和record_count
+            commit: 是否提交事务，为False时由调用方统一提交
+
+        Returns:
+            int: 写入的会话数
+        """
+        if not sessions:
+            return 0
+
+        now = datetime.utcnow()
+        rows = []
+        try:
+            for session in sessions:
+                values = {
+                    "user_id": client_id,
+                    "app_name": session["app_name"],
+                    "window_name": session["window_name"],
+                    "start_time": session["start_time"],
+                    "end_time": session["end_time"],
+                    "duration_seconds": (
+                        session["end_time"] - session["start_time"]
+                    ).total_seconds(),
+                    "record_count": session["record_count"],
+                    "updated_at": now,
+                }
+
+                if session.get("id"):
+                    await self.db.execute(
+                        update(AppSession)
+                        .where(AppSession.id == session["id"])
+                        .values(**values)
+                    )
+                else:
+                    rows.append(values)
+
+            for i in range(0, len(rows), BULK_UPSERT_CHUNK_SIZE):
+                await self.db.execute(
+                    mysql_insert(AppSession).values(rows[i : i + BULK_UPSERT_CHUNK_SIZE])
+                )
+
+            if commit:
+                await self.db.commit()
+        except Exception as e:
+            logger.error(f"保存应用会话失败: {str(e)}")
+            await self.db.rollback()
+            raise
+
+        return len(sessions)
+
+    async def get_app_sessions(
+        self,
+        client_id: str,
+        start_time: datetime,
+        end_time: datetime,
+        app_name: Optional[str] = None,
+        skip: int = 0,
+        limit: int = 100,
+    ) -> Tuple[List[AppSession], int]:
+        """
+        获取与时间范围有重叠的应用会话
+
+        Args:
+            client_id: 客户端ID
+            start_time: 开始时间（北京时间）
+            end_time: 结束时间（北京时间）
+            app_name: 应用名称，可选
+            skip: 跳过的记录数
+            limit: 返回的最大记录数
+
+        Returns:
+            Tuple[List[AppSession], int]: 按开始时间升序的会话列表和总数
+        """
+        conditions = [
+            AppSession.user_id == client_id,
+            AppSession.start_time < end_time,
+            AppSession.end_time >= start_time,
+        ]
+        if app_name:
+            conditions.append(AppSession.app_name == app_name)
+
+        query = (
+            select(AppSession)
+            .where(and_(*conditions))
+            .order_by(AppSession.start_time)
+            .offset(skip)
+            .limit(limit)
+        )
+        count_query = select(func.count()).select_from(AppSession).where(and_(*conditions))
+
+        result = await self.db.execute(query)
+        count_result = await self.db.execute(count_query)
+
+        return result.scalars().all(), count_result.scalar()
 
     async def get_hourly_app_usage(
         self,
@@ -258,30 +612,15 @@ class AppUsageService:
         category_id: Optional[int] = None,
         skip: int = 0,
         limit: int = 100,
+        user_id: Optional[str] = None,
     ) -> Tuple[List[HourlyAppUsage], int]:
         """获取应用使用时间记录"""
-        # 转换日期为datetime
-        start_datetime = datetime.combine(start_date, time.min)
-        end_datetime = datetime.combine(end_date, time.max)
-        
+        in_range = and_(*self._hourly_range(start_date, end_date, user_id))
+
         # 构建基本查询
-        query = select(HourlyAppUsage).where(
-            and_(
-                HourlyAppUsage.timestamp >= start_datetime,
-                HourlyAppUsage.timestamp <= end_datetime,
-            )
-        )
+        query = select(HourlyAppUsage).where(in_range)
 
-        count_query = (
-            select(func.count())
-            .select_from(HourlyAppUsage)
-            .where(
-                and_(
-                    HourlyAppUsage.timestamp >= start_datetime,
-                    HourlyAppUsage.timestamp <= end_datetime,
-                )
-            )
-        )
+        count_query = select(func.count()).select_from(HourlyAppUsage).where(in_range)
 
         # 添加筛选条件
         if app_name:
@@ -305,25 +644,18 @@ class AppUsageService:
         return usage_records, total
 
     async def get_productivity_summary(
-        self, start_date: date, end_date: date
+        self, start_date: date, end_date: date, user_id: Optional[str] = None
     ) -> Tuple[float, float, float]:
         """获取生产力统计摘要"""
-        # 转换日期为datetime
-        start_datetime = datetime.combine(start_date, time.min)
-        end_datetime = datetime.combine(end_date, time.max)
-        
+        usage, in_range, _ = self._usage_source(start_date, end_date, user_id)
+
         # 查询各生产力类型的总使用时间
         query = (
             select(
-                AppCategory.productivity_type, func.sum(HourlyAppUsage.total_time_seconds / 60)
-            )
-            .join(AppCategory, HourlyAppUsage.app_category_id == AppCategory.id)
-            .where(
-                and_(
-                    HourlyAppUsage.timestamp >= start_datetime,
-                    HourlyAppUsage.timestamp <= end_datetime,
-                )
+                AppCategory.productivity_type, func.sum(usage.total_time_seconds / 60)
             )
+            .join(AppCategory, usage.app_category_id == AppCategory.id)
+            .where(in_range)
             .group_by(AppCategory.productivity_type)
         )
 
@@ -347,41 +679,178 @@ class AppUsageService:
 
         return productive_minutes, neutral_minutes, distracting_minutes
 
+    async def get_switch_count(
+        self,
+        start_time: datetime,
+        end_time: datetime,
+        user_id: Optional[str] = None,
+    ) -> Tuple[int, Dict[str, int]]:
+        """
+        获取时间范围内的应用切换次数，读取小时统计中预先计算的切换次数
+
+        Args:
+            start_time: 开始时间（北京时间），包含该时间所在的小时
+            end_time: 结束时间（北京时间）
+            user_id: 客户端ID，为None时统计所有客户端
+
+        Returns:
+            Tuple[int, Dict[str, int]]: (切换次数, 每个应用的切入和切出次数)。
+                每次切换在切出和切入的应用上各计一次，切换次数取两者之和的一半
+        """
+        conditions = [
+            HourlyAppUsage.timestamp >= start_time.replace(minute=0, second=0, microsecond=0),
+            HourlyAppUsage.timestamp <= end_time,
+        ]
+        if user_id:
+            conditions.append(HourlyAppUsage.user_id == user_id)
+
+        query = (
+            select(
+                HourlyAppUsage.app_name,
+                func.sum(func.coalesce(HourlyAppUsage.switch_count, 0)).label("switch_count"),
+            )
+            .where(and_(*conditions))
+            .group_by(HourlyAppUsage.app_name)
+        )
+
+        result = await self.db.execute(query)
+
+        app_switches = {
+            row.app_name: int(row.switch_count) for row in result if row.switch_count
+        }
+        return sum(app_switches.values()) // 2, app_switches
+
+    @staticmethod
+    async def get_productivity_dashboard(
+        start_date: date, end_date: date, user_id: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        获取生产力面板所需的统计数据
+
+        当前时间段和前一天的生产力统计、最常用应用以及应用切换次数互不依赖，
+        各自使用独立的数据库会话并发查询。结果按客户端缓存，小时统计写入后失效
+
+        Args:
+            start_date: 开始日期（北京时间）
+            end_date: 结束日期（北京时间，包含）
+            user_id: 客户端ID，为None时统计所有客户端
+
+        Returns:
+            Dict[str, Any]: current和previous为(高效, 中性, 干扰)分钟数，
+                most_used_app为最常用应用，switch_count为应用切换次数
+        """
+
+        async def run(query):
+            async with AsyncSessionLocal() as db:
+                return await query(AppUsageService(db))
+
+        async def load():
+            current, previous, most_used_app, (switch_count, _) = await asyncio.gather(
+                run(lambda s: s.get_productivity_summary(start_date, end_date, user_id)),
+                run(
+                    lambda s: s.get_productivity_summary(
+                        start_date - timedelta(days=1),
+                        end_date - timedelta(days=1),
+                        user_id,
+                    )
+                ),
+                run(lambda s: s.get_most_used_app(start_date, end_date, user_id)),
+                run(
+                    lambda s: s.get_switch_count(
+                        datetime.combine(start_date, time.min),
+                        datetime.combine(end_date, time.max),
+                        user_id,
+                    )
+                ),
+            )
+            return {
+                "current": current,
+                "previous": previous,
+                "most_used_app": most_used_app,
+                "switch_count": switch_count,
+            }
+
+        return await usage_query_cache.get_or_load(
+            user_id, ("productivity_dashboard", start_date, end_date), load
+        )
+
     async def get_daily_app_usage(
-        self, start_date: date, end_date: date
+        self,
+        start_date: date,
+        end_date: date,
+        user_id: Optional[str] = None,
+        top_n: Optional[int] = None,
     ) -> List[Dict[str, Any]]:
-        """获取每日应用使用时间统计"""
-        # 转换日期为datetime
-        start_datetime = datetime.combine(start_date, time.min)
-        end_datetime = datetime.combine(end_date, time.max)
-        
+        """
+        获取每日应用使用时间统计
+
+        指定top_n时在数据库中用ROW_NUMBER()按天排名，每天只返回使用时间最长的top_n个应用，
+        其余应用合并为一条名为“其他”的记录，其类别字段为None
+        """
+        usage, in_range, usage_date = self._usage_source(start_date, end_date, user_id)
+
         # 查询每日应用使用时间
         query = (
             select(
-                func.date(HourlyAppUsage.timestamp).label("usage_date"),
-                HourlyAppUsage.app_name,
-                HourlyAppUsage.app_category_id,
+                usage_date.label("usage_date"),
+                usage.app_name,
+                usage.app_category_id,
                 AppCategory.name.label("category_name"),
                 AppCategory.productivity_type,
-                func.sum(HourlyAppUsage.total_time_seconds / 60).label("total_minutes"),
-            )
-            .join(AppCategory, HourlyAppUsage.app_category_id == AppCategory.id)
-            .where(
-                and_(
-                    HourlyAppUsage.timestamp >= start_datetime,
-                    HourlyAppUsage.timestamp <= end_datetime,
-                )
+                func.sum(usage.total_time_seconds / 60).label("total_minutes"),
             )
+            .join(AppCategory, usage.app_category_id == AppCategory.id)
+            .where(in_range)
             .group_by(
-                func.date(HourlyAppUsage.timestamp),
-                HourlyAppUsage.app_name,
-                HourlyAppUsage.app_category_id,
+                usage_date,
+                usage.app_name,
+                usage.app_category_id,
                 AppCategory.name,
                 AppCategory.productivity_type,
             )
-            .order_by(func.date(HourlyAppUsage.timestamp), desc("total_minutes"))
+            .order_by(usage_date, desc("total_minutes"))
         )
 
+        if top_n:
+            ranked = (
+                query.add_columns(
+                    func.row_number()
+                    .over(
+                        partition_by=usage_date,
+                        order_by=(
+                            desc(func.sum(usage.total_time_seconds)),
+                            usage.app_name,
+                        ),
+                    )
+                    .label("app_rank")
+                )
+                .order_by(None)
+                .subquery()
+            )
+            # 排名在top_n之后的应用归入同一个分组
+            in_top = ranked.c.app_rank <= top_n
+            bucket = case((in_top, ranked.c.app_rank), else_=top_n + 1)
+            query = (
+                select(
+                    ranked.c.usage_date,
+                    func.max(case((in_top, ranked.c.app_name), else_=OTHER_APP_NAME)).label(
+                        "app_name"
+                    ),
+                    func.max(case((in_top, ranked.c.app_category_id))).label(
+                        "app_category_id"
+                    ),
+                    func.max(case((in_top, ranked.c.category_name))).label(
+                        "category_name"
+                    ),
+                    func.max(case((in_top, ranked.c.productivity_type))).label(
+                        "productivity_type"
+                    ),
+                    func.sum(ranked.c.total_minutes).label("total_minutes"),
+                )
+                .group_by(ranked.c.usage_date, bucket)
+                .order_by(ranked.c.usage_date, bucket)
+            )
+
         result = await self.db.execute(query)
 
         # 处理查询结果
@@ -401,7 +870,9 @@ class AppUsageService:
         return daily_usage
 
 
-    async def get_hourly_app_usage_summary(self, date: date) -> List[Dict[str, Any]]:
+    async def get_hourly_app_usage_summary(
+        self, date: date, user_id: Optional[str] = None
+    ) -> List[Dict[str, Any]]:
         """获取按应用分组的每小时使用统计"""
         # 查询指定日期的应用使用记录，按应用名称和小时分组
         query = select(
@@ -414,7 +885,7 @@ class AppUsageService:
             HourlyAppUsage.app_category_id == AppCategory.id, 
             isouter=True
         ).where(
-            func.date(HourlyAppUsage.timestamp) == date
+            *self._hourly_range(date, date, user_id)
         ).group_by(
             HourlyAppUsage.hour_of_day,
             HourlyAppUsage.app_name,
@@ -445,25 +916,80 @@ class AppUsageService:
         
         return result_list
         
-    async def get_most_used_app(self, start_date: date, end_date: date) -> Optional[Dict[str, Any]]:
+    async def get_usage_heatmap(
+        self, start_date: date, end_date: date, user_id: Optional[str] = None
+    ) -> Dict[ProductivityType, List[List[float]]]:
+        """
+        获取星期×小时的使用时间热力图
+
+        在(user_id, timestamp, day_of_week, hour_of_day, app_category_id, total_time_seconds)
+        覆盖索引上按星期、小时和类别分组求和，再关联类别得到生产力类型。结果按客户端缓存，
+        小时统计写入后失效
+
+        Args:
+            start_date: 开始日期（北京时间）
+            end_date: 结束日期（北京时间，包含）
+            user_id: 客户端ID，为None时统计所有客户端
+
+        Returns:
+            Dict[ProductivityType, List[List[float]]]: 每种生产力类型的7×24分钟数矩阵，
+                行是星期（0为周一），列是小时
+        """
+
+        async def load():
+            grouped = (
+                select(
+                    HourlyAppUsage.day_of_week,
+                    HourlyAppUsage.hour_of_day,
+                    HourlyAppUsage.app_category_id,
+                    func.sum(HourlyAppUsage.total_time_seconds).label("total_seconds"),
+                )
+                .where(*self._hourly_range(start_date, end_date, user_id))
+                .group_by(
+                    HourlyAppUsage.day_of_week,
+                    HourlyAppUsage.hour_of_day,
+                    HourlyAppUsage.app_category_id,
+                )
+                .subquery()
+            )
+            query = select(
+                grouped.c.day_of_week,
+                grouped.c.hour_of_day,
+                AppCategory.productivity_type,
+                grouped.c.total_seconds,
+            ).outerjoin(AppCategory, grouped.c.app_category_id == AppCategory.id)
+
+            result = await self.db.execute(query)
+
+            heatmap = {
+                productivity_type: [[0.0] * 24 for _ in range(7)]
+                for productivity_type in ProductivityType
+            }
+            for day_of_week, hour, productivity_type, total_seconds in result:
+                # 没有类别的应用按中性统计
+                matrix = heatmap[productivity_type or ProductivityType.NEUTRAL]
+                matrix[day_of_week][hour] += total_seconds / 60
+
+            return heatmap
+
+        return await usage_query_cache.get_or_load(
+            user_id, ("usage_heatmap", start_date, end_date), load
+        )
+
+    async def get_most_used_app(
+        self, start_date: date, end_date: date, user_id: Optional[str] = None
+    ) -> Optional[Dict[str, Any]]:
         """获取指定日期范围内使用时间最长的应用"""
-        # 转换日期为datetime
-        start_datetime = datetime.combine(start_date, time.min)
-        end_datetime = datetime.combine(end_date, time.max)
-        
+        usage, in_range, _ = self._usage_source(start_date, end_date, user_id)
+
         # 查询使用时间最长的应用
         query = (
             select(
-                HourlyAppUsage.app_name,
-                func.sum(HourlyAppUsage.total_time_seconds / 60).label("total_minutes"),
-            )
-            .where(
-                and_(
-                    HourlyAppUsage.timestamp >= start_datetime,
-                    HourlyAppUsage.timestamp <= end_datetime,
-                )
+                usage.app_name,
+                func.sum(usage.total_time_seconds / 60).label("total_minutes"),
             )
-            .group_by(HourlyAppUsage.app_name)
+            .where(in_range)
+            .group_by(usage.app_name)
             .order_by(desc("total_minutes"))
             .limit(1)
         )
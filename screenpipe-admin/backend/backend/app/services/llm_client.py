@@ -0,0 +1,97 @@
+import asyncio
+import logging
+from typing import Any, Dict, Optional
+
+import httpx
+
+from ..core.config import settings
+
+# 导入OpenAI库，用于大模型分析
+try:
+    from openai import AsyncOpenAI
+    OPENAI_AVAILABLE = True
+except ImportError:
+    OPENAI_AVAILABLE = False
+    logging.warning("OpenAI库未安装，将无法进行大模型分析")
+
+logger = logging.getLogger(__name__)
+
+LLM_BASE_URL = "https://openrouter.ai/api/v1"
+
+
+class LLMClient:
+    """
+    进程内共享的异步LLM客户端
+
+    所有服务共用一个HTTP连接池，每个API密钥对应一个AsyncOpenAI客户端；
+    请求数量受全局并发上限限制，每次请求有独立的超时时间，等待期间不阻塞事件循环
+    """
+
+    def __init__(self, max_concurrency: int, max_connections: int, timeout: float):
+        self.max_concurrency = max_concurrency
+        self.max_connections = max_connections
+        self.timeout = timeout
+        self._http_client: Optional[httpx.AsyncClient] = None
+        self._clients: Dict[str, "AsyncOpenAI"] = {}
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+
+    def get(self, api_key: str) -> "AsyncOpenAI":
+        """
+        获取API密钥对应的客户端，不存在时创建
+
+        Args:
+            api_key: API密钥
+
+        Returns:
+            AsyncOpenAI: 共享连接池的异步客户端
+        """
+        client = self._clients.get(api_key)
+        if client is None:
+            if self._http_client is None:
+                self._http_client = httpx.AsyncClient(
+                    limits=httpx.Limits(
+                        max_connections=self.max_connections,
+                        max_keepalive_connections=self.max_connections,
+                    ),
+                    timeout=self.timeout,
+                )
+            client = AsyncOpenAI(
+                api_key=api_key,
+                base_url=LLM_BASE_URL,
+                http_client=self._http_client,
+                timeout=self.timeout,
+            )
+            self._clients[api_key] = client
+        return client
+
+    async def chat_completion(self, client: "AsyncOpenAI", **kwargs) -> Any:
+        """
+        调用chat.completions.create
+
+        超过并发上限时排队等待；超时抛出asyncio.TimeoutError
+
+        Args:
+            client: get()返回的客户端
+            **kwargs: chat.completions.create的参数
+
+        Returns:
+            Any: 模型响应
+        """
+        async with self._semaphore:
+            return await asyncio.wait_for(
+                client.chat.completions.create(**kwargs), timeout=self.timeout
+            )
+
+    async def close(self):
+        """关闭连接池"""
+        if self._http_client is not None:
+            await self._http_client.aclose()
+            self._http_client = None
+        self._clients.clear()
+
+
+llm_client = LLMClient(
+    max_concurrency=settings.LLM_MAX_CONCURRENCY,
+    max_connections=settings.LLM_MAX_CONNECTIONS,
+    timeout=settings.LLM_TIMEOUT,
+)
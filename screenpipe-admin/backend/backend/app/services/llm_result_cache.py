@@ -0,0 +1,219 @@
+import hashlib
+import json
+import logging
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Optional, Tuple
+
+from sqlalchemy import delete, select
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..core.config import settings
+from ..models.analysis import LLMResultCache
+
+logger = logging.getLogger(__name__)
+
+
+def snap_window(
+    end_time: datetime, duration: timedelta, granularity: Optional[int] = None
+) -> Tuple[datetime, datetime]:
+    """
+    将以end_time结束的时间窗口对齐到固定粒度，粒度内的重复请求得到相同的窗口
+
+    Args:
+        end_time: 窗口结束时间
+        duration: 窗口长度
+        granularity: 对齐粒度（秒），默认为LLM_CACHE_WINDOW_SECONDS
+
+    Returns:
+        Tuple[datetime, datetime]: (开始时间, 结束时间)
+    """
+    granularity = granularity or settings.LLM_CACHE_WINDOW_SECONDS
+    seconds = int((end_time - datetime(1970, 1, 1)).total_seconds())
+    window_end = datetime(1970, 1, 1) + timedelta(seconds=seconds - seconds % granularity)
+    return window_end - duration, window_end
+
+
+def fingerprint(*inputs: Any) -> str:
+    """计算输入数据的SHA-256，无法直接序列化为JSON的值按字符串处理"""
+    payload = json.dumps(inputs, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class LLMResultCacheService:
+    """
+    LLM分析结果缓存服务
+
+    缓存键由分析类型、客户端ID、对齐后的时间窗口、提示模板版本和输入数据的哈希组成，
+    输入数据或提示模板变化时自然得到新的键。条目到期后不再返回，并由定时任务清理
+    """
+
+    def __init__(self, db: AsyncSession):
+        self.db = db
+
+    @staticmethod
+    def make_key(
+        analysis_type: str,
+        client_id: str,
+        window_start: datetime,
+        window_end: datetime,
+        prompt_version: str,
+        input_hash: str,
+    ) -> str:
+        return fingerprint(
+            analysis_type, client_id, window_start, window_end, prompt_version, input_hash
+        )
+
+    async def get(self, cache_key: str) -> Optional[Any]:
+        """
+        读取未过期的缓存结果
+
+        Args:
+            cache_key: make_key()生成的缓存键
+
+        Returns:
+            Optional[Any]: 缓存的结果，不存在或已过期时返回None
+        """
+        result = await self.db.execute(
+            select(LLMResultCache.result).where(
+                LLMResultCache.cache_key == cache_key,
+                LLMResultCache.expires_at > datetime.utcnow(),
+            )
+        )
+        cached = result.scalar()
+        return json.loads(cached) if cached is not None else None
+
+    async def set(
+        self,
+        analysis_type: str,
+        client_id: str,
+        window_start: datetime,
+        window_end: datetime,
+        prompt_version: str,
+        input_hash: str,
+        value: Any,
+        ttl_seconds: Optional[int] = None,
+    ) -> str:
+        """
+        保存分析结果，相同的键已存在时覆盖
+
+        Returns:
+            str: 缓存键
+        """
+        cache_key = self.make_key(
+            analysis_type, client_id, window_start, window_end, prompt_version, input_hash
+        )
+        expires_at = datetime.utcnow() + timedelta(
+            seconds=ttl_seconds or settings.LLM_CACHE_TTL
+        )
+        try:
+            stmt = mysql_insert(LLMResultCache).values(
+                cache_key=cache_key,
+                analysis_type=analysis_type,
+                client_id=client_id,
+                window_start=window_start,
+                window_end=window_end,
+                prompt_version=prompt_version,
+                input_hash=input_hash,
+                result=json.dumps(value, ensure_ascii=False, default=str),
+                expires_at=expires_at,
+            )
+            stmt = stmt.on_duplicate_key_update(
+                result=stmt.inserted.result, expires_at=stmt.inserted.expires_at
+            )
+            await self.db.execute(stmt)
+            await self.db.commit()
+        except Exception as e:
+            logger.error(f"保存LLM分析结果缓存失败: {str(e)}")
+            await self.db.rollback()
+            raise
+
+        return cache_key
+
+    async def get_or_compute(
+        self,
+        analysis_type: str,
+        client_id: str,
+        window_start: datetime,
+        window_end: datetime,
+        prompt_version: str,
+        input_hash: str,
+        compute: Callable[[], Awaitable[Any]],
+    ) -> Tuple[Any, bool]:
+        """
+        读取缓存的分析结果，没有缓存时调用compute并缓存其结果
+
+        compute返回空结果时不缓存，便于下次重试；缓存读写失败只记录日志，不影响分析
+
+        Returns:
+            Tuple[Any, bool]: (分析结果, 是否来自缓存)
+        """
+        key_fields = (
+            analysis_type, client_id, window_start, window_end, prompt_version, input_hash
+        )
+        try:
+            cached = await self.get(self.make_key(*key_fields))
+            if cached is not None:
+                return cached, True
+        except Exception as e:
+            logger.warning(f"读取LLM分析结果缓存失败: {str(e)}")
+
+        value = await compute()
+        if value:
+            try:
+                await self.set(*key_fields, value)
+            except Exception as e:
+                logger.warning(f"缓存LLM分析结果失败: {str(e)}")
+
+        return value, False
+
+    async def invalidate(
+        self,
+        client_id: str,
+        analysis_type: Optional[str] = None,
+        start_time: Optional[datetime] = None,
+        end_time: Optional[datetime] = None,
+    ) -> int:
+        """
+        删除客户端的缓存结果
+
+        Args:
+            client_id: 客户端ID
+            analysis_type: 分析类型，为None时删除所有类型
+            start_time: 只删除窗口结束时间晚于该时间的结果（UTC）
+            end_time: 只删除窗口开始时间早于该时间的结果（UTC）
+
+        Returns:
+            int: 删除的条目数
+        """
+        conditions = [LLMResultCache.client_id == client_id]
+        if analysis_type:
+            conditions.append(LLMResultCache.analysis_type == analysis_type)
+        if start_time:
+            conditions.append(LLMResultCache.window_end > start_time)
+        if end_time:
+            conditions.append(LLMResultCache.window_start < end_time)
+
+        try:
+            result = await self.db.execute(delete(LLMResultCache).where(*conditions))
+            await self.db.commit()
+        except Exception as e:
+            logger.error(f"删除LLM分析结果缓存失败: {str(e)}")
+            await self.db.rollback()
+            raise
+
+        return result.rowcount
+
+    async def purge_expired(self) -> int:
+        """删除所有过期的条目，返回删除的条目数"""
+        try:
+            result = await self.db.execute(
+                delete(LLMResultCache).where(LLMResultCache.expires_at <= datetime.utcnow())
+            )
+            await self.db.commit()
+        except Exception as e:
+            logger.error(f"清理过期的LLM分析结果缓存失败: {str(e)}")
+            await self.db.rollback()
+            raise
+
+        return result.rowcount
@@ -5,28 +5,33 @@ from datetime import datetime, timedelta
 import re
 from collections import defaultdict
 from elasticsearch import AsyncElasticsearch
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from ..core.config import settings
+from .llm_client import OPENAI_AVAILABLE, llm_client
+from .llm_result_cache import LLMResultCacheService, fingerprint
+from .prompt_compactor import build_activity_prompt
 from .query_service import QueryService
 
-# 导入OpenAI库，用于大模型分析
-try:
-    from openai import OpenAI
-    OPENAI_AVAILABLE = True
-except ImportError:
-    OPENAI_AVAILABLE = False
-    logging.warning("OpenAI库未安装，将无法进行模式识别")
-
 logger = logging.getLogger(__name__)
 
+# 模式识别的提示模板版本，修改提示模板或模型时递增，使已缓存的结果失效
+PATTERN_PROMPT_VERSION = "2"
+
 class PatternRecognitionService:
     """
     模式识别服务，用于分析用户界面交互数据中的重复模式
     """
     
-    def __init__(self, openai_api_key: Optional[str] = None, es_client: Optional[AsyncElasticsearch] = None):
+    def __init__(
+        self,
+        openai_api_key: Optional[str] = None,
+        es_client: Optional[AsyncElasticsearch] = None,
+        db: Optional[AsyncSession] = None,
+    ):
         self.openai_api_key = openai_api_key
         self.es_client = es_client
+        self.db = db
         self.client = None
         self.use_openai = False
         self._initialize_client()
@@ -38,10 +43,8 @@ class PatternRecognitionService:
     def _initialize_client(self):
         """初始化OpenAI客户端"""
         if OPENAI_AVAILABLE and self.openai_api_key:
-            self.client = OpenAI(
-                api_key=self.openai_api_key,
-                base_url="https://openrouter.ai/api/v1",
-            )
+            # 共享进程内的异步客户端和连接池
+            self.client = llm_client.get(self.openai_api_key)
             self.use_openai = True
             logger.info("OpenAI客户端初始化成功")
         else:
@@ -117,13 +120,19 @@ class PatternRecognitionService:
             logger.error(f"从ES获取UI监控数据失败: {str(e)}")
             return []
             
-    async def analyze_ui_data(self, ui_data: List[Dict[str, Any]], time_window: int = 3600) -> Dict[str, Any]:
+    async def analyze_ui_data(
+        self,
+        ui_data: List[Dict[str, Any]],
+        time_window: int = 3600,
+        cache_key_fields: Optional[tuple] = None,
+    ) -> Dict[str, Any]:
         """
         分析UI监控数据中的模式
         
         Args:
             ui_data: 包含UI监控数据的列表
             time_window: 分析窗口大小（秒）
+            cache_key_fields: (客户端ID, 窗口开始时间, 窗口结束时间)，提供时缓存分析结果
             
         Returns:
             识别出的模式和建议
@@ -137,11 +146,21 @@ class PatternRecognitionService:
         # 按时间排序
         sorted_data = sorted(ui_data, key=lambda x: x.get("timestamp", ""))
         
-        # 使用大模型进行模式分析
-        patterns = await self._analyze_with_llm(sorted_data)
+        # 使用大模型进行模式分析，相同窗口和输入数据的结果已缓存时直接返回
+        if self.db and cache_key_fields:
+            patterns, cached = await LLMResultCacheService(self.db).get_or_compute(
+                "patterns",
+                *cache_key_fields,
+                PATTERN_PROMPT_VERSION,
+                fingerprint(sorted_data),
+                lambda: self._analyze_with_llm(sorted_data),
+            )
+        else:
+            patterns, cached = await self._analyze_with_llm(sorted_data), False
         
         return {
             "patterns": patterns,
+            "cached": cached,
             "message": f"分析了{len(ui_data)}条UI监控记录，识别出{len(patterns)}个潜在模式"
         }
     
@@ -186,7 +205,9 @@ class PatternRecognitionService:
             }
         
         # 分析UI监控数据
-        result = await self.analyze_ui_data(ui_data)
+        result = await self.analyze_ui_data(
+            ui_data, cache_key_fields=(client_id, start_time, end_time)
+        )
         
         # 添加数据源信息
         result["data_source"] = {
@@ -199,6 +220,15 @@ class PatternRecognitionService:
         
         return result
     
+    @staticmethod
+    def _format_platform(item: Dict[str, Any]) -> str:
+        """生成提示中记录的平台信息"""
+        metadata = item.get("metadata") or {}
+        return (
+            f" | 平台: {metadata.get('platform') or ''} "
+            f"{metadata.get('os') or ''} {metadata.get('os_version') or ''}"
+        )
+    
     async def _analyze_with_llm(self, ui_data: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
         """使用大模型分析UI交互模式"""
         if not self.use_openai:
@@ -208,8 +238,14 @@ class PatternRecognitionService:
         
         try:
             # 准备输入数据
-            # 为了避免超出token限制，我们只取最近的50条记录
-            recent_data = ui_data[-50:] if len(ui_data) > 50 else ui_data
+            # 合并重复记录并去掉重复的UI文本，按时间远近和内容新旧在token预算内选取记录
+            activity, activity_stats = build_activity_prompt(
+                ui_data,
+                settings.LLM_PROMPT_TOKEN_BUDGET,
+                text_limit=500,
+                extra=self._format_platform,
+            )
+            logger.info(f"模式识别提示压缩: {activity_stats}")
             
             # 构建提示
             prompt = """分析以下用户界面交互数据，首先总结用户的工作内容和行为特征，然后识别可能的工作模式和重复任务。
@@ -237,17 +273,7 @@ class PatternRecognitionService:
 数据如下：
 
 """
-            for item in recent_data:
-                timestamp = datetime.fromisoformat(item["timestamp"]).strftime("%Y-%m-%d %H:%M:%S")
-                app = item["app"]
-                window = item["window"]
-                text_output = item.get("text_output", "")
-                metadata = item.get("metadata", {})
-                platform = metadata.get("platform", "")
-                os_info = f"{metadata.get('os', '')} {metadata.get('os_version', '')}"
-                
-                prompt += f"[{timestamp}] 应用: {app} | 窗口: {window} | 平台: {platform} {os_info}\n"
-                prompt += f"UI元素: {text_output[:500]}...\n\n"
+            prompt += activity + "\n"
             
             prompt += """
 请以JSON格式返回分析结果，包含以下部分：
@@ -284,7 +310,8 @@ class PatternRecognitionService:
             # 调用OpenAI API
             response = None
             try:
-                response = self.client.chat.completions.create(
+                response = await llm_client.chat_completion(
+                    self.client,
                     model="anthropic/claude-3.7-sonnet",
                     messages=[
                         {"role": "system", "content": "你是一个专门分析用户工作行为和界面交互模式的助手。你善于从用户的应用程序使用记录中总结工作内容，识别行为特征，并发现可优化的机会。你的回答必须是有效的JSON格式。"},
@@ -0,0 +1,183 @@
+import re
+import zlib
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+SHINGLE_SIZE = 5  # 文本指纹使用的字符n-gram长度
+NOVELTY_THRESHOLD = 0.5  # 一行文本中未出现过的片段比例低于该值时视为重复
+MAX_SCAN_CHARS = 4000  # 每条记录参与去重的最大文本长度
+RECENCY_HALF_LIFE = 20  # 按时间倒序每隔多少个片段，时间权重减半
+MIN_TEXT_TOKENS = 20  # 剩余预算不足以放下这么多token时不再添加文本
+HEADER_BUDGET_RATIO = 0.5  # 标题行最多使用的预算比例，其余留给UI文本
+
+_CJK_PATTERN = re.compile(r"[\u3040-\u30ff\u3400-\u9fff\uac00-\ud7af\uff00-\uffef]")
+_WHITESPACE_PATTERN = re.compile(r"\s+")
+
+
+def estimate_tokens(text: str) -> int:
+    """估算文本的token数：中日韩字符每个约1个token，其他字符约4个一个token"""
+    cjk_count = len(_CJK_PATTERN.findall(text))
+    return cjk_count + (len(text) - cjk_count + 3) // 4
+
+
+def _shingles(line: str) -> Set[int]:
+    if len(line) <= SHINGLE_SIZE:
+        return {zlib.crc32(line.encode("utf-8"))}
+    return {
+        zlib.crc32(line[i : i + SHINGLE_SIZE].encode("utf-8"))
+        for i in range(len(line) - SHINGLE_SIZE + 1)
+    }
+
+
+def _merge_consecutive(records: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """合并应用和窗口相同的连续记录"""
+    segments = []
+    for record in records:
+        last = segments[-1] if segments else None
+        if last and last["app"] == record["app"] and last["window"] == record["window"]:
+            last["end"] = record["timestamp"]
+            last["records"].append(record)
+        else:
+            segments.append(
+                {
+                    "app": record["app"],
+                    "window": record["window"],
+                    "start": record["timestamp"],
+                    "end": record["timestamp"],
+                    "records": [record],
+                }
+            )
+    return segments
+
+
+def _extract_new_text(segment: Dict[str, Any], seen: Set[int]) -> Tuple[List[str], float]:
+    """
+    提取片段中未出现过的UI文本行
+
+    Returns:
+        Tuple[List[str], float]: (新的文本行, 新文本占片段全部文本的比例)
+    """
+    record_lines = []
+    new_chars = 0
+    total_chars = 0
+    # 片段内的记录也从新到旧处理，保留最新的一份
+    for record in reversed(segment["records"]):
+        text = (record.get("text_output") or "")[:MAX_SCAN_CHARS]
+        lines = []
+        for line in text.splitlines():
+            line = _WHITESPACE_PATTERN.sub(" ", line).strip()
+            if not line:
+                continue
+            shingles = _shingles(line.lower())
+            unseen = len(shingles - seen)
+            seen |= shingles
+            total_chars += len(line)
+            if unseen / len(shingles) >= NOVELTY_THRESHOLD:
+                lines.append(line)
+                new_chars += len(line)
+        record_lines.append(lines)
+
+    # 记录恢复为时间顺序，记录内的文本行保持原有顺序
+    new_lines = [line for lines in reversed(record_lines) for line in lines]
+    return new_lines, (new_chars / total_chars if total_chars else 0.0)
+
+
+def _format_time(timestamp: Any, fmt: str) -> str:
+    if isinstance(timestamp, str):
+        timestamp = datetime.fromisoformat(timestamp)
+    return timestamp.strftime(fmt)
+
+
+def _format_header(
+    segment: Dict[str, Any], extra: Optional[Callable[[Dict[str, Any]], str]]
+) -> str:
+    header = (
+        f"[{_format_time(segment['start'], '%Y-%m-%d %H:%M:%S')}] "
+        f"应用: {segment['app']} | 窗口: {segment['window']}"
+    )
+    count = len(segment["records"])
+    if count > 1:
+        header += f" | 持续至 {_format_time(segment['end'], '%H:%M:%S')}，{count}条记录"
+    if extra:
+        header += extra(segment["records"][0])
+    return header
+
+
+def build_activity_prompt(
+    records: List[Dict[str, Any]],
+    token_budget: int,
+    text_limit: int = 500,
+    extra: Optional[Callable[[Dict[str, Any]], str]] = None,
+) -> Tuple[str, Dict[str, int]]:
+    """
+    在token预算内生成UI监控记录的提示文本
+
+    1. 应用和窗口相同的连续记录合并为一个片段，只输出一次时间范围和记录数
+    2. 从新到旧对UI文本计算字符n-gram指纹，已出现过的文本行被去掉
+    3. 先按时间从新到旧放入各片段的标题行（最多使用一半预算），再按“时间越近、
+       新内容越多越优先”的顺序放入片段的UI文本，直到用完预算
+    4. 放入的片段按时间顺序输出
+
+    Args:
+        records: 按时间升序排列的记录，包含timestamp、app、window和text_output
+        token_budget: 提示文本的token预算
+        text_limit: 每个片段UI文本的最大字符数
+        extra: 根据片段第一条记录生成附加在标题行后的文本
+
+    Returns:
+        Tuple[str, Dict[str, int]]: (提示文本, 统计信息)
+    """
+    segments = _merge_consecutive(records)
+
+    # 从新到旧去重并计算排序分数
+    seen: Set[int] = set()
+    for age, segment in enumerate(reversed(segments)):
+        lines, novelty = _extract_new_text(segment, seen)
+        segment["text"] = " | ".join(lines)[:text_limit]
+        segment["score"] = 0.5 ** (age / RECENCY_HALF_LIFE) * (0.25 + 0.75 * novelty)
+        segment["header"] = _format_header(segment, extra)
+        segment["lines"] = []
+
+    # 标题行构成时间线，从新到旧放入
+    header_budget = int(token_budget * HEADER_BUDGET_RATIO)
+    included = []
+    for segment in reversed(segments):
+        tokens = estimate_tokens(segment["header"]) + 1
+        if tokens > header_budget:
+            break
+        header_budget -= tokens
+        segment["lines"].append(segment["header"])
+        included.append(segment)
+    remaining = token_budget - int(token_budget * HEADER_BUDGET_RATIO) + header_budget
+
+    # UI文本按分数从高到低放入，预算不足时截断
+    text_count = 0
+    for segment in sorted(included, key=lambda s: s["score"], reverse=True):
+        if remaining < MIN_TEXT_TOKENS:
+            break
+        if not segment["text"]:
+            continue
+        line = f"UI元素: {segment['text']}"
+        tokens = estimate_tokens(line) + 1
+        if tokens > remaining:
+            # 按比例截断到剩余预算，中日韩字符和其他字符混排时比例不准，超出时再逐字缩短
+            cut = max(0, len(line) * remaining // tokens - 3)
+            tokens = estimate_tokens(line[:cut] + "...") + 1
+            while tokens > remaining and cut > 0:
+                cut -= 1
+                tokens = estimate_tokens(line[:cut] + "...") + 1
+            line = line[:cut] + "..."
+        remaining -= tokens
+        segment["lines"].append(line)
+        text_count += 1
+
+    included.reverse()
+    prompt = "\n".join(line for segment in included for line in segment["lines"])
+    stats = {
+        "records": len(records),
+        "segments": len(segments),
+        "included_segments": len(included),
+        "text_segments": text_count,
+        "estimated_tokens": token_budget - remaining,
+    }
+    return prompt, stats
@@ -1,14 +1,212 @@
 from datetime import datetime, timedelta
+import base64
+import heapq
+import json
 import logging
 from elasticsearch import AsyncElasticsearch
 from ..core.config import settings
+from .timestamp_decoder import TimestampDecoder
 
 logger = logging.getLogger(__name__)
 
+
+def encode_cursor(position) -> str:
+    """将ES返回的sort值（或多个数据源的sort值）编码为不透明的分页游标"""
+    raw = json.dumps(position, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii")
+
+
+def decode_cursor(cursor: str, expected_type: type = list):
+    """将分页游标解码为search_after参数"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode("ascii"))
+        position = json.loads(raw)
+    except (ValueError, UnicodeError) as e:
+        raise ValueError(f"无效的分页游标: {cursor}") from e
+    if not isinstance(position, expected_type):
+        raise ValueError(f"无效的分页游标: {cursor}")
+    return position
+
+
+# date_histogram中按日历对齐的间隔及其近似秒数（用于估算桶数量），其余间隔使用fixed_interval
+CALENDAR_INTERVALS = {
+    "minute": 60, "1m": 60, "hour": 3600, "1h": 3600, "day": 86400, "1d": 86400,
+    "week": 604800, "1w": 604800, "month": 2419200, "1M": 2419200,
+    "quarter": 7776000, "1q": 7776000, "year": 31536000, "1y": 31536000
+}
+
+# fixed_interval支持的单位及其秒数，ES不接受以w、M、q、y为单位的固定间隔
+FIXED_INTERVAL_UNITS = {"ms": 0.001, "s": 1, "m": 60, "h": 3600, "d": 86400}
+
+# 直方图允许的最大桶数量（含子聚合的桶），低于ES默认的search.max_buckets
+MAX_HISTOGRAM_BUCKETS = 10000
+
+# 统计结果中排名之外的应用或窗口合并后的名称
+OTHER_BUCKET_NAME = "其他"
+
+
+def interval_seconds(interval: str) -> float:
+    """
+    返回date_histogram间隔的秒数，日历间隔按最短长度计算
+
+    Raises:
+        ValueError: 间隔既不是日历间隔，也不是ES支持的固定间隔
+    """
+    if interval in CALENDAR_INTERVALS:
+        return CALENDAR_INTERVALS[interval]
+    for unit in ("ms", "s", "m", "h", "d"):
+        value = interval[: -len(unit)]
+        if interval.endswith(unit) and value.isdigit() and int(value) > 0:
+            return int(value) * FIXED_INTERVAL_UNITS[unit]
+    raise ValueError(f"不支持的时间间隔: {interval}")
+
+
+# 时间线数据源：类型 -> (索引后缀, 时间戳相同时的排序字段)
+TIMELINE_SOURCES = {
+    "ui": ("ui-monitoring", "monitoring_id"),
+    "ocr": ("ocr-text", "frame_id"),
+    "audio": ("audio-transcriptions", "transcription_id"),
+}
+
+
+class _SortedHitStream:
+    """
+    单个索引上按时间排序的search_after流，内存中最多保留一页命中
+    """
+
+    def __init__(self, es_client: AsyncElasticsearch, index_name: str, query: dict,
+                 tiebreaker: str, page_size: int, sort_order: str, search_after: list = None):
+        self.es_client = es_client
+        self.index_name = index_name
+        self.query = query
+        self.tiebreaker = tiebreaker
+        self.page_size = page_size
+        self.sort_order = sort_order
+        self.search_after = search_after
+        self.buffer = []
+        self.position = 0
+        self.exhausted = False
+
+    async def next(self):
+        """返回下一条命中，流结束时返回None"""
+        if self.position >= len(self.buffer):
+            if self.exhausted:
+                return None
+            await self._fetch_page()
+            if not self.buffer:
+                return None
+        hit = self.buffer[self.position]
+        self.position += 1
+        return hit
+
+    async def _fetch_page(self):
+        body = {
+            "query": self.query,
+            "sort": [{"timestamp": self.sort_order}, {self.tiebreaker: self.sort_order}],
+            "size": self.page_size,
+            "track_total_hits": False
+        }
+        if self.search_after:
+            body["search_after"] = self.search_after
+
+        result = await self.es_client.search(index=self.index_name, body=body)
+
+        self.buffer = result["hits"]["hits"]
+        self.position = 0
+        if self.buffer:
+            self.search_after = self.buffer[-1]["sort"]
+        if len(self.buffer) < self.page_size:
+            self.exhausted = True
+
+
 class QueryService:
     def __init__(self, es_client: AsyncElasticsearch):
         self.es_client = es_client
     
+    @staticmethod
+    def _apply_track_total_hits(body: dict, limit: int, track_total_hits) -> dict:
+        """
+        设置总数统计方式
+        
+        track_total_hits为None时保持ES默认行为；为False或整数时ES不再精确计数，
+        此时多取一条用于判断是否还有下一页
+        """
+        if track_total_hits is not None:
+            body["track_total_hits"] = track_total_hits
+        if track_total_hits is not None and track_total_hits is not True:
+            body["size"] = limit + 1
+        return body
+    
+    @staticmethod
+    def _build_page(result: dict, limit: int, offset: int, track_total_hits):
+        """
+        将搜索结果转换为分页响应，返回(响应, 本页命中)
+        
+        精确计数时total为总数；不计数时total为None；封顶计数时total为封顶后的数量，
+        total_relation为"gte"表示实际数量更多。has_more在任何模式下都可用
+        """
+        all_hits = result["hits"]["hits"]
+        hits = all_hits[:limit]
+        total_info = result["hits"].get("total")
+        
+        if track_total_hits is None or track_total_hits is True:
+            has_more = offset + len(hits) < total_info["value"]
+        else:
+            has_more = len(all_hits) > limit
+        
+        page = {
+            "total": total_info["value"] if total_info else None,
+            "total_relation": total_info["relation"] if total_info else None,
+            "has_more": has_more,
+            "items": [hit["_source"] for hit in hits],
+            "limit": limit,
+            "offset": offset
+        }
+        return page, hits
+    
+    async def iter_composite_terms(self, index_name: str, query: dict, field: str, page_size: int = 1000):
+        """
+        使用composite聚合分页遍历字段的所有唯一值
+        
+        terms聚合受size限制会静默截断结果，composite聚合通过after_key游标
+        逐页返回，每次请求只在内存中保留一页桶
+        
+        Args:
+            index_name: 索引名称
+            query: 查询条件
+            field: 要遍历的keyword字段
+            page_size: 每页桶数量，默认1000
+            
+        Yields:
+            dict: 包含key和doc_count的桶
+        """
+        after_key = None
+        while True:
+            composite = {
+                "size": page_size,
+                "sources": [{"value": {"terms": {"field": field}}}]
+            }
+            if after_key:
+                composite["after"] = after_key
+            
+            result = await self.es_client.search(
+                index=index_name,
+                body={
+                    "query": query,
+                    "size": 0,
+                    "aggs": {"values": {"composite": composite}}
+                }
+            )
+            
+            agg = result["aggregations"]["values"]
+            for bucket in agg["buckets"]:
+                yield {"key": bucket["key"]["value"], "doc_count": bucket["doc_count"]}
+            
+            # 没有after_key或本页不足一页时说明已遍历完成
+            after_key = agg.get("after_key")
+            if not after_key or len(agg["buckets"]) < page_size:
+                break
+    
     async def get_ui_monitoring_by_time(self, 
                                         client_id: str = None, 
                                         start_time: datetime = None, 
@@ -17,7 +215,8 @@ class QueryService:
                                         window: str = None,
                                         limit: int = 100,
                                         offset: int = 0,
-                                        sort_order: str = "desc"):
+                                        sort_order: str = "desc",
+                                        track_total_hits=None):
         """
         按时间顺序获取UI监控数据
         
@@ -30,6 +229,7 @@ class QueryService:
             limit: 返回结果数量限制，默认100
             offset: 分页偏移量，默认0
             sort_order: 排序顺序，"asc"或"desc"，默认"desc"
+            track_total_hits: 总数统计方式，None为ES默认，False不统计，整数为统计上限
             
         Returns:
             dict: 包含UI监控数据的字典
@@ -67,29 +267,90 @@ class QueryService:
             
             result = await self.es_client.search(
                 index=index_name,
-                body={
-                    "query": query,
-                    "sort": [{"timestamp": sort_order}],
-                    "from": offset,
-                    "size": limit
-                }
+                body=self._apply_track_total_hits(
+                    {
+                        "query": query,
+                        "sort": [{"timestamp": sort_order}],
+                        "from": offset,
+                        "size": limit
+                    },
+                    limit,
+                    track_total_hits
+                )
             )
             
             # 处理结果
-            total = result["hits"]["total"]["value"]
-            items = [hit["_source"] for hit in result["hits"]["hits"]]
+            page, _ = self._build_page(result, limit, offset, track_total_hits)
             
-            return {
-                "total": total,
-                "items": items,
-                "limit": limit,
-                "offset": offset
-            }
+            return page
             
         except Exception as e:
             logger.error(f"Error querying UI monitoring data: {e}")
             raise
     
+    async def iter_ui_monitoring_pages(self,
+                                       client_id: str,
+                                       start_time: datetime = None,
+                                       end_time: datetime = None,
+                                       search_after: list = None,
+                                       page_size: int = 1000,
+                                       source_fields: list = None,
+                                       sort_order: str = "asc"):
+        """
+        按时间顺序逐页遍历UI监控数据
+        
+        使用search_after翻页，不受from/size结果窗口限制，内存中只保留一页数据
+        
+        Args:
+            client_id: 客户端ID
+            start_time: 开始时间，可选
+            end_time: 结束时间，可选
+            search_after: 起始位置（不含），为[毫秒时间戳, monitoring_id]，可选
+            page_size: 每页数量，默认1000
+            source_fields: 只返回_source中的这些字段，可选
+            sort_order: 排序顺序，"asc"或"desc"，默认"asc"
+            
+        Yields:
+            list: 一页ES命中，每条包含_source、sort和fields（timestamp为epoch_millis格式）
+        """
+        query = {"bool": {"must": [{"term": {"client_id": client_id}}]}}
+        
+        # 添加时间范围过滤
+        if start_time or end_time:
+            time_range = {}
+            if start_time:
+                time_range["gte"] = start_time.isoformat()
+            if end_time:
+                time_range["lte"] = end_time.isoformat()
+            query["bool"]["must"].append({"range": {"timestamp": time_range}})
+        
+        index_name = f"{settings.ES_INDEX_PREFIX}-ui-monitoring"
+        
+        while True:
+            body = {
+                "query": query,
+                "sort": [{"timestamp": sort_order}, {"monitoring_id": sort_order}],
+                "size": page_size,
+                "track_total_hits": False,
+                # 以毫秒时间戳取回时间，调用方无需解析时间字符串
+                "docvalue_fields": TimestampDecoder.docvalue_fields()
+            }
+            if source_fields is not None:
+                body["_source"] = source_fields
+            if search_after:
+                body["search_after"] = search_after
+            
+            result = await self.es_client.search(index=index_name, body=body)
+            hits = result["hits"]["hits"]
+            if not hits:
+                break
+            
+            yield hits
+            
+            if len(hits) < page_size:
+                break
+            search_after = hits[-1]["sort"]
+
     async def get_ui_monitoring_apps(self, client_id: str = None):
         """
         获取所有UI监控的应用名称列表
@@ -159,6 +420,65 @@ class QueryService:
             if app:
                 query["bool"]["must"].append({"term": {"app": app}})
             
+            # 通过composite聚合分页获取全部窗口名称
+            index_name = f"{settings.ES_INDEX_PREFIX}-ui-monitoring"
+            
+            windows = [
+                bucket["key"]
+                async for bucket in self.iter_composite_terms(index_name, query, "window")
+            ]
+            
+            return windows
+            
+        except Exception as e:
+            logger.error(f"Error querying UI monitoring windows: {e}")
+            raise
+
+    async def get_ui_monitoring_stats(self,
+                                      client_id: str = None,
+                                      start_time: datetime = None,
+                                      end_time: datetime = None,
+                                      app_size: int = 100,
+                                      window_size: int = 100):
+        """
+        统计UI监控数据的应用和窗口使用情况（ES端terms、cardinality和min/max聚合）
+        
+        一次请求同时返回总记录数、按应用和按应用+窗口分组的记录数及首末记录时间，
+        不受返回文档数量的限制。排名之外的应用或窗口的记录数合并为最后一条名为“其他”的统计，
+        其窗口数和时长为None，各项统计的记录数之和始终等于总记录数
+        
+        Args:
+            client_id: 客户端ID，可选
+            start_time: 开始时间，可选
+            end_time: 结束时间，可选
+            app_size: 单独统计的最大应用数量，默认100
+            window_size: 单独统计的最大窗口数量，默认100
+            
+        Returns:
+            dict: 包含总记录数、应用统计和窗口统计的字典，统计按记录数降序排列
+        """
+        try:
+            # 构建查询
+            query = {"bool": {"must": []}}
+            
+            # 添加客户端ID过滤
+            if client_id:
+                query["bool"]["must"].append({"term": {"client_id": client_id}})
+            
+            # 添加时间范围过滤
+            if start_time or end_time:
+                time_range = {}
+                if start_time:
+                    time_range["gte"] = start_time.isoformat()
+                if end_time:
+                    time_range["lte"] = end_time.isoformat()
+                query["bool"]["must"].append({"range": {"timestamp": time_range}})
+            
+            time_span = {
+                "first_seen": {"min": {"field": "timestamp"}},
+                "last_seen": {"max": {"field": "timestamp"}}
+            }
+            
             # 执行聚合查询
             index_name = f"{settings.ES_INDEX_PREFIX}-ui-monitoring"
             
@@ -167,24 +487,218 @@ class QueryService:
                 body={
                     "query": query,
                     "size": 0,
+                    "track_total_hits": True,
                     "aggs": {
-                        "windows": {
-                            "terms": {
-                                "field": "window",
-                                "size": 1000
+                        "apps": {
+                            "terms": {"field": "app", "size": app_size},
+                            "aggs": {
+                                "window_count": {"cardinality": {"field": "window"}},
+                                **time_span
                             }
+                        },
+                        "windows": {
+                            "multi_terms": {
+                                "terms": [{"field": "app"}, {"field": "window"}],
+                                "size": window_size
+                            },
+                            "aggs": time_span
+                        }
+                    }
+                }
+            )
+            
+            # 处理结果，时长按首末记录的时间差计算
+            def duration_minutes(bucket):
+                first_seen = bucket["first_seen"]["value"] or 0
+                last_seen = bucket["last_seen"]["value"] or 0
+                return round((last_seen - first_seen) / 60000, 1)
+            
+            aggregations = result["aggregations"]
+            
+            apps = [
+                {
+                    "app": bucket["key"],
+                    "interaction_count": bucket["doc_count"],
+                    "window_count": bucket["window_count"]["value"],
+                    "duration_minutes": duration_minutes(bucket)
+                }
+                for bucket in aggregations["apps"]["buckets"]
+            ]
+            
+            windows = [
+                {
+                    "app": bucket["key"][0],
+                    "window": bucket["key"][1],
+                    "interaction_count": bucket["doc_count"],
+                    "duration_minutes": duration_minutes(bucket)
+                }
+                for bucket in aggregations["windows"]["buckets"]
+            ]
+            
+            # terms聚合只返回前size个桶，其余记录数合并为“其他”，避免静默截断
+            other_apps = aggregations["apps"]["sum_other_doc_count"]
+            if other_apps:
+                apps.append({
+                    "app": OTHER_BUCKET_NAME,
+                    "interaction_count": other_apps,
+                    "window_count": None,
+                    "duration_minutes": None
+                })
+            
+            other_windows = aggregations["windows"]["sum_other_doc_count"]
+            if other_windows:
+                windows.append({
+                    "app": None,
+                    "window": OTHER_BUCKET_NAME,
+                    "interaction_count": other_windows,
+                    "duration_minutes": None
+                })
+            
+            return {
+                "total": result["hits"]["total"]["value"],
+                "apps": apps,
+                "windows": windows
+            }
+            
+        except Exception as e:
+            logger.error(f"Error querying UI monitoring stats: {e}")
+            raise
+
+    async def get_ui_monitoring_activity_histogram(self,
+                                                   client_id: str = None,
+                                                   start_time: datetime = None,
+                                                   end_time: datetime = None,
+                                                   app: str = None,
+                                                   window: str = None,
+                                                   interval: str = "1h",
+                                                   time_zone: str = "+08:00",
+                                                   group_by: str = None,
+                                                   group_size: int = 10):
+        """
+        按时间间隔统计UI监控活动数量（ES端date_histogram聚合）
+        
+        Args:
+            client_id: 客户端ID，可选
+            start_time: 开始时间，可选
+            end_time: 结束时间，可选
+            app: 应用名称，可选
+            window: 窗口名称，可选
+            interval: 时间间隔，如"5m"、"1h"、"1d"，默认"1h"
+            time_zone: 分桶使用的时区，如"+08:00"或"Asia/Shanghai"，默认"+08:00"
+            group_by: 子聚合字段，"app"或"window"，可选
+            group_size: 每个时间桶内子聚合返回的最大数量，默认10
+            
+        Returns:
+            dict: 包含时间桶列表的字典
+            
+        Raises:
+            ValueError: 间隔不受支持，或时间范围内的桶数量超过MAX_HISTOGRAM_BUCKETS
+        """
+        # 补齐空桶时桶数量由时间范围决定，过小的间隔会超过ES的桶数量上限
+        seconds = interval_seconds(interval)
+        if start_time and end_time:
+            bucket_count = int((end_time - start_time).total_seconds() // seconds) + 1
+            if group_by:
+                bucket_count *= group_size + 1
+            if bucket_count > MAX_HISTOGRAM_BUCKETS:
+                raise ValueError(
+                    f"时间范围内的桶数量约为{bucket_count}，超过上限{MAX_HISTOGRAM_BUCKETS}，"
+                    f"请增大时间间隔或缩小时间范围"
+                )
+        
+        try:
+            # 构建查询
+            query = {"bool": {"must": []}}
+            
+            # 添加客户端ID过滤
+            if client_id:
+                query["bool"]["must"].append({"term": {"client_id": client_id}})
+            
+            # 添加时间范围过滤
+            if start_time or end_time:
+                time_range = {}
+                if start_time:
+                    time_range["gte"] = start_time.isoformat()
+                if end_time:
+                    time_range["lte"] = end_time.isoformat()
+                query["bool"]["must"].append({"range": {"timestamp": time_range}})
+            
+            # 添加应用名称过滤
+            if app:
+                query["bool"]["must"].append({"term": {"app": app}})
+            
+            # 添加窗口名称过滤
+            if window:
+                query["bool"]["must"].append({"term": {"window": window}})
+            
+            # 构建date_histogram聚合
+            # 日历间隔（1h、1d、1w等）按时区对齐，其余（如5m、2h）使用固定间隔
+            histogram = {
+                "field": "timestamp",
+                "time_zone": time_zone,
+                "min_doc_count": 0
+            }
+            if interval in CALENDAR_INTERVALS:
+                histogram["calendar_interval"] = interval
+            else:
+                histogram["fixed_interval"] = interval
+            
+            # 有时间范围时补齐空桶，便于前端直接绘图
+            if start_time and end_time:
+                histogram["extended_bounds"] = {
+                    "min": start_time.isoformat(),
+                    "max": end_time.isoformat()
+                }
+            
+            aggs = {"activity": {"date_histogram": histogram}}
+            
+            # 按应用或窗口细分
+            if group_by:
+                aggs["activity"]["aggs"] = {
+                    "groups": {
+                        "terms": {
+                            "field": group_by,
+                            "size": group_size
                         }
                     }
                 }
+            
+            # 执行聚合查询
+            index_name = f"{settings.ES_INDEX_PREFIX}-ui-monitoring"
+            
+            result = await self.es_client.search(
+                index=index_name,
+                body={
+                    "query": query,
+                    "size": 0,
+                    "aggs": aggs
+                }
             )
             
             # 处理结果
-            windows = [bucket["key"] for bucket in result["aggregations"]["windows"]["buckets"]]
+            buckets = []
+            for bucket in result["aggregations"]["activity"]["buckets"]:
+                item = {
+                    "timestamp": bucket["key_as_string"],
+                    "count": bucket["doc_count"]
+                }
+                if group_by:
+                    item["groups"] = [
+                        {"key": group["key"], "count": group["doc_count"]}
+                        for group in bucket["groups"]["buckets"]
+                    ]
+                    item["other_count"] = bucket["groups"]["sum_other_doc_count"]
+                buckets.append(item)
             
-            return windows
+            return {
+                "interval": interval,
+                "time_zone": time_zone,
+                "group_by": group_by,
+                "buckets": buckets
+            }
             
         except Exception as e:
-            logger.error(f"Error querying UI monitoring windows: {e}")
+            logger.error(f"Error querying UI monitoring activity histogram: {e}")
             raise
 
     async def get_ocr_text_by_time(self, 
@@ -196,7 +710,8 @@ class QueryService:
                                   focused: bool = None,
                                   limit: int = 100,
                                   offset: int = 0,
-                                  sort_order: str = "desc"):
+                                  sort_order: str = "desc",
+                                  track_total_hits=None):
         """
         按时间顺序获取OCR文本数据
         
@@ -210,6 +725,7 @@ class QueryService:
             limit: 返回结果数量限制，默认100
             offset: 分页偏移量，默认0
             sort_order: 排序顺序，"asc"或"desc"，默认"desc"
+            track_total_hits: 总数统计方式，None为ES默认，False不统计，整数为统计上限
             
         Returns:
             dict: 包含OCR文本数据的字典
@@ -248,24 +764,22 @@ class QueryService:
             
             result = await self.es_client.search(
                 index=index_name,
-                body={
-                    "query": query,
-                    "sort": [{"timestamp": sort_order}],
-                    "from": offset,
-                    "size": limit
-                }
+                body=self._apply_track_total_hits(
+                    {
+                        "query": query,
+                        "sort": [{"timestamp": sort_order}],
+                        "from": offset,
+                        "size": limit
+                    },
+                    limit,
+                    track_total_hits
+                )
             )
             
             # 处理结果
-            total = result["hits"]["total"]["value"]
-            items = [hit["_source"] for hit in result["hits"]["hits"]]
+            page, _ = self._build_page(result, limit, offset, track_total_hits)
             
-            return {
-                "total": total,
-                "items": items,
-                "limit": limit,
-                "offset": offset
-            }
+            return page
             
         except Exception as e:
             logger.error(f"Error querying OCR text data: {e}")
@@ -340,30 +854,363 @@ class QueryService:
             if app_name:
                 query["bool"]["must"].append({"term": {"app_name": app_name}})
             
-            # 执行聚合查询
+            # 通过composite聚合分页获取全部窗口名称
             index_name = f"{settings.ES_INDEX_PREFIX}-ocr-text"
             
+            windows = [
+                bucket["key"]
+                async for bucket in self.iter_composite_terms(index_name, query, "window_name")
+            ]
+            
+            return windows
+            
+        except Exception as e:
+            logger.error(f"Error querying OCR text windows: {e}")
+            raise 
+
+    async def search_after_page(self,
+                                index_name: str,
+                                query: dict,
+                                tiebreaker: str,
+                                limit: int = 100,
+                                cursor: str = None,
+                                sort_order: str = "desc",
+                                track_total_hits=None):
+        """
+        使用search_after按时间顺序获取一页数据
+        
+        与from/size分页不同，深翻页时ES无需维护整个结果窗口
+        
+        Args:
+            index_name: 索引名称
+            query: 查询条件
+            tiebreaker: 时间戳相同时用于稳定排序的唯一字段
+            limit: 每页数量，默认100
+            cursor: 上一页返回的游标，可选
+            sort_order: 排序顺序，"asc"或"desc"，默认"desc"
+            track_total_hits: 总数统计方式，None为ES默认，False不统计，整数为统计上限
+            
+        Returns:
+            dict: 包含items和next_cursor的字典
+        """
+        body = {
+            "query": query,
+            "sort": [{"timestamp": sort_order}, {tiebreaker: sort_order}],
+            # 多取一条用于判断是否还有下一页
+            "size": limit + 1
+        }
+        if track_total_hits is not None:
+            body["track_total_hits"] = track_total_hits
+        if cursor:
+            body["search_after"] = decode_cursor(cursor)
+        
+        result = await self.es_client.search(index=index_name, body=body)
+        
+        # 游标分页始终通过多取的一条判断has_more
+        page, hits = self._build_page(result, limit, 0, False)
+        page.pop("offset")
+        
+        # 还有下一页时返回游标
+        page["next_cursor"] = encode_cursor(hits[-1]["sort"]) if page["has_more"] else None
+        
+        return page
+
+    async def get_audio_transcriptions_by_time(self,
+                                               client_id: str = None,
+                                               start_time: datetime = None,
+                                               end_time: datetime = None,
+                                               device: str = None,
+                                               is_input_device: bool = None,
+                                               speaker_id: int = None,
+                                               limit: int = 100,
+                                               cursor: str = None,
+                                               sort_order: str = "desc",
+                                               track_total_hits=None):
+        """
+        按时间顺序获取音频转录数据，使用游标分页
+        
+        Args:
+            client_id: 客户端ID，可选
+            start_time: 开始时间，可选
+            end_time: 结束时间，可选
+            device: 音频设备名称，可选
+            is_input_device: 是否为输入设备，可选
+            speaker_id: 说话人ID，可选
+            limit: 返回结果数量限制，默认100
+            cursor: 分页游标，可选
+            sort_order: 排序顺序，"asc"或"desc"，默认"desc"
+            track_total_hits: 总数统计方式，None为ES默认，False不统计，整数为统计上限
+            
+        Returns:
+            dict: 包含音频转录数据和下一页游标的字典
+        """
+        try:
+            query = self._build_audio_transcription_query(
+                client_id=client_id,
+                start_time=start_time,
+                end_time=end_time,
+                device=device,
+                is_input_device=is_input_device,
+                speaker_id=speaker_id
+            )
+            
+            # 执行查询
+            index_name = f"{settings.ES_INDEX_PREFIX}-audio-transcriptions"
+            
+            return await self.search_after_page(
+                index_name,
+                query,
+                tiebreaker="transcription_id",
+                limit=limit,
+                cursor=cursor,
+                sort_order=sort_order,
+                track_total_hits=track_total_hits
+            )
+            
+        except Exception as e:
+            logger.error(f"Error querying audio transcriptions: {e}")
+            raise
+
+    async def get_audio_talk_time(self,
+                                  client_id: str = None,
+                                  start_time: datetime = None,
+                                  end_time: datetime = None,
+                                  device: str = None,
+                                  is_input_device: bool = None,
+                                  speaker_id: int = None,
+                                  size: int = 100):
+        """
+        按说话人和设备统计讲话时长，时长在ES端由end_time - start_time求和
+        
+        Args:
+            client_id: 客户端ID，可选
+            start_time: 开始时间，可选
+            end_time: 结束时间，可选
+            device: 音频设备名称，可选
+            is_input_device: 是否为输入设备，可选
+            speaker_id: 说话人ID，可选
+            size: 每个维度返回的最大桶数量，默认100
+            
+        Returns:
+            dict: 包含总时长以及按说话人、设备分组时长的字典
+        """
+        try:
+            query = self._build_audio_transcription_query(
+                client_id=client_id,
+                start_time=start_time,
+                end_time=end_time,
+                device=device,
+                is_input_device=is_input_device,
+                speaker_id=speaker_id
+            )
+            
+            # 缺少起止时间的文档按0计算
+            talk_time = {
+                "sum": {
+                    "script": {
+                        "lang": "painless",
+                        "source": (
+                            "if (doc['start_time'].size() == 0 || doc['end_time'].size() == 0) { return 0; } "
+                            "return Math.max(0, doc['end_time'].value - doc['start_time'].value);"
+                        )
+                    }
+                }
+            }
+            
+            # 执行聚合查询
+            index_name = f"{settings.ES_INDEX_PREFIX}-audio-transcriptions"
+            
             result = await self.es_client.search(
                 index=index_name,
                 body={
                     "query": query,
                     "size": 0,
                     "aggs": {
-                        "windows": {
+                        "total_talk_time": talk_time,
+                        "speakers": {
                             "terms": {
-                                "field": "window_name",
-                                "size": 1000
-                            }
+                                "field": "speaker_id",
+                                "size": size,
+                                "order": {"talk_time": "desc"}
+                            },
+                            "aggs": {"talk_time": talk_time}
+                        },
+                        "devices": {
+                            "terms": {
+                                "field": "device",
+                                "size": size,
+                                "order": {"talk_time": "desc"}
+                            },
+                            "aggs": {"talk_time": talk_time}
                         }
                     }
                 }
             )
             
             # 处理结果
-            windows = [bucket["key"] for bucket in result["aggregations"]["windows"]["buckets"]]
+            aggregations = result["aggregations"]
             
-            return windows
+            speakers = [
+                {
+                    "speaker_id": bucket["key"],
+                    "segment_count": bucket["doc_count"],
+                    "talk_time_seconds": round(bucket["talk_time"]["value"], 2)
+                }
+                for bucket in aggregations["speakers"]["buckets"]
+            ]
+            
+            devices = [
+                {
+                    "device": bucket["key"],
+                    "segment_count": bucket["doc_count"],
+                    "talk_time_seconds": round(bucket["talk_time"]["value"], 2)
+                }
+                for bucket in aggregations["devices"]["buckets"]
+            ]
+            
+            return {
+                "total_talk_time_seconds": round(aggregations["total_talk_time"]["value"], 2),
+                "speakers": speakers,
+                "devices": devices
+            }
             
         except Exception as e:
-            logger.error(f"Error querying OCR text windows: {e}")
-            raise 
\ No newline at end of file
+            logger.error(f"Error querying audio talk time: {e}")
+            raise
+
+    def _build_audio_transcription_query(self,
+                                         client_id: str = None,
+                                         start_time: datetime = None,
+                                         end_time: datetime = None,
+                                         device: str = None,
+                                         is_input_device: bool = None,
+                                         speaker_id: int = None) -> dict:
+        """构建音频转录查询条件"""
+        query = {"bool": {"must": []}}
+        
+        # 添加客户端ID过滤
+        if client_id:
+            query["bool"]["must"].append({"term": {"client_id": client_id}})
+        
+        # 添加时间范围过滤
+        if start_time or end_time:
+            time_range = {}
+            if start_time:
+                time_range["gte"] = start_time.isoformat()
+            if end_time:
+                time_range["lte"] = end_time.isoformat()
+            query["bool"]["must"].append({"range": {"timestamp": time_range}})
+        
+        # 添加设备过滤
+        if device:
+            query["bool"]["must"].append({"term": {"device": device}})
+        
+        # 添加输入设备过滤
+        if is_input_device is not None:
+            query["bool"]["must"].append({"term": {"is_input_device": is_input_device}})
+        
+        # 添加说话人过滤
+        if speaker_id is not None:
+            query["bool"]["must"].append({"term": {"speaker_id": speaker_id}})
+        
+        return query
+
+    async def get_timeline(self,
+                           client_id: str,
+                           start_time: datetime = None,
+                           end_time: datetime = None,
+                           sources: list = None,
+                           limit: int = 100,
+                           cursor: str = None,
+                           sort_order: str = "asc"):
+        """
+        获取UI监控、OCR文本和音频转录按时间合并后的时间线
+        
+        每个索引各打开一个按时间排序的search_after流，边读取边做k路归并，
+        内存中每个数据源最多保留一页数据
+        
+        Args:
+            client_id: 客户端ID
+            start_time: 开始时间，可选
+            end_time: 结束时间，可选
+            sources: 数据源列表，取值为"ui"、"ocr"、"audio"，默认全部
+            limit: 返回事件数量限制，默认100
+            cursor: 上一页返回的游标，可选
+            sort_order: 排序顺序，"asc"或"desc"，默认"asc"
+            
+        Returns:
+            dict: 包含事件列表和下一页游标的字典
+        """
+        try:
+            sources = sources or list(TIMELINE_SOURCES.keys())
+            
+            # 游标记录每个数据源最后一条已返回事件的sort值
+            positions = decode_cursor(cursor, expected_type=dict) if cursor else {}
+            
+            # 构建查询
+            query = {"bool": {"must": [{"term": {"client_id": client_id}}]}}
+            
+            # 添加时间范围过滤
+            if start_time or end_time:
+                time_range = {}
+                if start_time:
+                    time_range["gte"] = start_time.isoformat()
+                if end_time:
+                    time_range["lte"] = end_time.isoformat()
+                query["bool"]["must"].append({"range": {"timestamp": time_range}})
+            
+            # 为每个数据源打开排序流
+            streams = {}
+            for source in sources:
+                index_suffix, tiebreaker = TIMELINE_SOURCES[source]
+                streams[source] = _SortedHitStream(
+                    self.es_client,
+                    f"{settings.ES_INDEX_PREFIX}-{index_suffix}",
+                    query,
+                    tiebreaker,
+                    page_size=limit,
+                    sort_order=sort_order,
+                    search_after=positions.get(source)
+                )
+            
+            # 降序时对sort值取反，使堆顶始终是下一条应返回的事件
+            sign = 1 if sort_order == "asc" else -1
+            
+            def heap_key(hit):
+                return [sign * value for value in hit["sort"]]
+            
+            heap = []
+            for source, stream in streams.items():
+                hit = await stream.next()
+                if hit is not None:
+                    heapq.heappush(heap, (heap_key(hit), source, hit))
+            
+            # k路归并
+            items = []
+            while heap and len(items) < limit:
+                _, source, hit = heapq.heappop(heap)
+                items.append({
+                    "type": source,
+                    "timestamp": hit["_source"].get("timestamp"),
+                    "data": hit["_source"]
+                })
+                positions[source] = hit["sort"]
+                
+                next_hit = await streams[source].next()
+                if next_hit is not None:
+                    heapq.heappush(heap, (heap_key(next_hit), source, next_hit))
+            
+            # 仍有未返回的事件时提供下一页游标
+            next_cursor = encode_cursor(positions) if heap else None
+            
+            return {
+                "items": items,
+                "limit": limit,
+                "next_cursor": next_cursor
+            }
+            
+        except ValueError:
+            raise
+        except Exception as e:
+            logger.error(f"Error querying timeline: {e}")
+            raise
@@ -5,17 +5,25 @@ from datetime import datetime, timedelta
 from ..core.config import settings
 from ..db.elasticsearch import get_es_client
 from ..db.mysql import AsyncSessionLocal
+from ..services.llm_result_cache import LLMResultCacheService
 from ..services.usage_analysis_service import UsageAnalysisService
+from ..services.work_summary_service import WorkSummaryService, summary_periods
 
 logger = logging.getLogger(__name__)
 
+# 整点后延迟一段时间再生成工作内容总结，等待窗口末尾的数据写入ES
+WORK_SUMMARY_DELAY = timedelta(minutes=5)
 
-async def recalculate_hourly_app_usage_statistics(hours_back: int = 24):
+
+async def recalculate_hourly_app_usage_statistics(
+    hours_back: int = 24, incremental: bool = False
+):
     """
     重新计算小时应用使用统计
 
     Args:
         hours_back: 重新计算多少小时前的数据
+        incremental: 是否基于水位增量计算
     """
     try:
         # 使用异步上下文管理器获取数据库会话
@@ -28,10 +36,14 @@ async def recalculate_hourly_app_usage_statistics(hours_back: int = 24):
                 usage_analysis_service = UsageAnalysisService(db, es_client)
 
                 # 重新计算小时统计
-                await usage_analysis_service.recalculate_hourly_statistics(hours_back)
+                metrics = await usage_analysis_service.recalculate_hourly_statistics(
+                    hours_back, incremental=incremental
+                )
 
                 logger.info(
-                    f"Completed recalculating hourly app usage statistics from the past {hours_back} hours"
+                    f"Completed recalculating hourly app usage statistics from the past {hours_back} hours: "
+                    f"{metrics['client_count']} clients, {metrics['failed_count']} failed, "
+                    f"{metrics['elapsed_seconds']}s"
                 )
 
             except Exception as e:
@@ -46,17 +58,64 @@ async def recalculate_hourly_app_usage_statistics(hours_back: int = 24):
         )
 
 
+async def purge_expired_llm_cache():
+    """清理过期的LLM分析结果缓存"""
+    try:
+        async with AsyncSessionLocal() as db:
+            deleted = await LLMResultCacheService(db).purge_expired()
+            logger.info(f"Purged {deleted} expired LLM result cache entries")
+    except Exception as e:
+        logger.error(f"Error in scheduled task purge_expired_llm_cache: {e}")
+
+
+async def precompute_work_summaries():
+    """为活跃客户端预先生成工作内容总结"""
+    periods = summary_periods()
+    if not periods:
+        return
+
+    try:
+        async with AsyncSessionLocal() as db:
+            es_client = await get_es_client()
+            service = WorkSummaryService(
+                openai_api_key=settings.OPENAI_API_KEY, es_client=es_client, db=db
+            )
+            await service.precompute_summaries(periods)
+    except Exception as e:
+        logger.error(f"Error in scheduled task precompute_work_summaries: {e}")
+
+
 async def schedule_tasks():
     """
     调度定时任务
     """
+    last_cache_purge = None
+    last_summary_hour = None
+    summary_task = None
     while True:
         try:
             logger.info("开始执行定时任务")
 
-            # 重新计算小时应用使用统计
-            # 这个任务会从ES中获取原始数据并重新计算统计信息
-            await recalculate_hourly_app_usage_statistics(hours_back=1)
+            # 增量计算小时应用使用统计
+            # 这个任务只从ES中获取各客户端水位之后的新数据，并累加到变化的小时统计上
+            await recalculate_hourly_app_usage_statistics(hours_back=1, incremental=True)
+
+            # 每小时清理一次过期的LLM分析结果缓存
+            now = datetime.utcnow()
+            if last_cache_purge is None or now - last_cache_purge >= timedelta(hours=1):
+                await purge_expired_llm_cache()
+                last_cache_purge = now
+
+            # 每小时在后台生成一次工作内容总结，模型调用耗时较长，不阻塞使用统计的增量计算；
+            # 上一次生成还未结束时跳过本小时
+            summary_hour = (now - WORK_SUMMARY_DELAY).replace(
+                minute=0, second=0, microsecond=0
+            )
+            if summary_hour != last_summary_hour and (
+                summary_task is None or summary_task.done()
+            ):
+                summary_task = asyncio.create_task(precompute_work_summaries())
+                last_summary_hour = summary_hour
 
             logger.info("定时任务执行完成")
 
@@ -0,0 +1,120 @@
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+_EPOCH = datetime(1970, 1, 1)
+
+
+def _parse_iso(value: str) -> datetime:
+    """ISO格式，如 2025-03-02T15:20:24.000Z"""
+    return datetime.fromisoformat(value)
+
+
+def _parse_kibana(value: str) -> datetime:
+    """ES特有格式，如 Mar 2, 2025 @ 15:20:24.000"""
+    return datetime.strptime(value, "%b %d, %Y @ %H:%M:%S.%f")
+
+
+def _parse_epoch_millis(value: str) -> datetime:
+    """毫秒时间戳字符串，如 1740928824000"""
+    return _EPOCH + timedelta(milliseconds=int(value))
+
+
+_STRING_PARSERS: List[Callable[[str], datetime]] = [
+    _parse_iso,
+    _parse_kibana,
+    _parse_epoch_millis,
+]
+
+
+class TimestampDecoder:
+    """
+    ES命中的时间解码器，返回UTC时间加上offset后的不带时区的时间
+
+    查询时通过docvalue_fields以epoch_millis格式取回时间，每条记录只需一次整数转换；
+    命中中没有该字段时解析_source中的时间字符串，识别出的格式会被缓存，
+    后续同格式的字符串直接使用对应的解析函数
+    """
+
+    def __init__(self, field: str = "timestamp", offset: timedelta = timedelta(0)):
+        self.field = field
+        self.offset = offset
+        self._base = _EPOCH + offset
+        self._parser: Optional[Callable[[str], datetime]] = None
+        self.failure_count = 0
+
+    @staticmethod
+    def docvalue_fields(field: str = "timestamp") -> List[Dict[str, str]]:
+        """查询体中的docvalue_fields参数，让ES以毫秒时间戳返回时间字段"""
+        return [{"field": field, "format": "epoch_millis"}]
+
+    def decode_hit(self, hit: Dict) -> Optional[datetime]:
+        """
+        解码ES命中中的时间
+
+        Args:
+            hit: ES命中
+
+        Returns:
+            Optional[datetime]: 加上offset后的时间，无法解析时返回None
+        """
+        values = hit.get("fields", {}).get(self.field)
+        if values:
+            # epoch_millis格式返回的是字符串，日期字段精确到毫秒；
+            # timedelta按位置传参(days, seconds, microseconds, milliseconds)比关键字参数快
+            return self._base + timedelta(0, 0, 0, int(values[0]))
+
+        timestamp = self.parse(hit["_source"].get(self.field))
+        return timestamp + self.offset if timestamp is not None else None
+
+    def parse(self, value: Any) -> Optional[datetime]:
+        """
+        解析时间值，支持datetime、毫秒时间戳和常见的时间字符串
+
+        Args:
+            value: 时间值
+
+        Returns:
+            Optional[datetime]: UTC时间（不加offset），无法解析时返回None
+        """
+        if isinstance(value, datetime):
+            return self._to_naive_utc(value)
+        if isinstance(value, (int, float)):
+            return _EPOCH + timedelta(milliseconds=value)
+        if not isinstance(value, str):
+            return self._fail(value)
+
+        # 先用上次识别出的格式解析
+        if self._parser is not None:
+            try:
+                return self._to_naive_utc(self._parser(value))
+            except ValueError:
+                pass
+
+        for parser in _STRING_PARSERS:
+            if parser is self._parser:
+                continue
+            try:
+                timestamp = parser(value)
+            except ValueError:
+                continue
+            self._parser = parser
+            return self._to_naive_utc(timestamp)
+
+        return self._fail(value)
+
+    def _fail(self, value: Any) -> None:
+        # 只记录第一次失败，避免逐条记录刷屏
+        self.failure_count += 1
+        if self.failure_count == 1:
+            logger.warning(f"无法解析时间戳: {value!r}，跳过该记录")
+        return None
+
+    @staticmethod
+    def _to_naive_utc(timestamp: datetime) -> datetime:
+        # 带时区的时间统一转换为UTC，避免与不带时区的时间混合计算
+        if timestamp.tzinfo is not None:
+            return timestamp.astimezone(timezone.utc).replace(tzinfo=None)
+        return timestamp
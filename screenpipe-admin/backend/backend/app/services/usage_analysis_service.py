@@ -1,24 +1,52 @@
+import asyncio
 import logging
+import time
 from datetime import date, datetime, timedelta
-from typing import Any, Dict, List, Optional, Tuple
+from itertools import groupby
+from operator import itemgetter
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
 
 from elasticsearch import AsyncElasticsearch
-from sqlalchemy import delete, select
+from sqlalchemy import case, delete, func, select, tuple_
+from sqlalchemy.dialects.mysql import insert as mysql_insert
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from ..core.config import settings
-from ..models.app_usage import AppCategory, HourlyAppUsage
+from ..db.mysql import AsyncSessionLocal
+from ..models.app_usage import (
+    AppCategory,
+    AppSession,
+    HourlyAppUsage,
+    UsageWatermark,
+)
 from ..models.data import DataReport
+from ..services.app_category_matcher import app_category_matcher
 from ..services.app_usage_service import AppUsageService, ProductivityType
+from ..services.timestamp_decoder import TimestampDecoder
+from ..services.usage_engine import (
+    LOCK_SCREEN_APP,
+    NUMPY_AVAILABLE,
+    count_by_group,
+    group_hourly_durations,
+    sum_by_group,
+    to_epoch_microseconds,
+)
+from ..services.usage_query_cache import usage_query_cache
 
 logger = logging.getLogger(__name__)
 
+# 计算应用使用统计只需要UI监控文档中的这些字段
+UI_SOURCE_FIELDS = ["timestamp", "app", "window"]
+
 
 class UsageAnalysisService:
     def __init__(self, db: AsyncSession, es_client: AsyncElasticsearch):
         self.db = db
         self.es_client = es_client
         self.app_usage_service = AppUsageService(db, es_client)
+        self.use_columnar_engine = NUMPY_AVAILABLE
+        # ES中的时间是UTC，应用使用记录使用北京时间
+        self.timestamp_decoder = TimestampDecoder(offset=timedelta(hours=8))
 
     def _calculate_app_usage_duration(self, app_usage_data: List[Dict]) -> List[Dict]:
         """
@@ -85,53 +113,138 @@ class UsageAnalysisService:
             List[Dict]: 小时级别的应用使用统计记录
         """
         hourly_app_data = {}
+        self._accumulate_hourly_usage(hourly_app_data, app_usage_data)
+        return await self._build_hourly_usage_records(client_id, hourly_app_data)
+
+    def _accumulate_hourly_usage(
+        self,
+        hourly_app_data: Dict[str, Dict],
+        app_usage_data: List[Dict],
+        next_record: Optional[Dict] = None,
+    ):
+        """
+        将已计算持续时间的应用使用数据按应用和小时累加到hourly_app_data中，并统计应用切换次数
+
+        相邻两条记录的应用不同时记为一次切换，切出计入前一条记录所在的小时，切入计入
+        后一条记录所在的小时。可以对同一个hourly_app_data多次调用，以便逐页处理数据
+
+        Args:
+            hourly_app_data: 按应用和小时聚合的数据，会被原地更新
+            app_usage_data: 应用使用数据列表，其中timestamp字段是北京时间
+            next_record: 紧跟在app_usage_data之后、留到下一页处理的记录，可选
+        """
         lock_screen_app = "loginwindow"  # 锁屏状态的应用名称
 
         # 按应用和小时聚合数据
-        for item in app_usage_data:
-            # 跳过锁屏应用
-            if item["app_name"] == lock_screen_app:
-                continue
-                
-            # 跳过持续时间为0的记录
-            if item["duration"] <= 0:
-                continue
-                
-            timestamp = item["timestamp"]  # 这里的timestamp是北京时间
-            app_name = item["app_name"]
-            duration = item["duration"]
-            is_active = item["is_active"]
-
-            # 生成小时键（应用名+时间戳的小时部分）
-            hour_key = f"{app_name}_{timestamp.strftime('%Y-%m-%d_%H')}"
-            hour_timestamp = datetime(
-                timestamp.year, timestamp.month, timestamp.day, timestamp.hour
+        for index, item in enumerate(app_usage_data):
+            following = (
+                app_usage_data[index + 1]
+                if index + 1 < len(app_usage_data)
+                else next_record
             )
+            switched = following is not None and following["app_name"] != item["app_name"]
 
-            # 初始化该小时的应用数据
-            if hour_key not in hourly_app_data:
-                hourly_app_data[hour_key] = {
-                    "app_name": app_name,
-                    "timestamp": hour_timestamp,  # 这是北京时间的小时时间戳
-                    "hour_of_day": timestamp.hour,
-                    "day_of_week": timestamp.weekday(),
-                    "is_working_hour": self._is_working_hour(timestamp),
-                    "total_time_seconds": 0,
-                    "last_timestamp": None,
-                }
+            # 跳过锁屏应用，以及持续时间为0且没有发生切换的记录
+            if item["app_name"] != lock_screen_app and (
+                item["duration"] > 0 or switched
+            ):
+                timestamp = item["timestamp"]  # 这里的timestamp是北京时间
+
+                # 更新统计数据
+                hourly_data = self._get_hourly_entry(
+                    hourly_app_data, item["app_name"], timestamp
+                )
+                if item["duration"] > 0:
+                    hourly_data["total_time_seconds"] += item["duration"]
+                hourly_data["switch_count"] += switched
+
+            # 切入下一个应用
+            if switched and following["app_name"] != lock_screen_app:
+                hourly_data = self._get_hourly_entry(
+                    hourly_app_data, following["app_name"], following["timestamp"]
+                )
+                hourly_data["switch_count"] += 1
+
+    def _accumulate_hourly_usage_columnar(
+        self, hourly_app_data: Dict[str, Dict], app_usage_data: List[Dict]
+    ) -> Dict:
+        """
+        以列式方式计算一页记录的持续时间并按应用和小时累加到hourly_app_data中
+
+        结果与依次调用_calculate_app_usage_duration和_accumulate_hourly_usage相同，
+        但排序、求时间差、统计切换和分组求和都在NumPy数组上完成
 
-            # 更新统计数据
-            hourly_data = hourly_app_data[hour_key]
-            hourly_data["total_time_seconds"] += duration
+        Args:
+            hourly_app_data: 按应用和小时聚合的数据，会被原地更新
+            app_usage_data: 应用使用数据列表，其中timestamp字段是北京时间
+
+        Returns:
+            Dict: 按时间排序后的最后一条记录，其持续时间要等到后续记录才能确定
+        """
+        groups, group_index, seconds, switches, last_index = group_hourly_durations(
+            to_epoch_microseconds([item["timestamp"] for item in app_usage_data]),
+            [item["app_name"] for item in app_usage_data],
+        )
+
+        entries = [
+            self._get_hourly_entry(hourly_app_data, app_name, hour_start)
+            for app_name, hour_start in groups
+        ]
+        totals = sum_by_group(
+            group_index, seconds, [entry["total_time_seconds"] for entry in entries]
+        )
+        switch_counts = count_by_group(
+            group_index, switches, [entry["switch_count"] for entry in entries]
+        )
+        for entry, total, switch_count in zip(entries, totals, switch_counts):
+            entry["total_time_seconds"] = total
+            entry["switch_count"] = switch_count
+
+        last_record = app_usage_data[last_index]
+        last_record["duration"] = 0
+        return last_record
+
+    def _get_hourly_entry(
+        self, hourly_app_data: Dict[str, Dict], app_name: str, timestamp: datetime
+    ) -> Dict:
+        """获取应用在timestamp所在小时的聚合数据，不存在时初始化"""
+        # 生成小时键（应用名+时间戳的小时部分）
+        hour_key = f"{app_name}_{timestamp.strftime('%Y-%m-%d_%H')}"
+
+        # 初始化该小时的应用数据
+        if hour_key not in hourly_app_data:
+            hourly_app_data[hour_key] = {
+                "app_name": app_name,
+                "timestamp": datetime(
+                    timestamp.year, timestamp.month, timestamp.day, timestamp.hour
+                ),  # 这是北京时间的小时时间戳
+                "hour_of_day": timestamp.hour,
+                "day_of_week": timestamp.weekday(),
+                "is_working_hour": self._is_working_hour(timestamp),
+                "total_time_seconds": 0,
+                "switch_count": 0,
+            }
 
-            hourly_data["last_timestamp"] = timestamp
+        return hourly_app_data[hour_key]
 
-        # 转换为最终的记录格式
+    async def _build_hourly_usage_records(
+        self, client_id: str, hourly_app_data: Dict[str, Dict]
+    ) -> List[Dict]:
+        """
+        将按应用和小时聚合的数据转换为小时应用使用统计记录
+
+        Args:
+            client_id: 客户端ID
+            hourly_app_data: 按应用和小时聚合的数据
+
+        Returns:
+            List[Dict]: 小时级别的应用使用统计记录
+        """
         hourly_records = []
 
         for hour_key, hourly_data in hourly_app_data.items():
-            # 跳过总时间为0的记录
-            if hourly_data["total_time_seconds"] <= 0:
+            # 跳过总时间为0且没有切换的记录
+            if hourly_data["total_time_seconds"] <= 0 and not hourly_data["switch_count"]:
                 continue
                 
             # 匹配应用类别 - 这里已经返回类别ID
@@ -146,6 +259,7 @@ class UsageAnalysisService:
                 "duration_minutes": round(
                     hourly_data["total_time_seconds"] / 60, 2
                 ),  # 转换为分钟
+                "switch_count": hourly_data["switch_count"],
                 "client_id": client_id,
             }
 
@@ -183,28 +297,10 @@ class UsageAnalysisService:
             int: 类别ID
         """
         try:
-            # 直接查询精确匹配的类别
-            exact_query = select(AppCategory).where(AppCategory.name.ilike(app_name))
-            result = await self.db.execute(exact_query)
-            category = result.scalars().first()
-
-            if category:
-                return category.id
-
-            # 尝试部分匹配
-            # 由于SQLAlchemy不支持直接的包含查询，我们获取所有类别然后在Python中过滤
-            all_query = select(AppCategory)
-            result = await self.db.execute(all_query)
-            all_categories = result.scalars().all()
-
-            app_name_lower = app_name.lower()
-            for category in all_categories:
-                category_name_lower = category.name.lower()
-                if (
-                    category_name_lower in app_name_lower
-                    or app_name_lower in category_name_lower
-                ):
-                    return category.id
+            # 使用内存中编译好的类别规则匹配，结果按应用名称缓存
+            category_id = await app_category_matcher.match(self.db, app_name)
+            if category_id is not None:
+                return category_id
 
             # 如果没有匹配，获取默认类别ID
             default_category_id = await self._get_or_create_default_category()
@@ -230,12 +326,10 @@ class UsageAnalysisService:
         """
         try:
             # 尝试获取"未分类"类别
-            query = select(AppCategory).where(AppCategory.name == "未分类")
-            result = await self.db.execute(query)
-            category = result.scalars().first()
+            category_id = await app_category_matcher.get_by_name(self.db, "未分类")
 
-            if category:
-                return category.id  # 返回类别ID
+            if category_id is not None:
+                return category_id  # 返回类别ID
 
             # 如果不存在，创建默认类别
             default_category = await self.app_usage_service.create_app_category(
@@ -250,7 +344,7 @@ class UsageAnalysisService:
             return 1
 
     async def recalculate_hourly_statistics(
-        self, hours_back: int = 24, client_id: str = None
+        self, hours_back: int = 24, client_id: str = None, incremental: bool = False
     ):
         """
         重新计算过去几个小时的应用使用统计
@@ -258,6 +352,11 @@ class UsageAnalysisService:
         Args:
             hours_back: 重新计算多少小时前的数据
             client_id: 客户端ID，如果为None则处理所有客户端
+            incremental: 是否增量计算。为True时，已有水位的客户端只处理水位之后的新记录，
+                并把新增的使用时间累加到对应的小时记录上；没有水位的客户端按全量方式计算
+
+        Returns:
+            Dict[str, Any]: 本次运行的指标，包括客户端数量、失败数量、总耗时和最慢的客户端
         """
         try:
             # 计算时间范围 - 使用UTC时间
@@ -270,107 +369,600 @@ class UsageAnalysisService:
                 f"开始重新计算从 {start_time_utc} UTC 到 {end_time_utc} UTC 的小时应用使用统计"
             )
 
-            # 从ES中获取原始UI监控数据
-            from ..services.query_service import QueryService
-
-            query_service = QueryService(self.es_client)
-
             # 获取需要处理的客户端列表
             client_ids = (
                 [client_id]
                 if client_id
-                else await self._get_active_client_ids(start_time_utc, end_time_utc)
+                else await self.get_active_client_ids(start_time_utc, end_time_utc)
             )
 
-            for cid in client_ids:
-                logger.info(f"处理客户端 {cid} 的数据")
-
-                # 获取该客户端在时间范围内的所有UI监控数据
-                ui_data = await query_service.get_ui_monitoring_by_time(
-                    client_id=cid,
-                    start_time=start_time_utc,
-                    end_time=end_time_utc,
-                    limit=10000,  # 设置一个较大的限制以获取所有数据
-                )
-
-                if not ui_data or "items" not in ui_data or not ui_data["items"]:
-                    logger.info(f"客户端 {cid} 在指定时间范围内没有UI监控数据")
-                    continue
+            # 每个客户端使用独立的数据库会话并发处理，单个客户端出错不影响其他客户端
+            semaphore = asyncio.Semaphore(settings.USAGE_RECALC_CONCURRENCY)
+            run_started = time.monotonic()
 
-                # 提取并处理UI监控数据
-                app_usage_data = []
-                for item in ui_data["items"]:
-                    timestamp_str = item["timestamp"]
-                    # 解析时间戳
+            async def process_client(cid: str) -> Dict[str, Any]:
+                async with semaphore:
+                    started = time.monotonic()
                     try:
-                        if isinstance(timestamp_str, str):
-                            if "T" in timestamp_str or "+" in timestamp_str:
-                                # ISO格式
-                                timestamp = datetime.fromisoformat(
-                                    timestamp_str.replace("Z", "+00:00")
-                                )
-                            elif "@" in timestamp_str:
-                                # ES特有格式 "Mar 2, 2025 @ 15:20:24.000"
-                                clean_ts = timestamp_str.replace(" @ ", " ")
-                                timestamp = datetime.strptime(
-                                    clean_ts, "%b %d, %Y %H:%M:%S.%f"
-                                )
-                            else:
-                                # 尝试其他格式
-                                timestamp = datetime.fromisoformat(timestamp_str)
-                        elif isinstance(timestamp_str, datetime):
-                            timestamp = timestamp_str
-                        else:
-                            logger.warning(
-                                f"未知时间戳类型: {type(timestamp_str)}，使用当前北京时间"
+                        async with AsyncSessionLocal() as db:
+                            worker = UsageAnalysisService(db, self.es_client)
+                            record_count = await worker._recalculate_client(
+                                cid, start_time_utc, end_time_utc, incremental
                             )
-                            timestamp = datetime.utcnow()
-                    except ValueError as e:
-                        logger.warning(
-                            f"无法解析时间戳: {timestamp_str}，错误: {e}，使用当前北京时间"
-                        )
-                        timestamp = datetime.utcnow()
-
-                    app_usage_data.append(
-                        {
-                            "timestamp": timestamp + timedelta(hours=8),  # 这里的timestamp是北京时间
-                            "app_name": item["app"],
-                            "duration": 0,  # 初始化持续时间为0
-                            "is_active": True,  # 假设所有记录的UI都是活跃的
-                        }
-                    )
-
-                # 计算持续时间
-                app_usage_data = self._calculate_app_usage_duration(app_usage_data)
+                        error = None
+                    except Exception as e:
+                        logger.error(f"处理客户端 {cid} 的数据时出错: {e}")
+                        record_count = 0
+                        error = str(e)
+
+                    elapsed = round(time.monotonic() - started, 3)
+                    logger.info(f"客户端 {cid} 处理完成，耗时 {elapsed} 秒")
+                    return {
+                        "client_id": cid,
+                        "record_count": record_count,
+                        "elapsed_seconds": elapsed,
+                        "error": error,
+                    }
 
-                # 生成小时级别的应用使用统计
-                hourly_usage_records = await self._generate_hourly_usage_records(
-                    cid, app_usage_data
-                )
+            client_metrics = await asyncio.gather(
+                *(process_client(cid) for cid in client_ids)
+            )
 
-                # 清除该客户端在时间范围内的现有记录
-                await self._clear_existing_hourly_records(
-                    cid, start_time_utc, end_time_utc
-                )
+            failed = [m for m in client_metrics if m["error"]]
+            metrics = {
+                "client_count": len(client_ids),
+                "failed_count": len(failed),
+                "elapsed_seconds": round(time.monotonic() - run_started, 3),
+                "slowest_clients": sorted(
+                    client_metrics, key=lambda m: m["elapsed_seconds"], reverse=True
+                )[:5],
+                "failed_clients": [m["client_id"] for m in failed],
+            }
 
-                # 批量保存新的统计记录
-                if hourly_usage_records:
-                    await self.app_usage_service.batch_record_hourly_app_usage(
-                        hourly_usage_records
-                    )
-                    logger.info(
-                        f"为客户端 {cid} 重新计算并保存了 {len(hourly_usage_records)} 条小时应用使用统计"
-                    )
-                else:
-                    logger.info(f"客户端 {cid} 没有生成小时应用使用统计记录")
+            logger.info(
+                f"小时应用使用统计重新计算完成：{metrics['client_count']} 个客户端，"
+                f"失败 {metrics['failed_count']} 个，总耗时 {metrics['elapsed_seconds']} 秒"
+            )
 
-            logger.info("小时应用使用统计重新计算完成")
+            return metrics
 
         except Exception as e:
             logger.error(f"重新计算小时应用使用统计时出错: {e}")
             raise
 
-    async def _get_active_client_ids(
+    async def backfill_client_range(
+        self, client_id: str, start_time_utc: datetime, end_time_utc: datetime
+    ) -> int:
+        """
+        全量重建单个客户端在历史时间范围内的小时统计和应用会话
+
+        与定时任务使用相同的计算逻辑，并在范围两端各多取一条相邻记录：之前的一条用于
+        统计范围内第一条记录的切入，之后的一条用于确定最后一条记录的时长和切出。
+        只写入范围内的小时统计，因此按天分块回填的结果与连续计算一致，重复回填同一
+        范围的结果也不变
+
+        回填不修改水位。范围必须早于增量计算水位（没有水位时早于定时任务全量计算的
+        范围），否则会与定时任务同时重建或累加同一段数据
+
+        Args:
+            client_id: 客户端ID
+            start_time_utc: 开始时间 (UTC)，应对齐到整点
+            end_time_utc: 结束时间 (UTC)，包含该时刻
+
+        Returns:
+            int: 处理的UI监控记录数
+
+        Raises:
+            ValueError: 范围的结束时间不早于定时任务处理的位置
+        """
+        watermark = await self._get_watermark(client_id)
+        if watermark:
+            cutoff = datetime(1970, 1, 1) + timedelta(
+                milliseconds=watermark.last_sort_timestamp
+            )
+        else:
+            # 没有水位的客户端由定时任务全量计算最近一小时的数据
+            cutoff = (datetime.utcnow() - timedelta(hours=1)).replace(
+                minute=0, second=0, microsecond=0
+            )
+        if end_time_utc >= cutoff:
+            raise ValueError(
+                f"客户端 {client_id} 的回填范围必须早于 {cutoff} UTC，"
+                f"之后的数据由定时任务增量计算"
+            )
+
+        return await self._recalculate_client_full(
+            client_id, start_time_utc, end_time_utc, backfill=True
+        )
+
+    async def _recalculate_client(
+        self,
+        client_id: str,
+        start_time_utc: datetime,
+        end_time_utc: datetime,
+        incremental: bool = False,
+    ) -> int:
+        """
+        计算单个客户端的小时统计，有水位且要求增量时走增量计算，否则全量计算
+
+        Args:
+            client_id: 客户端ID
+            start_time_utc: 全量计算的开始时间 (UTC)
+            end_time_utc: 全量计算的结束时间 (UTC)
+            incremental: 是否增量计算
+
+        Returns:
+            int: 处理的UI监控记录数
+        """
+        logger.info(f"处理客户端 {client_id} 的数据")
+
+        watermark = await self._get_watermark(client_id) if incremental else None
+
+        if watermark:
+            return await self._recalculate_client_incremental(client_id, watermark)
+        return await self._recalculate_client_full(
+            client_id, start_time_utc, end_time_utc
+        )
+
+    async def _recalculate_client_full(
+        self,
+        client_id: str,
+        start_time_utc: datetime,
+        end_time_utc: datetime,
+        backfill: bool = False,
+    ) -> int:
+        """
+        全量重新计算客户端在时间范围内的小时统计：清除现有记录后重新写入，并更新水位
+
+        Args:
+            client_id: 客户端ID
+            start_time_utc: 开始时间 (UTC)
+            end_time_utc: 结束时间 (UTC)
+            backfill: 是否为历史回填。为True时使用范围两端的相邻记录计算边界，
+                只写入范围内的小时统计，并且不更新水位
+
+        Returns:
+            int: 处理的UI监控记录数
+        """
+        from ..services.query_service import QueryService
+
+        query_service = QueryService(self.es_client)
+
+        # 回填时从范围之前的最后一条记录开始，范围内第一条记录的切入才能被统计
+        carry = None
+        if backfill:
+            carry = await self._get_adjacent_record(
+                query_service,
+                client_id,
+                # ES时间精确到毫秒，不包含开始时刻
+                end_time=start_time_utc - timedelta(milliseconds=1),
+                sort_order="desc",
+            )
+
+        # 逐页遍历该客户端在时间范围内的全部UI监控数据
+        pages = query_service.iter_ui_monitoring_pages(
+            client_id,
+            start_time=start_time_utc,
+            end_time=end_time_utc,
+            source_fields=UI_SOURCE_FIELDS,
+        )
+        hourly_app_data, first_record, last_record, last_hit, record_count, sessions = (
+            await self._accumulate_ui_stream(pages, carry)
+        )
+
+        if last_hit is None:
+            logger.info(f"客户端 {client_id} 在指定时间范围内没有UI监控数据")
+            return 0
+
+        # 记录的时间全部无法解析时没有可重建的数据，保留现有统计和会话
+        if first_record is None:
+            logger.warning(f"客户端 {client_id} 在指定时间范围内没有可解析的UI监控记录，跳过重新计算")
+            return 0
+
+        if backfill:
+            # 范围之后的第一条记录确定最后一条记录的时长和切出，最后一个会话也在这里结束
+            following = await self._get_adjacent_record(
+                query_service, client_id, search_after=last_hit["sort"]
+            )
+            if following:
+                self._accumulate_page(hourly_app_data, [last_record, following])
+                if sessions and last_record["app_name"] != LOCK_SCREEN_APP:
+                    sessions[-1]["end_time"] = following["timestamp"]
+
+            # 相邻记录所在的小时属于相邻的范围，只保留会被清除并重建的小时
+            beijing_start_time = start_time_utc + timedelta(hours=8)
+            beijing_end_time = end_time_utc + timedelta(hours=8)
+            hourly_app_data = {
+                key: hourly_data
+                for key, hourly_data in hourly_app_data.items()
+                if beijing_start_time <= hourly_data["timestamp"] <= beijing_end_time
+            }
+
+        # 生成小时级别的应用使用统计
+        hourly_usage_records = await self._build_hourly_usage_records(
+            client_id, hourly_app_data
+        )
+
+        # 清除现有记录、写入新记录和更新水位在同一个事务中完成
+        try:
+            # 清除该客户端在时间范围内的现有记录和会话
+            await self._clear_existing_hourly_records(
+                client_id, start_time_utc, end_time_utc, commit=False
+            )
+            await self._clear_existing_sessions(
+                client_id, start_time_utc, end_time_utc, first_record["timestamp"]
+            )
+
+            # 批量保存新的统计记录和会话
+            await self.app_usage_service.batch_record_hourly_app_usage(
+                hourly_usage_records, commit=False
+            )
+            await self.app_usage_service.save_app_sessions(
+                client_id, sessions, commit=False
+            )
+
+            # 以本次处理的最后一条记录作为水位，后续增量计算从这里继续
+            if not backfill:
+                await self._save_watermark(client_id, last_record, last_hit["sort"])
+
+            await self.db.commit()
+        except Exception:
+            await self.db.rollback()
+            raise
+
+        usage_query_cache.invalidate(client_id)
+
+        logger.info(
+            f"为客户端 {client_id} 处理了 {record_count} 条记录，"
+            f"重新计算并保存了 {len(hourly_usage_records)} 条小时应用使用统计"
+            f"和 {len(sessions)} 个应用会话"
+        )
+        return record_count
+
+    async def _recalculate_client_incremental(
+        self, client_id: str, watermark: UsageWatermark
+    ) -> int:
+        """
+        增量计算客户端的小时统计
+
+        只从ES获取水位之后的新记录，并带上水位处的边界记录：边界记录上次作为最后一条记录
+        时长为0，现在有了后继记录才能确定其时长。计算出的时长作为增量累加到对应小时，
+        只有发生变化的小时记录会被更新
+
+        Args:
+            client_id: 客户端ID
+            watermark: 客户端当前水位
+
+        Returns:
+            int: 处理的UI监控记录数
+        """
+        from ..services.query_service import QueryService
+
+        query_service = QueryService(self.es_client)
+
+        # 边界记录，时间取自毫秒精度的ES排序值（数据库DATETIME列只精确到秒）
+        boundary = {
+            "timestamp": datetime(1970, 1, 1)
+            + timedelta(milliseconds=watermark.last_sort_timestamp, hours=8),
+            "app_name": watermark.last_app_name,
+            "window_name": "",  # 水位不记录窗口名称，以数据库中的会话为准
+            "duration": 0,
+            "is_active": True,
+        }
+
+        # 边界记录所在的会话尚未结束，新记录从它继续
+        open_session = await self._get_open_session(client_id, boundary)
+
+        pages = query_service.iter_ui_monitoring_pages(
+            client_id,
+            search_after=[watermark.last_sort_timestamp, watermark.last_monitoring_id],
+            source_fields=UI_SOURCE_FIELDS,
+        )
+        hourly_app_data, _, last_record, last_hit, record_count, sessions = (
+            await self._accumulate_ui_stream(pages, boundary, open_session)
+        )
+
+        if last_hit is None:
+            logger.info(f"客户端 {client_id} 自上次水位后没有新的UI监控数据")
+            return 0
+
+        # 生成小时级别的增量统计
+        hourly_usage_records = await self._build_hourly_usage_records(
+            client_id, hourly_app_data
+        )
+
+        # 增量累加到现有小时记录、保存会话并推进水位，在同一个事务中完成，避免重复累加
+        try:
+            await self.app_usage_service.batch_record_hourly_app_usage(
+                hourly_usage_records, commit=False
+            )
+            await self.app_usage_service.save_app_sessions(
+                client_id, sessions, commit=False
+            )
+            await self._save_watermark(client_id, last_record, last_hit["sort"])
+
+            await self.db.commit()
+        except Exception:
+            await self.db.rollback()
+            raise
+
+        usage_query_cache.invalidate(client_id)
+
+        logger.info(
+            f"客户端 {client_id} 增量处理了 {record_count} 条新记录，"
+            f"更新了 {len(hourly_usage_records)} 个小时统计和 {len(sessions)} 个应用会话"
+        )
+        return record_count
+
+    async def _accumulate_ui_stream(
+        self,
+        pages: AsyncIterator[List[Dict]],
+        carry: Optional[Dict] = None,
+        session: Optional[Dict] = None,
+    ) -> Tuple[
+        Dict[str, Dict], Optional[Dict], Optional[Dict], Optional[Dict], int, List[Dict]
+    ]:
+        """
+        逐页计算UI监控数据流的持续时间并按应用和小时累加，同时合并出应用会话
+
+        每页的最后一条记录要等到下一页的第一条记录才能确定持续时间，因此作为
+        carry带入下一页；内存中只保留一页数据和按小时聚合的结果
+
+        Args:
+            pages: 按时间升序的ES命中分页
+            carry: 上次处理留下的边界记录，可选
+            session: 边界记录所在的未结束会话，可选
+
+        Returns:
+            Tuple: (按应用和小时聚合的数据, 第一条记录, 最后一条记录, 最后一条ES命中,
+                处理的记录数, 应用会话列表)，会话列表的最后一个会话可能尚未结束
+        """
+        hourly_app_data = {}
+        sessions = []
+        first_record = None
+        last_hit = None
+        record_count = 0
+
+        async for hits in pages:
+            records = [
+                record
+                for record in map(self._to_app_usage_record, hits)
+                if record is not None
+            ]
+            if records:
+                if first_record is None:
+                    first_record = records[0]
+                session = self._accumulate_sessions(sessions, session, records)
+
+                app_usage_data = [carry] if carry else []
+                app_usage_data.extend(records)
+
+                # 计算持续时间并累加，最后一条记录留到下一页
+                carry = self._accumulate_page(hourly_app_data, app_usage_data)
+
+            last_hit = hits[-1]
+            record_count += len(hits)
+
+        if self.timestamp_decoder.failure_count:
+            logger.warning(
+                f"共有 {self.timestamp_decoder.failure_count} 条UI监控记录的时间无法解析，已跳过"
+            )
+
+        # 最后一个会话尚未结束，同样保存，后续增量计算会继续更新它
+        if session and session["app_name"] != LOCK_SCREEN_APP:
+            sessions.append(session)
+
+        return hourly_app_data, first_record, carry, last_hit, record_count, sessions
+
+    def _accumulate_sessions(
+        self, sessions: List[Dict], session: Optional[Dict], records: List[Dict]
+    ) -> Optional[Dict]:
+        """
+        将按时间升序的记录合并为应用会话
+
+        连续使用同一应用窗口的记录合并为一个会话，会话在切换到下一个应用窗口时结束，
+        时长与小时统计的计算方式一致；锁屏期间不产生会话
+
+        Args:
+            sessions: 已结束的会话列表，会被原地追加
+            session: 当前尚未结束的会话，可选
+            records: 按时间升序的应用使用记录
+
+        Returns:
+            Optional[Dict]: 处理完这些记录后尚未结束的会话
+        """
+        for key, group in groupby(records, key=itemgetter("app_name", "window_name")):
+            group = list(group)
+
+            if session and (session["app_name"], session["window_name"]) == key:
+                session["end_time"] = group[-1]["timestamp"]
+                session["record_count"] += len(group)
+                continue
+
+            if session:
+                # 切换到其他应用窗口的时刻即为会话结束时间
+                session["end_time"] = group[0]["timestamp"]
+                if session["app_name"] != LOCK_SCREEN_APP:
+                    sessions.append(session)
+
+            session = {
+                "app_name": key[0],
+                "window_name": key[1],
+                "start_time": group[0]["timestamp"],
+                "end_time": group[-1]["timestamp"],
+                "record_count": len(group),
+            }
+
+        return session
+
+    async def _get_open_session(self, client_id: str, boundary: Dict) -> Dict:
+        """
+        获取水位处边界记录所在的未结束会话
+
+        Args:
+            client_id: 客户端ID
+            boundary: 水位处的边界记录
+
+        Returns:
+            Dict: 未结束的会话；数据库中没有对应会话时（例如边界记录是锁屏），
+                从边界记录开始一个新的会话
+        """
+        result = await self.db.execute(
+            select(AppSession)
+            .where(AppSession.user_id == client_id)
+            .order_by(AppSession.start_time.desc())
+            .limit(1)
+        )
+        latest = result.scalars().first()
+
+        # 边界记录的时间来自毫秒精度的ES排序值
+        if (
+            latest
+            and latest.app_name == boundary["app_name"]
+            and abs(latest.end_time - boundary["timestamp"]) < timedelta(milliseconds=1)
+        ):
+            return {
+                "id": latest.id,
+                "app_name": latest.app_name,
+                "window_name": latest.window_name,
+                "start_time": latest.start_time,
+                "end_time": latest.end_time,
+                "record_count": latest.record_count,
+            }
+
+        return {
+            "app_name": boundary["app_name"],
+            "window_name": boundary["window_name"],
+            "start_time": boundary["timestamp"],
+            "end_time": boundary["timestamp"],
+            "record_count": 1,
+        }
+
+    def _accumulate_page(
+        self, hourly_app_data: Dict[str, Dict], app_usage_data: List[Dict]
+    ) -> Dict:
+        """
+        计算一页记录的持续时间并累加到hourly_app_data中，安装了NumPy时使用列式实现
+
+        Returns:
+            Dict: 按时间排序后的最后一条记录，留到下一页计算持续时间
+        """
+        if self.use_columnar_engine:
+            return self._accumulate_hourly_usage_columnar(
+                hourly_app_data, app_usage_data
+            )
+
+        app_usage_data = self._calculate_app_usage_duration(app_usage_data)
+        last_record = app_usage_data.pop()
+        self._accumulate_hourly_usage(hourly_app_data, app_usage_data, last_record)
+        return last_record
+
+    def _to_app_usage_record(self, hit: Dict) -> Optional[Dict]:
+        """
+        将ES中的UI监控命中转换为应用使用记录
+
+        Args:
+            hit: UI监控命中
+
+        Returns:
+            Optional[Dict]: 应用使用记录，timestamp为北京时间；时间无法解析时返回None
+        """
+        timestamp = self.timestamp_decoder.decode_hit(hit)  # 这里的timestamp是北京时间
+        if timestamp is None:
+            return None
+
+        item = hit["_source"]
+        return {
+            "timestamp": timestamp,
+            "app_name": item["app"],
+            "window_name": (item.get("window") or "")[:255],
+            "duration": 0,  # 初始化持续时间为0
+            "is_active": True,  # 假设所有记录的UI都是活跃的
+        }
+
+    async def _get_watermark(self, client_id: str) -> Optional[UsageWatermark]:
+        """获取客户端的增量计算水位"""
+        result = await self.db.execute(
+            select(UsageWatermark).where(UsageWatermark.client_id == client_id)
+        )
+        return result.scalars().first()
+
+    async def _get_adjacent_record(
+        self, query_service, client_id: str, **kwargs
+    ) -> Optional[Dict]:
+        """
+        获取与时间范围相邻的一条应用使用记录
+
+        Args:
+            query_service: 查询服务
+            client_id: 客户端ID
+            **kwargs: 传给iter_ui_monitoring_pages的时间范围、search_after和排序参数
+
+        Returns:
+            Optional[Dict]: 应用使用记录，不存在时返回None
+        """
+        pages = query_service.iter_ui_monitoring_pages(
+            client_id, page_size=1, source_fields=UI_SOURCE_FIELDS, **kwargs
+        )
+        try:
+            hits = await anext(pages, None)
+        finally:
+            await pages.aclose()
+
+        return self._to_app_usage_record(hits[0]) if hits else None
+
+    async def _save_watermark(self, client_id: str, record: Dict, sort_values: List):
+        """
+        保存客户端的增量计算水位，由调用方提交事务
+
+        水位只前进不后退：重算较早的时间范围时保留现有水位，否则增量计算会把水位之后
+        已经统计过的记录再累加一遍。比较和写入在一条INSERT ... ON DUPLICATE KEY UPDATE
+        语句中完成，并发写入同一客户端的水位时既不会主键冲突，也不会被较早的位置覆盖
+
+        Args:
+            client_id: 客户端ID
+            record: 最后处理的应用使用记录
+            sort_values: 该记录在ES中的排序值[毫秒时间戳, monitoring_id]
+        """
+        stmt = mysql_insert(UsageWatermark).values(
+            client_id=client_id,
+            last_timestamp=record["timestamp"],
+            last_sort_timestamp=sort_values[0],
+            last_monitoring_id=sort_values[1],
+            last_app_name=record["app_name"],
+        )
+        advanced = tuple_(
+            UsageWatermark.last_sort_timestamp, UsageWatermark.last_monitoring_id
+        ) < tuple_(stmt.inserted.last_sort_timestamp, stmt.inserted.last_monitoring_id)
+
+        # MySQL按顺序执行赋值，排序值放在最后更新，前面各列比较的仍是原有位置
+        columns = [
+            "last_timestamp",
+            "last_app_name",
+            "updated_at",
+            "last_monitoring_id",
+            "last_sort_timestamp",
+        ]
+        stmt = stmt.on_duplicate_key_update(
+            [
+                (
+                    column,
+                    case(
+                        (
+                            advanced,
+                            func.now()
+                            if column == "updated_at"
+                            else stmt.inserted[column],
+                        ),
+                        else_=UsageWatermark.__table__.c[column],
+                    ),
+                )
+                for column in columns
+            ]
+        )
+        await self.db.execute(stmt)
+
+    async def get_active_client_ids(
         self, start_time: datetime, end_time: datetime
     ) -> List[str]:
         """
@@ -382,9 +974,11 @@ class UsageAnalysisService:
 
         Returns:
             List[str]: 客户端ID列表
+
+        Raises:
+            Exception: 查询ES失败时抛出，由调用方决定是否忽略
         """
         try:
-
             # 构建查询
             query = {
                 "bool": {
@@ -401,42 +995,79 @@ class UsageAnalysisService:
                 }
             }
 
-            # 使用聚合查询获取唯一的客户端ID
-            aggs = {
-                "client_ids": {
-                    "terms": {
-                        "field": "client_id",
-                        "size": 1000,  # 设置一个较大的值以获取所有客户端
-                    }
-                }
-            }
+            # 通过composite聚合分页获取全部唯一的客户端ID，避免terms聚合的size截断
+            from ..services.query_service import QueryService
 
-            # 执行查询
+            query_service = QueryService(self.es_client)
             index_name = f"{settings.ES_INDEX_PREFIX}-ui-monitoring"
-            result = await self.es_client.search(
-                index=index_name,
-                body={
-                    "query": query,
-                    "aggs": aggs,
-                    "size": 0,  # 我们只需要聚合结果，不需要具体文档
-                },
-            )
 
-            # 提取客户端ID
-            client_ids = []
-            if "aggregations" in result and "client_ids" in result["aggregations"]:
-                for bucket in result["aggregations"]["client_ids"]["buckets"]:
-                    client_ids.append(bucket["key"])
+            client_ids = [
+                bucket["key"]
+                async for bucket in query_service.iter_composite_terms(
+                    index_name, query, "client_id"
+                )
+            ]
 
-            print(client_ids)
+            logger.info(f"找到 {len(client_ids)} 个活跃客户端")
             return client_ids
 
         except Exception as e:
             logger.error(f"获取活跃客户端ID时出错: {e}")
-            return []
+            raise
+
+    async def _clear_existing_sessions(
+        self,
+        client_id: str,
+        start_time: datetime,
+        end_time: datetime,
+        rebuild_from: datetime,
+    ):
+        """
+        清除指定客户端在时间范围内的应用会话，由调用方提交事务
+
+        在时间范围内开始的会话被删除；在范围之前开始、延续到重建起点之后的会话
+        截断到重建起点，避免与重新生成的会话重叠而重复计算时长
+
+        Args:
+            client_id: 客户端ID
+            start_time: 开始时间 (UTC)
+            end_time: 结束时间 (UTC)
+            rebuild_from: 重新生成的第一个会话的开始时间，即范围内第一条记录的时间（北京时间）
+        """
+        # 会话时间是北京时间
+        beijing_start_time = start_time + timedelta(hours=8)
+        await self.db.execute(
+            delete(AppSession).where(
+                AppSession.user_id == client_id,
+                AppSession.start_time >= beijing_start_time,
+                AppSession.start_time <= end_time + timedelta(hours=8),
+            )
+        )
+
+        # 同一客户端的会话互不重叠，只有范围之前的最后一个会话可能延续到范围内
+        result = await self.db.execute(
+            select(AppSession)
+            .where(
+                AppSession.user_id == client_id,
+                AppSession.start_time < beijing_start_time,
+            )
+            .order_by(AppSession.start_time.desc())
+            .limit(1)
+        )
+        previous = result.scalars().first()
+        if previous and previous.end_time > rebuild_from:
+            previous.end_time = rebuild_from
+            previous.duration_seconds = (
+                rebuild_from - previous.start_time
+            ).total_seconds()
+            await self.db.flush()
 
     async def _clear_existing_hourly_records(
-        self, client_id: str, start_time: datetime, end_time: datetime
+        self,
+        client_id: str,
+        start_time: datetime,
+        end_time: datetime,
+        commit: bool = True,
     ):
         """
         清除指定客户端在时间范围内的现有小时应用使用统计记录
@@ -445,6 +1076,7 @@ class UsageAnalysisService:
             client_id: 客户端ID
             start_time: 开始时间 (UTC)
             end_time: 结束时间 (UTC)
+            commit: 是否提交事务，为False时由调用方统一提交
         """
         try:
             # 注意：数据库中的timestamp字段存储的是北京时间，而start_time和end_time是UTC时间
@@ -463,7 +1095,16 @@ class UsageAnalysisService:
 
             # 执行删除
             await self.db.execute(stmt)
-            await self.db.commit()
+
+            # 被删除的小时统计无法按增量扣除，按剩余的小时统计重新生成涉及日期的每日汇总
+            await self.app_usage_service.refresh_daily_app_usage(
+                client_id,
+                beijing_start_time.date(),
+                beijing_end_time.date(),
+                commit=False,
+            )
+            if commit:
+                await self.db.commit()
 
             logger.info(
                 f"已清除客户端 {client_id} 在 {start_time} 到 {end_time} 之间的现有记录"
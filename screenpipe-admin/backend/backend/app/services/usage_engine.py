@@ -0,0 +1,154 @@
+import logging
+from datetime import datetime, timedelta
+from typing import Dict, List, Sequence, Tuple
+
+# 导入NumPy库，用于列式计算应用使用时间
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+    logging.warning("NumPy库未安装，应用使用时间将逐条记录计算")
+
+logger = logging.getLogger(__name__)
+
+LOCK_SCREEN_APP = "loginwindow"  # 锁屏状态的应用名称
+
+_EPOCH = datetime(1970, 1, 1)
+_ONE_MICROSECOND = timedelta(microseconds=1)
+_MICROSECONDS_PER_HOUR = 3600 * 1000000
+
+
+def to_epoch_microseconds(timestamps: Sequence[datetime]) -> "np.ndarray":
+    """
+    将不带时区的时间转换为自1970-01-01起的微秒数数组
+
+    Args:
+        timestamps: 时间列表
+
+    Returns:
+        np.ndarray: int64微秒数组
+    """
+    return np.fromiter(
+        ((timestamp - _EPOCH) // _ONE_MICROSECOND for timestamp in timestamps),
+        dtype=np.int64,
+        count=len(timestamps),
+    )
+
+
+def group_hourly_durations(
+    timestamps_us: "np.ndarray", app_names: Sequence[str]
+) -> Tuple[List[Tuple[str, datetime]], "np.ndarray", "np.ndarray", "np.ndarray", int]:
+    """
+    以列式方式计算应用使用时间和应用切换次数，并按应用和小时分组
+
+    计算规则与逐条记录的实现一致：按时间稳定排序，相邻记录的时间差全部分配给前一条记录，
+    锁屏记录和最后一条记录的时长为0，时长计入记录开始时间所在的小时。相邻两条记录的应用
+    不同时记为一次切换，分别计入切出记录和切入记录所在的小时；第一条记录的切入已在上一页计算
+
+    Args:
+        timestamps_us: 记录时间的微秒数组（北京时间）
+        app_names: 与时间一一对应的应用名称
+
+    Returns:
+        Tuple: ([(应用名称, 小时开始时间)], 每条有效记录所属的分组下标, 每条有效记录的秒数,
+            每条有效记录的切换次数, 排序后最后一条记录在输入中的下标)。分组按其第一条记录
+            出现的先后排列，有效记录保持时间顺序
+    """
+    # 应用名称编码为整数
+    codes_by_name: Dict[str, int] = {}
+    codes = np.fromiter(
+        (codes_by_name.setdefault(name, len(codes_by_name)) for name in app_names),
+        dtype=np.int64,
+        count=len(app_names),
+    )
+    names = list(codes_by_name)
+
+    # 按时间稳定排序
+    order = np.argsort(timestamps_us, kind="stable")
+    timestamps_us = timestamps_us[order]
+    codes = codes[order]
+
+    # 相邻记录的时间差分配给前一条记录，最后一条记录为0
+    durations_us = np.zeros(len(timestamps_us), dtype=np.int64)
+    durations_us[:-1] = np.diff(timestamps_us)
+
+    # 相邻记录应用不同即为一次切换，切出和切入各计一次
+    switched = codes[1:] != codes[:-1]
+    switches = np.zeros(len(codes), dtype=np.int64)
+    switches[:-1] += switched
+    switches[1:] += switched
+
+    # 锁屏状态不计入使用时间，也不单独统计
+    valid = (durations_us > 0) | (switches > 0)
+    lock_code = codes_by_name.get(LOCK_SCREEN_APP)
+    if lock_code is not None:
+        is_locked = codes == lock_code
+        durations_us[is_locked] = 0
+        valid &= ~is_locked
+
+    hours = timestamps_us[valid] // _MICROSECONDS_PER_HOUR
+    group_keys = hours * len(names) + codes[valid]
+
+    # 按应用和小时分组，分组编号按第一次出现的先后重新排列
+    unique_keys, first_index, inverse = np.unique(
+        group_keys, return_index=True, return_inverse=True
+    )
+    appearance = np.argsort(first_index, kind="stable")
+    rank = np.empty(len(appearance), dtype=np.int64)
+    rank[appearance] = np.arange(len(appearance))
+
+    groups = []
+    for key in unique_keys[appearance].tolist():
+        hour, code = divmod(key, len(names))
+        groups.append((names[code], _EPOCH + timedelta(hours=hour)))
+
+    # 秒数与timedelta.total_seconds()的计算方式相同：整数微秒除以10^6
+    seconds = durations_us[valid] / 1e6
+
+    return groups, rank[inverse.ravel()], seconds, switches[valid], int(order[-1])
+
+
+def sum_by_group(
+    group_index: "np.ndarray", seconds: "np.ndarray", initial: Sequence[float]
+) -> List[float]:
+    """
+    在各分组已有的累计值上按记录顺序累加秒数
+
+    初始值排在所有记录之前参与bincount，bincount按下标顺序逐个累加，
+    因此浮点加法的顺序与逐条记录累加完全相同
+
+    Args:
+        group_index: 每条记录所属的分组下标
+        seconds: 每条记录的秒数
+        initial: 每个分组已有的累计秒数
+
+    Returns:
+        List[float]: 每个分组累加后的秒数
+    """
+    group_count = len(initial)
+    totals = np.bincount(
+        np.concatenate([np.arange(group_count), group_index]),
+        weights=np.concatenate([np.asarray(initial, dtype=np.float64), seconds]),
+        minlength=group_count,
+    )
+    return totals.tolist()
+
+
+def count_by_group(
+    group_index: "np.ndarray", counts: "np.ndarray", initial: Sequence[int]
+) -> List[int]:
+    """
+    在各分组已有的计数上累加每条记录的计数
+
+    Args:
+        group_index: 每条记录所属的分组下标
+        counts: 每条记录的计数
+        initial: 每个分组已有的计数
+
+    Returns:
+        List[int]: 每个分组累加后的计数
+    """
+    totals = np.asarray(initial, dtype=np.int64)
+    np.add.at(totals, group_index, counts)
+    return totals.tolist()
@@ -0,0 +1,84 @@
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+from ..core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# 不限定客户端的查询结果使用的分组
+ALL_CLIENTS = "*"
+
+
+class UsageQueryCache:
+    """
+    应用使用统计查询结果缓存
+
+    结果按客户端分组缓存。某个客户端的小时统计写入后调用invalidate(client_id)，
+    使该客户端和所有不限定客户端的结果失效；多进程部署时另由TTL兜底
+    """
+
+    def __init__(self, ttl_seconds: int, max_entries: int = 1000):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._entries: Dict[str, Dict[Hashable, Tuple[float, Any]]] = {}
+        self._entry_count = 0
+        self._generations: Dict[str, int] = {}
+        self._epoch = 0
+
+    def invalidate(self, client_id: Optional[str] = None):
+        """
+        使缓存失效
+
+        Args:
+            client_id: 客户端ID，为None时使所有结果失效
+        """
+        if client_id is None:
+            self._epoch += 1
+            self._entries.clear()
+            self._entry_count = 0
+            return
+
+        for scope in (client_id, ALL_CLIENTS):
+            self._generations[scope] = self._generations.get(scope, 0) + 1
+            self._entry_count -= len(self._entries.pop(scope, {}))
+
+    async def get_or_load(
+        self,
+        client_id: Optional[str],
+        key: Hashable,
+        loader: Callable[[], Awaitable[Any]],
+    ) -> Any:
+        """
+        读取缓存的查询结果，没有缓存或已过期时调用loader查询并缓存
+
+        Args:
+            client_id: 客户端ID，为None表示查询不限定客户端
+            key: 查询参数
+            loader: 执行查询的协程函数
+
+        Returns:
+            Any: 查询结果
+        """
+        scope = client_id or ALL_CLIENTS
+        entry = self._entries.get(scope, {}).get(key)
+        if entry is not None and time.monotonic() - entry[0] < self.ttl_seconds:
+            return entry[1]
+
+        generation = (self._epoch, self._generations.get(scope, 0))
+        value = await loader()
+
+        # 查询期间数据发生变化时，不缓存本次查询的结果
+        if generation == (self._epoch, self._generations.get(scope, 0)):
+            if self._entry_count >= self.max_entries:
+                self._entries.clear()
+                self._entry_count = 0
+            entries = self._entries.setdefault(scope, {})
+            if key not in entries:
+                self._entry_count += 1
+            entries[key] = (time.monotonic(), value)
+
+        return value
+
+
+usage_query_cache = UsageQueryCache(ttl_seconds=settings.USAGE_QUERY_CACHE_TTL)
@@ -1,30 +1,52 @@
+import asyncio
 import logging
+import time
 from typing import List, Dict, Any, Optional
 import json
 from datetime import datetime, timedelta
 from elasticsearch import AsyncElasticsearch
+from sqlalchemy import select
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from ..core.config import settings
-from .query_service import QueryService
-
-# 导入OpenAI库，用于大模型分析
-try:
-    from openai import OpenAI
-    OPENAI_AVAILABLE = True
-except ImportError:
-    OPENAI_AVAILABLE = False
-    logging.warning("OpenAI库未安装，将无法进行工作内容分析")
+from ..db.mysql import AsyncSessionLocal
+from ..models.analysis import WorkSummary
+from .app_usage_service import AppUsageService
+from .llm_client import OPENAI_AVAILABLE, llm_client
+from .llm_result_cache import LLMResultCacheService, fingerprint, snap_window
+from .prompt_compactor import build_activity_prompt
+from .query_service import OTHER_BUCKET_NAME, QueryService
 
 logger = logging.getLogger(__name__)
 
+# 工作内容分析的提示模板版本，修改提示模板或模型时递增，使已缓存的结果失效
+WORK_SUMMARY_PROMPT_VERSION = "3"
+
+# 已保存的总结在窗口结束后这段时间内仍可直接返回，覆盖定时任务的执行间隔
+SUMMARY_GRACE_PERIOD = timedelta(hours=1)
+
+
+def summary_periods() -> List[int]:
+    """解析WORK_SUMMARY_PERIODS配置，返回定时生成总结的时间窗口长度列表（小时）"""
+    return [
+        int(hours) for hours in settings.WORK_SUMMARY_PERIODS.split(",") if hours.strip()
+    ]
+
 class WorkSummaryService:
     """
     工作内容总结服务，用于分析和总结用户的工作内容和行为
     """
     
-    def __init__(self, openai_api_key: Optional[str] = None, es_client: Optional[AsyncElasticsearch] = None):
+    def __init__(
+        self,
+        openai_api_key: Optional[str] = None,
+        es_client: Optional[AsyncElasticsearch] = None,
+        db: Optional[AsyncSession] = None,
+    ):
         self.openai_api_key = openai_api_key
         self.es_client = es_client
+        self.db = db
         self.client = None
         self.use_openai = False
         self._initialize_client()
@@ -36,10 +58,8 @@ class WorkSummaryService:
     def _initialize_client(self):
         """初始化OpenAI客户端"""
         if OPENAI_AVAILABLE and self.openai_api_key:
-            self.client = OpenAI(
-                api_key=self.openai_api_key,
-                base_url="https://openrouter.ai/api/v1",
-            )
+            # 共享进程内的异步客户端和连接池
+            self.client = llm_client.get(self.openai_api_key)
             self.use_openai = True
             logger.info("OpenAI客户端初始化成功")
         else:
@@ -60,15 +80,20 @@ class WorkSummaryService:
         self, 
         client_id: str, 
         start_time: datetime, 
-        end_time: datetime
+        end_time: datetime,
+        include_records: bool = True
     ) -> Dict[str, Any]:
         """
         获取用户的工作数据，包括UI监控数据和应用使用统计
         
+        应用和窗口统计由ES聚合计算，覆盖时间范围内的全部记录；UI监控记录只获取
+        生成提示所需的最近若干条
+        
         Args:
             client_id: 客户端ID
             start_time: 开始时间
             end_time: 结束时间
+            include_records: 是否获取最近的UI监控记录，只需要统计数据时传False
             
         Returns:
             包含工作数据的字典
@@ -78,88 +103,78 @@ class WorkSummaryService:
             return {}
         
         try:
-            # 获取UI监控数据
-            ui_result = await self.query_service.get_ui_monitoring_by_time(
-                client_id=client_id,
-                start_time=start_time,
-                end_time=end_time,
-                limit=1000,  # 获取更多数据以便分析
-                sort_order="asc"
-            )
+            # 统计聚合和最近记录两个查询并发执行
+            queries = [
+                self.query_service.get_ui_monitoring_stats(
+                    client_id=client_id,
+                    start_time=start_time,
+                    end_time=end_time
+                )
+            ]
+            if include_records:
+                queries.append(
+                    self.query_service.get_ui_monitoring_by_time(
+                        client_id=client_id,
+                        start_time=start_time,
+                        end_time=end_time,
+                        limit=settings.WORK_SUMMARY_RECENT_RECORDS,
+                        sort_order="desc",
+                        track_total_hits=False
+                    )
+                )
+            results = await asyncio.gather(*queries)
+            stats = results[0]
             
-            # 处理UI监控数据
+            # 处理UI监控数据，按时间升序排列
             ui_data = []
-            app_stats = {}  # 应用使用统计
-            window_stats = {}  # 窗口使用统计
-            
-            for item in ui_result["items"]:
-                # 添加到UI数据列表
-                ui_data.append({
-                    "timestamp": item["timestamp"],
-                    "app": item["app"],
-                    "window": item["window"],
-                    "text_output": item["text_output"],
-                    "metadata": {
-                        "platform": item.get("platform"),
-                        "os": item.get("os"),
-                        "os_version": item.get("os_version"),
-                        "hostname": item.get("hostname"),
-                        "app_version": item.get("app_version")
-                    }
-                })
-                
-                # 更新应用使用统计
-                app = item["app"]
-                if app not in app_stats:
-                    app_stats[app] = {
-                        "count": 0,
-                        "windows": set(),
-                        "first_seen": item["timestamp"],
-                        "last_seen": item["timestamp"]
-                    }
-                app_stats[app]["count"] += 1
-                app_stats[app]["windows"].add(item["window"])
-                app_stats[app]["last_seen"] = item["timestamp"]
-                
-                # 更新窗口使用统计
-                window_key = f"{app}::{item['window']}"
-                if window_key not in window_stats:
-                    window_stats[window_key] = {
-                        "app": app,
+            if include_records:
+                for item in reversed(results[1]["items"]):
+                    ui_data.append({
+                        "timestamp": item["timestamp"],
+                        "app": item["app"],
                         "window": item["window"],
-                        "count": 0,
-                        "first_seen": item["timestamp"],
-                        "last_seen": item["timestamp"]
-                    }
-                window_stats[window_key]["count"] += 1
-                window_stats[window_key]["last_seen"] = item["timestamp"]
+                        "text_output": item["text_output"],
+                        "metadata": {
+                            "platform": item.get("platform"),
+                            "os": item.get("os"),
+                            "os_version": item.get("os_version"),
+                            "hostname": item.get("hostname"),
+                            "app_version": item.get("app_version")
+                        }
+                    })
             
-            # 转换统计数据为列表格式
-            app_stats_list = []
-            for app, stats in app_stats.items():
-                app_stats_list.append({
-                    "app": app,
-                    "interaction_count": stats["count"],
-                    "window_count": len(stats["windows"]),
-                    "duration_minutes": round((datetime.fromisoformat(stats["last_seen"]) - 
-                                           datetime.fromisoformat(stats["first_seen"])).total_seconds() / 60, 1)
-                })
+            app_stats_list = stats["apps"]
             
-            window_stats_list = []
-            for stats in window_stats.values():
-                window_stats_list.append({
-                    "app": stats["app"],
-                    "window": stats["window"],
-                    "interaction_count": stats["count"],
-                    "duration_minutes": round((datetime.fromisoformat(stats["last_seen"]) - 
-                                           datetime.fromisoformat(stats["first_seen"])).total_seconds() / 60, 1)
-                })
+            # 应用切换次数读取小时统计中预先计算的值，小时统计使用北京时间
+            switch_count = None
+            if self.db is not None:
+                try:
+                    switch_count, app_switches = await AppUsageService(
+                        self.db
+                    ).get_switch_count(
+                        start_time + timedelta(hours=8),
+                        end_time + timedelta(hours=8),
+                        user_id=client_id,
+                    )
+                    listed_apps = {stat["app"] for stat in app_stats_list}
+                    for stat in app_stats_list:
+                        if stat["app"] == OTHER_BUCKET_NAME:
+                            # 合并统计的切换次数为排名之外所有应用的切换次数之和
+                            stat["switch_count"] = sum(
+                                count for app, count in app_switches.items()
+                                if app not in listed_apps
+                            )
+                        else:
+                            stat["switch_count"] = app_switches.get(stat["app"], 0)
+                except Exception as e:
+                    logger.warning(f"获取应用切换次数失败: {str(e)}")
             
             return {
                 "ui_data": ui_data,
-                "app_stats": sorted(app_stats_list, key=lambda x: x["interaction_count"], reverse=True),
-                "window_stats": sorted(window_stats_list, key=lambda x: x["interaction_count"], reverse=True),
-                "total_records": len(ui_data)
+                "app_stats": app_stats_list,
+                "window_stats": stats["windows"],
+                "total_records": stats["total"],
+                "switch_count": switch_count
             }
             
         except Exception as e:
@@ -169,14 +184,47 @@ class WorkSummaryService:
     async def analyze_work_content(
         self, 
         client_id: str, 
-        hours: int = 4
+        hours: int = 4,
+        refresh: bool = False
     ) -> Dict[str, Any]:
         """
         分析用户指定时间范围内的工作内容
         
+        优先返回已保存的最新总结（通常由定时任务预先生成），没有可用的总结时才即时分析
+        
         Args:
             client_id: 客户端ID
             hours: 要分析的小时数，默认为4小时
+            refresh: 是否忽略已保存的总结并重新分析
+            
+        Returns:
+            工作内容分析结果
+        """
+        if not refresh and self.db is not None:
+            try:
+                stored = await self.get_latest_summary(client_id, hours)
+                if stored:
+                    return {"success": True, "data": stored}
+            except Exception as e:
+                logger.warning(f"读取已保存的工作内容总结失败: {str(e)}")
+        
+        # 设置时间范围，结束时间对齐到缓存粒度，粒度内的重复请求可以复用分析结果
+        start_time, end_time = snap_window(datetime.utcnow(), timedelta(hours=hours))
+        return await self.generate_summary(client_id, start_time, end_time)
+    
+    async def generate_summary(
+        self,
+        client_id: str,
+        start_time: datetime,
+        end_time: datetime
+    ) -> Dict[str, Any]:
+        """
+        分析指定时间窗口内的工作内容，成功时保存分析结果
+        
+        Args:
+            client_id: 客户端ID
+            start_time: 开始时间（UTC）
+            end_time: 结束时间（UTC）
             
         Returns:
             工作内容分析结果
@@ -187,9 +235,7 @@ class WorkSummaryService:
                 "success": False
             }
         
-        # 设置时间范围
-        end_time = datetime.utcnow()
-        start_time = end_time - timedelta(hours=hours)
+        hours = round((end_time - start_time).total_seconds() / 3600)
         
         # 获取工作数据
         work_data = await self.get_work_data(client_id, start_time, end_time)
@@ -211,15 +257,20 @@ class WorkSummaryService:
 
 3. 主要窗口活动：
 {self._format_window_stats(work_data['window_stats'][:10])}  # 只显示前10个最活跃的窗口
-
+"""
+            if work_data.get("switch_count") is not None:
+                prompt += f"""
+4. 应用切换次数：{work_data['switch_count']}次，平均每小时{work_data['switch_count'] / hours:.1f}次
+"""
+            # 合并重复记录并去掉重复的UI文本，在token预算内添加交互记录
+            activity, activity_stats = build_activity_prompt(
+                work_data['ui_data'], settings.LLM_PROMPT_TOKEN_BUDGET, text_limit=200
+            )
+            logger.info(f"工作内容分析提示压缩: {activity_stats}")
+            prompt += f"""
 详细交互记录：
+{activity}
 """
-            # 添加最近的50条交互记录
-            recent_data = work_data['ui_data'][-50:]
-            for item in recent_data:
-                timestamp = datetime.fromisoformat(item["timestamp"]).strftime("%Y-%m-%d %H:%M:%S")
-                prompt += f"[{timestamp}] 应用: {item['app']} | 窗口: {item['window']}\n"
-                prompt += f"UI元素: {item['text_output'][:200]}...\n\n"
             
             prompt += """
 请生成一个详细的工作内容总结，包含以下方面：
@@ -263,24 +314,46 @@ class WorkSummaryService:
 ```
 请确保返回的是有效的JSON格式。只返回JSON对象，不要包含其他文本。"""
 
-            # 调用OpenAI API
-            response = await self._analyze_with_llm(prompt)
+            # 相同窗口和输入数据的分析结果已缓存时直接返回，否则调用OpenAI API
+            if self.db:
+                response, cached = await LLMResultCacheService(self.db).get_or_compute(
+                    "work_summary",
+                    client_id,
+                    start_time,
+                    end_time,
+                    WORK_SUMMARY_PROMPT_VERSION,
+                    fingerprint(
+                        work_data["ui_data"],
+                        work_data["app_stats"],
+                        work_data["switch_count"],
+                    ),
+                    lambda: self._analyze_with_llm(prompt),
+                )
+            else:
+                response, cached = await self._analyze_with_llm(prompt), False
             
             if response and isinstance(response, dict):
-                return {
-                    "success": True,
-                    "data": {
-                        "summary": response,
-                        "stats": {
-                            "total_records": work_data["total_records"],
-                            "app_stats": work_data["app_stats"][:5],  # 只返回前5个最常用的应用
-                            "time_range": {
-                                "start": start_time.isoformat(),
-                                "end": end_time.isoformat()
-                            }
+                data = {
+                    "summary": response,
+                    "cached": cached,
+                    "precomputed": False,
+                    "generated_at": datetime.utcnow().isoformat(),
+                    "stats": {
+                        "total_records": work_data["total_records"],
+                        "app_stats": work_data["app_stats"][:5],  # 只返回前5个最常用的应用
+                        "switch_count": work_data["switch_count"],
+                        "time_range": {
+                            "start": start_time.isoformat(),
+                            "end": end_time.isoformat()
                         }
                     }
                 }
+                if self.db is not None:
+                    try:
+                        await self._save_summary(client_id, hours, start_time, end_time, data)
+                    except Exception as e:
+                        logger.warning(f"保存工作内容总结失败: {str(e)}")
+                return {"success": True, "data": data}
             else:
                 return {
                     "error": "工作内容分析失败",
@@ -294,18 +367,176 @@ class WorkSummaryService:
                 "success": False
             }
     
+    async def get_latest_summary(
+        self,
+        client_id: str,
+        hours: int
+    ) -> Optional[Dict[str, Any]]:
+        """
+        读取客户端最新保存的工作内容总结
+        
+        窗口结束时间早于当前时间减去窗口长度和宽限期，或提示模板版本不一致的总结不返回
+        
+        Args:
+            client_id: 客户端ID
+            hours: 分析的小时数
+            
+        Returns:
+            Optional[Dict[str, Any]]: 工作内容分析结果，没有可用的总结时返回None
+        """
+        cutoff = datetime.utcnow() - timedelta(hours=hours) - SUMMARY_GRACE_PERIOD
+        result = await self.db.execute(
+            select(WorkSummary.result)
+            .where(
+                WorkSummary.client_id == client_id,
+                WorkSummary.hours == hours,
+                WorkSummary.window_end >= cutoff,
+                WorkSummary.prompt_version == WORK_SUMMARY_PROMPT_VERSION,
+            )
+            .order_by(WorkSummary.window_end.desc())
+            .limit(1)
+        )
+        stored = result.scalar()
+        if stored is None:
+            return None
+        
+        data = json.loads(stored)
+        data["precomputed"] = True
+        return data
+    
+    async def _save_summary(
+        self,
+        client_id: str,
+        hours: int,
+        start_time: datetime,
+        end_time: datetime,
+        data: Dict[str, Any]
+    ):
+        """保存工作内容总结，相同客户端和时间窗口的总结已存在时覆盖"""
+        try:
+            stmt = mysql_insert(WorkSummary).values(
+                client_id=client_id,
+                hours=hours,
+                window_start=start_time,
+                window_end=end_time,
+                prompt_version=WORK_SUMMARY_PROMPT_VERSION,
+                result=json.dumps(data, ensure_ascii=False, default=str),
+            )
+            stmt = stmt.on_duplicate_key_update(
+                window_start=stmt.inserted.window_start,
+                prompt_version=stmt.inserted.prompt_version,
+                result=stmt.inserted.result,
+            )
+            await self.db.execute(stmt)
+            await self.db.commit()
+        except Exception as e:
+            logger.error(f"保存工作内容总结失败: {str(e)}")
+            await self.db.rollback()
+            raise
+    
+    async def precompute_summaries(self, periods: List[int]) -> Dict[str, Any]:
+        """
+        为活跃客户端生成最近一个完整时间窗口的工作内容总结
+        
+        每种窗口按自身长度对齐（1小时窗口对齐到整点，24小时窗口对齐到UTC零点），
+        窗口结束后只生成一次，已有总结的客户端跳过。各窗口的对齐方式不同，活跃客户端
+        按窗口分别从ES获取，这些查询不使用数据库会话，并发执行；已有总结的查询合并为
+        一次数据库查询。同时处理的客户端数量受WORK_SUMMARY_CONCURRENCY限制，模型请求
+        还受LLM全局并发上限限制，避免与在线请求和使用统计计算争用ES、数据库和模型资源
+        
+        Args:
+            periods: 时间窗口长度列表（小时）
+            
+        Returns:
+            Dict[str, Any]: 本次运行的指标，包括生成数量、失败数量和总耗时
+        """
+        if not self.use_openai or not self.es_client or self.db is None:
+            logger.warning("OpenAI客户端、ES客户端或数据库会话不可用，跳过工作内容总结的预先生成")
+            return {"generated_count": 0, "failed_count": 0, "elapsed_seconds": 0}
+        
+        from .usage_analysis_service import UsageAnalysisService
+        
+        run_started = time.monotonic()
+        now = datetime.utcnow()
+        
+        # 找出每种窗口下还没有总结的活跃客户端
+        windows = {
+            hours: snap_window(now, timedelta(hours=hours), hours * 3600) for hours in periods
+        }
+        usage_service = UsageAnalysisService(self.db, self.es_client)
+        active_client_ids = await asyncio.gather(
+            *(usage_service.get_active_client_ids(*window) for window in windows.values())
+        )
+        result = await self.db.execute(
+            select(WorkSummary.client_id, WorkSummary.hours, WorkSummary.window_end).where(
+                WorkSummary.hours.in_(list(windows)),
+                WorkSummary.window_end.in_([end_time for _, end_time in windows.values()]),
+                WorkSummary.prompt_version == WORK_SUMMARY_PROMPT_VERSION,
+            )
+        )
+        existing = set(result.all())
+        jobs = [
+            (cid, start_time, end_time)
+            for (hours, (start_time, end_time)), client_ids in zip(
+                windows.items(), active_client_ids
+            )
+            for cid in client_ids
+            if (cid, hours, end_time) not in existing
+        ]
+        
+        # 每个客户端使用独立的数据库会话，单个客户端出错不影响其他客户端
+        semaphore = asyncio.Semaphore(settings.WORK_SUMMARY_CONCURRENCY)
+        
+        async def process(cid: str, start_time: datetime, end_time: datetime) -> bool:
+            async with semaphore:
+                try:
+                    async with AsyncSessionLocal() as db:
+                        worker = WorkSummaryService(self.openai_api_key, self.es_client, db)
+                        result = await worker.generate_summary(cid, start_time, end_time)
+                    if not result.get("success", False):
+                        logger.warning(
+                            f"生成客户端 {cid} 在 {start_time} 到 {end_time} 的工作内容总结失败: "
+                            f"{result.get('error')}"
+                        )
+                        return False
+                    return True
+                except Exception as e:
+                    logger.error(f"生成客户端 {cid} 的工作内容总结时出错: {e}")
+                    return False
+        
+        results = await asyncio.gather(*(process(*job) for job in jobs))
+        
+        metrics = {
+            "generated_count": sum(results),
+            "failed_count": len(results) - sum(results),
+            "elapsed_seconds": round(time.monotonic() - run_started, 3),
+        }
+        logger.info(
+            f"工作内容总结预先生成完成：生成 {metrics['generated_count']} 个，"
+            f"失败 {metrics['failed_count']} 个，总耗时 {metrics['elapsed_seconds']} 秒"
+        )
+        return metrics
+    
     def _format_app_stats(self, app_stats: List[Dict[str, Any]]) -> str:
         """格式化应用程序统计信息"""
         result = ""
         for stat in app_stats:
-            result += (f"- {stat['app']}: {stat['interaction_count']}次交互, "
-                      f"{stat['window_count']}个窗口, {stat['duration_minutes']}分钟\n")
+            result += f"- {stat['app']}: {stat['interaction_count']}次交互"
+            # 排名之外应用的合并统计没有窗口数和时长
+            if stat["window_count"] is not None:
+                result += f", {stat['window_count']}个窗口, {stat['duration_minutes']}分钟"
+            if "switch_count" in stat:
+                result += f", 切入切出{stat['switch_count']}次"
+            result += "\n"
         return result
     
     def _format_window_stats(self, window_stats: List[Dict[str, Any]]) -> str:
         """格式化窗口统计信息"""
         result = ""
         for stat in window_stats:
+            if stat["app"] is None:
+                result += f"- {stat['window']}: {stat['interaction_count']}次交互\n"
+                continue
             result += (f"- {stat['app']} - {stat['window']}: "
                       f"{stat['interaction_count']}次交互, {stat['duration_minutes']}分钟\n")
         return result
@@ -313,7 +544,8 @@ class WorkSummaryService:
     async def _analyze_with_llm(self, prompt: str) -> Optional[Dict[str, Any]]:
         """使用LLM分析数据"""
         try:
-            response = self.client.chat.completions.create(
+            response = await llm_client.chat_completion(
+                self.client,
                 model="anthropic/claude-3.7-sonnet",
                 messages=[
                     {
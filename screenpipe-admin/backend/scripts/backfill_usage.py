@@ -0,0 +1,246 @@
+#!/usr/bin/env python
+"""
+TimeGlass 应用使用统计回填脚本
+
+将日期范围按“客户端 × 天”切分为任务块，在多个工作进程中并行重建小时应用使用统计和应用会话。
+同一客户端的任务块按日期依次处理，不同客户端之间并行。不早于增量计算水位的日期由定时任务
+负责，回填时跳过。已完成的任务块记录在检查点文件中，中断后使用相同参数再次运行即可从断点继续。
+"""
+
+import os
+import sys
+import json
+import time
+import atexit
+import asyncio
+import logging
+import argparse
+import multiprocessing
+from collections import defaultdict, deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from datetime import date, datetime, timedelta
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+DEFAULT_CHECKPOINT = "backfill_usage_checkpoint.jsonl"
+
+# 工作进程内复用的事件循环，ES客户端和数据库连接池都绑定在这个循环上
+_worker_loop = None
+
+
+def day_range_utc(day):
+    """返回北京时间某一天对应的UTC时间范围，结束时间包含在内"""
+    start_time = datetime.combine(day, datetime.min.time()) - timedelta(hours=8)
+    end_time = start_time + timedelta(days=1) - timedelta(microseconds=1)
+    return start_time, end_time
+
+
+def iter_days(start_date, end_date):
+    """按天遍历日期范围，包含结束日期"""
+    day = start_date
+    while day <= end_date:
+        yield day
+        day += timedelta(days=1)
+
+
+def load_checkpoint(path):
+    """读取检查点文件，返回已完成的任务块集合"""
+    completed = set()
+    if not os.path.exists(path):
+        return completed
+
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            entry = json.loads(line)
+            if entry["status"] == "done":
+                completed.add((entry["client_id"], entry["date"]))
+    return completed
+
+
+async def list_chunks(days, client_ids):
+    """列出需要处理的任务块，未指定客户端时查询每天活跃的客户端"""
+    from backend.app.db.elasticsearch import es_client
+    from backend.app.services.usage_analysis_service import UsageAnalysisService
+
+    chunks = []
+    try:
+        service = UsageAnalysisService(None, es_client)
+        for day in days:
+            if client_ids:
+                day_clients = client_ids
+            else:
+                day_clients = await service.get_active_client_ids(*day_range_utc(day))
+            chunks.extend((client_id, day.isoformat()) for client_id in day_clients)
+    finally:
+        await es_client.close()
+
+    return chunks
+
+
+def init_worker(log_level):
+    """工作进程初始化：配置日志并创建进程内的事件循环"""
+    global _worker_loop
+    logging.basicConfig(
+        level=log_level, format="%(asctime)s %(processName)s %(levelname)s %(message)s"
+    )
+    _worker_loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(_worker_loop)
+    atexit.register(close_worker)
+
+
+def close_worker():
+    """工作进程退出时关闭ES客户端和数据库连接池"""
+    from backend.app.db.elasticsearch import es_client
+    from backend.app.db.mysql import engine
+
+    _worker_loop.run_until_complete(es_client.close())
+    _worker_loop.run_until_complete(engine.dispose())
+    _worker_loop.close()
+
+
+async def _backfill_chunk(client_id, day):
+    from backend.app.db.elasticsearch import es_client
+    from backend.app.db.mysql import AsyncSessionLocal
+    from backend.app.services.usage_analysis_service import UsageAnalysisService
+
+    async with AsyncSessionLocal() as db:
+        service = UsageAnalysisService(db, es_client)
+        return await service.backfill_client_range(client_id, *day_range_utc(day))
+
+
+def run_chunk(client_id, day_str):
+    """在工作进程中处理一个任务块，返回处理结果"""
+    started = time.monotonic()
+    try:
+        record_count = _worker_loop.run_until_complete(
+            _backfill_chunk(client_id, date.fromisoformat(day_str))
+        )
+        status, error = "done", None
+    except ValueError as e:
+        # 范围不早于增量计算水位，由定时任务处理
+        record_count, status, error = 0, "skipped", str(e)
+    except Exception as e:
+        record_count, status, error = 0, "failed", str(e)
+
+    return {
+        "client_id": client_id,
+        "date": day_str,
+        "status": status,
+        "records": record_count,
+        "elapsed_seconds": round(time.monotonic() - started, 3),
+        "error": error,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="TimeGlass 应用使用统计回填脚本")
+    parser.add_argument("--start-date", type=date.fromisoformat, required=True, help="开始日期（北京时间），如 2025-03-01")
+    parser.add_argument("--end-date", type=date.fromisoformat, required=True, help="结束日期（北京时间，包含）")
+    parser.add_argument("--client-id", action="append", dest="client_ids", help="只处理指定客户端，可重复指定")
+    parser.add_argument("-w", "--workers", type=int, default=os.cpu_count() or 1, help="工作进程数量")
+    parser.add_argument("--checkpoint", default=DEFAULT_CHECKPOINT, help="检查点文件路径")
+    parser.add_argument("--restart", action="store_true", help="忽略已有检查点，重新处理所有任务块")
+    parser.add_argument("-v", "--verbose", action="store_true", help="显示工作进程的详细日志")
+    args = parser.parse_args()
+
+    if args.end_date < args.start_date:
+        print("错误: 结束日期不能早于开始日期")
+        return 1
+
+    if args.restart and os.path.exists(args.checkpoint):
+        os.remove(args.checkpoint)
+
+    days = list(iter_days(args.start_date, args.end_date))
+    try:
+        chunks = asyncio.run(list_chunks(days, args.client_ids))
+    except Exception as e:
+        print(f"错误: 获取活跃客户端失败: {e}")
+        return 1
+    completed = load_checkpoint(args.checkpoint)
+    pending = [chunk for chunk in chunks if chunk not in completed]
+
+    print(f"日期范围: {args.start_date} ~ {args.end_date}，共 {len(days)} 天")
+    print(f"任务块: {len(chunks)} 个，已完成 {len(chunks) - len(pending)} 个，待处理 {len(pending)} 个")
+    if not pending:
+        return 0
+
+    log_level = logging.INFO if args.verbose else logging.WARNING
+    failed = 0
+    skipped = 0
+    total_records = 0
+    started = time.monotonic()
+
+    # 使用spawn启动工作进程，避免继承父进程中的事件循环和连接
+    executor = ProcessPoolExecutor(
+        max_workers=args.workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=init_worker,
+        initargs=(log_level,),
+    )
+    # 同一客户端的任务块按日期排队，同一时刻每个客户端只有一个任务块在处理，
+    # 避免并发清除和写入同一客户端的统计、会话
+    queues = defaultdict(deque)
+    for client_id, day_str in sorted(pending, key=lambda chunk: chunk[1]):
+        queues[client_id].append((client_id, day_str))
+    running = {}
+
+    def submit_next(client_id):
+        if queues[client_id]:
+            running[executor.submit(run_chunk, *queues[client_id].popleft())] = client_id
+
+    try:
+        with open(args.checkpoint, "a", encoding="utf-8") as checkpoint:
+            for client_id in list(queues):
+                submit_next(client_id)
+
+            finished = 0
+            while running:
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    submit_next(running.pop(future))
+                    result = future.result()
+                    finished += 1
+                    checkpoint.write(json.dumps(result, ensure_ascii=False) + "\n")
+                    checkpoint.flush()
+
+                    total_records += result["records"]
+                    if result["status"] == "skipped":
+                        skipped += 1
+                    elif result["status"] != "done":
+                        failed += 1
+
+                    elapsed = time.monotonic() - started
+                    chunks_per_second = finished / elapsed
+                    eta = (len(pending) - finished) / chunks_per_second
+                    status = {"done": "完成", "skipped": f"跳过: {result['error']}"}.get(
+                        result["status"], f"失败: {result['error']}"
+                    )
+                    print(
+                        f"[{finished}/{len(pending)}] {result['client_id']} {result['date']} "
+                        f"{result['records']} 条记录 {result['elapsed_seconds']} 秒 {status} | "
+                        f"{chunks_per_second:.2f} 块/秒 {total_records / elapsed:.0f} 条/秒 "
+                        f"剩余约 {eta:.0f} 秒"
+                    )
+    except KeyboardInterrupt:
+        executor.shutdown(wait=False, cancel_futures=True)
+        print("\n已中断，使用相同参数再次运行即可从检查点继续")
+        return 130
+    finally:
+        executor.shutdown()
+
+    elapsed = time.monotonic() - started
+    print("=" * 80)
+    print(f"处理 {len(pending)} 个任务块，跳过 {skipped} 个，失败 {failed} 个，共 {total_records} 条记录")
+    print(f"总耗时 {elapsed:.1f} 秒，{len(pending) / elapsed:.2f} 块/秒，{total_records / elapsed:.0f} 条/秒")
+    if failed:
+        print("失败的任务块未记为完成，使用相同参数再次运行即可重试")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
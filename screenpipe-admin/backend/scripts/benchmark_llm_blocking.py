@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+"""
+LLM调用对事件循环影响的测试脚本
+
+用模拟的LLM接口（每次请求固定延迟）同时发起多次工作内容分析，期间每10毫秒
+执行一次轻量任务，模拟其他接口的请求，统计这些任务的延迟。
+分别运行同步OpenAI客户端（旧实现）和共享的异步客户端，比较两者的延迟。
+"""
+
+import os
+import sys
+import json
+import time
+import asyncio
+import logging
+import argparse
+import statistics
+
+import httpx
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from openai import OpenAI
+
+from backend.app.services.llm_client import LLM_BASE_URL, LLMClient
+from backend.app.services.work_summary_service import WorkSummaryService
+import backend.app.services.work_summary_service as work_summary_module
+
+TICK_INTERVAL = 0.01
+
+
+def completion_body():
+    return {
+        "id": "benchmark",
+        "object": "chat.completion",
+        "created": 0,
+        "model": "benchmark",
+        "choices": [
+            {
+                "index": 0,
+                "finish_reason": "stop",
+                "message": {"role": "assistant", "content": json.dumps({"summary": "ok"})},
+            }
+        ],
+    }
+
+
+async def measure_ticks(stop):
+    """每隔TICK_INTERVAL执行一次轻量任务，返回每次的额外延迟（毫秒）"""
+    delays = []
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(TICK_INTERVAL)
+        delays.append((time.perf_counter() - started - TICK_INTERVAL) * 1000)
+    return delays
+
+
+async def run(mode, analyses, latency):
+    if mode == "sync":
+        # 旧实现：在async函数中直接调用同步客户端
+        def handler(request):
+            time.sleep(latency)
+            return httpx.Response(200, json=completion_body())
+
+        client = OpenAI(
+            api_key="benchmark",
+            base_url=LLM_BASE_URL,
+            http_client=httpx.Client(transport=httpx.MockTransport(handler)),
+        )
+
+        class SyncClient:
+            async def chat_completion(self, client, **kwargs):
+                return client.chat.completions.create(**kwargs)
+
+        work_summary_module.llm_client = SyncClient()
+    else:
+        async def handler(request):
+            await asyncio.sleep(latency)
+            return httpx.Response(200, json=completion_body())
+
+        shared = LLMClient(max_concurrency=analyses, max_connections=analyses, timeout=60)
+        shared._http_client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        client = shared.get("benchmark")
+        work_summary_module.llm_client = shared
+
+    service = WorkSummaryService()
+    service.client = client
+    service.use_openai = True
+
+    stop = asyncio.Event()
+    ticker = asyncio.create_task(measure_ticks(stop))
+    started = time.perf_counter()
+    results = await asyncio.gather(
+        *(service._analyze_with_llm("benchmark") for _ in range(analyses))
+    )
+    elapsed = time.perf_counter() - started
+    stop.set()
+    delays = await ticker
+
+    assert all(result == {"summary": "ok"} for result in results)
+    return elapsed, delays
+
+
+def main():
+    parser = argparse.ArgumentParser(description="LLM调用对事件循环影响的测试")
+    parser.add_argument("--analyses", type=int, default=4, help="同时进行的分析数量")
+    parser.add_argument("--latency", type=float, default=1.0, help="模拟LLM接口的响应时间（秒）")
+    args = parser.parse_args()
+
+    # 测试时不提供API密钥，忽略服务初始化时的警告
+    logging.getLogger(work_summary_module.__name__).setLevel(logging.ERROR)
+
+    for mode in ("sync", "async"):
+        elapsed, delays = asyncio.run(run(mode, args.analyses, args.latency))
+        delays.sort()
+        p99 = delays[min(len(delays) - 1, int(len(delays) * 0.99))]
+        print(
+            f"{mode:>5}: {args.analyses} 次分析耗时 {elapsed:.2f} 秒，"
+            f"其他任务执行 {len(delays)} 次，额外延迟 中位数 {statistics.median(delays):.1f} 毫秒 "
+            f"p99 {p99:.1f} 毫秒 最大 {delays[-1]:.1f} 毫秒"
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+"""
+应用使用时间计算基准测试脚本
+
+用随机生成的UI监控记录分别运行逐条记录的实现和NumPy列式实现，
+检查两者生成的小时统计是否一致，并输出耗时和加速比。
+"""
+
+import os
+import sys
+import time
+import random
+import argparse
+from datetime import datetime, timedelta
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from backend.app.services.usage_analysis_service import UsageAnalysisService
+from backend.app.services.usage_engine import NUMPY_AVAILABLE
+
+APP_NAMES = [f"App {i}" for i in range(50)] + ["loginwindow"]
+
+
+def generate_pages(events, page_size, seed):
+    """生成按时间升序、按页切分的应用使用记录"""
+    rng = random.Random(seed)
+    timestamp = datetime(2025, 3, 1, 8, 0, 0)
+    app_name = APP_NAMES[0]
+    records = []
+    for _ in range(events):
+        # 毫秒精度的采样间隔，偶尔出现相同时间戳
+        timestamp += timedelta(milliseconds=rng.choice([0, rng.randint(1, 10000)]))
+        # 大部分采样停留在同一个应用上
+        if rng.random() < 0.05:
+            app_name = rng.choice(APP_NAMES)
+        records.append({"timestamp": timestamp, "app_name": app_name})
+    return [records[i:i + page_size] for i in range(0, len(records), page_size)]
+
+
+def run(pages, use_columnar_engine):
+    """按_accumulate_ui_stream的方式逐页计算，返回聚合结果和耗时"""
+    service = UsageAnalysisService(None, None)
+    service.use_columnar_engine = use_columnar_engine
+
+    hourly_app_data = {}
+    carry = None
+    elapsed = 0.0
+    for page in pages:
+        app_usage_data = [carry] if carry else []
+        app_usage_data.extend(
+            {**record, "duration": 0, "is_active": True} for record in page
+        )
+        # 只统计持续时间计算和按小时累加的耗时
+        started = time.perf_counter()
+        carry = service._accumulate_page(hourly_app_data, app_usage_data)
+        elapsed += time.perf_counter() - started
+    return hourly_app_data, elapsed
+
+
+def summarize(hourly_app_data):
+    """提取与最终写入数据库的记录相同精度的结果，用于比较"""
+    return {
+        key: (
+            data["app_name"],
+            data["timestamp"],
+            data["is_working_hour"],
+            round(data["total_time_seconds"] / 60, 2),
+            data["switch_count"],
+        )
+        for key, data in hourly_app_data.items()
+        if data["total_time_seconds"] > 0 or data["switch_count"]
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="应用使用时间计算基准测试")
+    parser.add_argument("--events", type=int, default=1000000, help="记录数量")
+    parser.add_argument("--page-size", type=int, default=1000, help="每页记录数量")
+    parser.add_argument("--seed", type=int, default=0, help="随机数种子")
+    args = parser.parse_args()
+
+    if not NUMPY_AVAILABLE:
+        print("未安装NumPy，无法运行列式实现")
+        return 1
+
+    print(f"生成 {args.events} 条记录，每页 {args.page_size} 条...")
+    pages = generate_pages(args.events, args.page_size, args.seed)
+
+    python_result, python_elapsed = run(pages, use_columnar_engine=False)
+    columnar_result, columnar_elapsed = run(pages, use_columnar_engine=True)
+
+    print(f"逐条记录实现: {python_elapsed:.3f} 秒")
+    print(f"NumPy列式实现: {columnar_elapsed:.3f} 秒")
+    print(f"加速比: {python_elapsed / columnar_elapsed:.1f}x")
+
+    python_summary = summarize(python_result)
+    columnar_summary = summarize(columnar_result)
+    if python_summary != columnar_summary:
+        print("结果不一致！")
+        return 1
+
+    print(f"结果一致，共 {len(columnar_summary)} 条小时统计")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,74 @@
+"""
+UI监控活动直方图接口的时间参数测试
+
+用假的ES客户端记录聚合请求，检查带时区的时间参数与补齐的默认时间可以一起计算桶数量
+"""
+
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi import HTTPException
+
+from backend.app.api.endpoints.query import get_activity_histogram
+
+
+class FakeElasticsearch:
+    """记录search请求并返回空的直方图聚合"""
+
+    def __init__(self):
+        self.bodies = []
+
+    async def search(self, index, body):
+        self.bodies.append(body)
+        return {"aggregations": {"activity": {"buckets": []}}}
+
+
+def _call(es_client, **params):
+    defaults = {
+        "client_id": None,
+        "start_time": None,
+        "end_time": None,
+        "app": None,
+        "window": None,
+        "interval": "1h",
+        "time_zone": "+08:00",
+        "group_by": None,
+        "group_size": 10,
+    }
+    defaults.update(params)
+    return asyncio.run(get_activity_histogram(es_client=es_client, **defaults))
+
+
+def test_aware_start_time_without_end_time():
+    es_client = FakeElasticsearch()
+    start_time = datetime.fromisoformat("2026-10-18T00:00:00Z")
+
+    _call(es_client, start_time=start_time)
+
+    time_range = es_client.bodies[0]["query"]["bool"]["must"][0]["range"]["timestamp"]
+    # 统一为不带时区的UTC时间后传给ES
+    assert time_range["gte"] == "2026-10-18T00:00:00"
+    assert "+" not in time_range["lte"]
+
+
+def test_aware_start_time_is_converted_to_utc():
+    es_client = FakeElasticsearch()
+    start_time = datetime.fromisoformat("2026-10-18T08:00:00+08:00")
+    end_time = datetime(2026, 10, 18, 12, 0, 0)
+
+    _call(es_client, start_time=start_time, end_time=end_time)
+
+    bounds = es_client.bodies[0]["aggs"]["activity"]["date_histogram"]["extended_bounds"]
+    assert bounds == {"min": "2026-10-18T00:00:00", "max": "2026-10-18T12:00:00"}
+
+
+def test_aware_start_time_bucket_limit_returns_400():
+    es_client = FakeElasticsearch()
+    start_time = datetime.fromisoformat("2026-10-18T00:00:00Z") - timedelta(days=30)
+
+    with pytest.raises(HTTPException) as exc_info:
+        _call(es_client, start_time=start_time, interval="1m")
+
+    assert exc_info.value.status_code == 400
+    assert es_client.bodies == []
@@ -0,0 +1,109 @@
+"""
+应用类别匹配规则测试
+
+编译后的匹配规则（完全匹配表、Aho-Corasick自动机和拼接字符串查找）必须与
+逐个类别比较的朴素实现给出相同的结果
+"""
+
+import random
+
+import pytest
+
+from backend.app.services.app_category_matcher import _CompiledCategories
+
+
+def reference_match(categories, app_name):
+    """朴素实现：先找名称完全相同（忽略大小写）的类别，再按ID顺序找互相包含的类别"""
+    app_name_lower = app_name.lower()
+    for category_id, name in categories:
+        if name.lower() == app_name_lower:
+            return category_id
+    for category_id, name in categories:
+        name_lower = name.lower()
+        if name_lower in app_name_lower or app_name_lower in name_lower:
+            return category_id
+    return None
+
+
+def random_name(rng, alphabet, max_length):
+    return "".join(rng.choice(alphabet) for _ in range(rng.randint(0, max_length)))
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_matches_reference_on_random_names(seed):
+    """小字母表生成大量重叠、重复和大小写不同的名称，逐个与朴素实现比较"""
+    rng = random.Random(seed)
+    alphabet = "abAB微信"
+    categories = [
+        (category_id, random_name(rng, alphabet, 4))
+        for category_id in sorted(rng.sample(range(1, 1000), rng.randint(0, 30)))
+    ]
+    compiled = _CompiledCategories(categories)
+
+    for _ in range(300):
+        app_name = random_name(rng, alphabet, 8)
+        assert compiled.match(app_name) == reference_match(categories, app_name), (
+            categories,
+            app_name,
+        )
+
+
+def test_matches_reference_on_realistic_names():
+    categories = [
+        (1, "未分类"),
+        (2, "Code"),
+        (3, "Visual Studio Code"),
+        (5, "Google Chrome"),
+        (8, "Chrome"),
+        (9, "微信"),
+        (12, "Terminal"),
+        (13, "term"),
+    ]
+    compiled = _CompiledCategories(categories)
+    app_names = [
+        "Code",
+        "code",
+        "Visual Studio Code",
+        "visual studio code - insiders",
+        "Chrome",
+        "Google Chrome Canary",
+        "chrome",
+        "微信",
+        "企业微信",
+        "iTerm2",
+        "Terminal",
+        "Term",
+        "Slack",
+        "",
+        "ode",
+        "al\0Chrome",
+    ]
+    for app_name in app_names:
+        assert compiled.match(app_name) == reference_match(categories, app_name), app_name
+
+
+def test_exact_match_takes_precedence_over_lower_id():
+    """完全匹配优先于ID更小的包含匹配"""
+    compiled = _CompiledCategories([(1, "Code"), (2, "Visual Studio Code")])
+
+    assert compiled.match("visual studio code") == 2
+    assert compiled.match("Visual Studio Code Insiders") == 1
+
+
+def test_duplicate_names_prefer_lowest_id():
+    compiled = _CompiledCategories([(3, "Chrome"), (7, "chrome")])
+
+    assert compiled.match("CHROME") == 3
+
+
+def test_substring_does_not_span_joined_names():
+    """应用名称包含于类别名称的查找不能跨越两个类别名称"""
+    compiled = _CompiledCategories([(1, "abc"), (2, "def")])
+
+    assert compiled.match("cd") is None
+    assert compiled.match("bc") == 1
+    assert compiled.match("de") == 2
+
+
+def test_no_categories():
+    assert _CompiledCategories([]).match("Code") is None
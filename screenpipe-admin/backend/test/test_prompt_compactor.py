@@ -0,0 +1,122 @@
+"""
+UI活动记录提示压缩测试
+
+检查生成的提示不超过token预算、重复的UI文本只保留最新的一份，以及连续记录的合并
+"""
+
+import random
+from datetime import datetime, timedelta
+
+import pytest
+
+from backend.app.services.prompt_compactor import build_activity_prompt, estimate_tokens
+
+TEXT_SNIPPETS = [
+    "保存文件 main.py",
+    "git commit -m fix",
+    "收件箱 (3) 新邮件",
+    "def build_activity_prompt(records)",
+]
+
+
+def record(minute, app, window, text=""):
+    return {
+        "timestamp": datetime(2025, 3, 1, 9) + timedelta(minutes=minute),
+        "app": app,
+        "window": window,
+        "text_output": text,
+    }
+
+
+def random_records(rng):
+    """生成中英文混排、大量重复文本的记录"""
+    records = []
+    for minute in range(rng.randint(0, 60)):
+        lines = [
+            rng.choice(TEXT_SNIPPETS)
+            if rng.random() < 0.6
+            else "".join(rng.choice("abc微信文档 ") for _ in range(rng.randint(1, 80)))
+            for _ in range(rng.randint(0, 6))
+        ]
+        records.append(
+            record(
+                minute,
+                rng.choice(["Code", "Chrome", "微信"]),
+                rng.choice(["main.py", "收件箱"]),
+                "\n".join(lines),
+            )
+        )
+    return records
+
+
+def prompt_tokens(prompt):
+    """按build_activity_prompt的计算方式统计提示的token数，每行额外计1个换行"""
+    if not prompt:
+        return 0
+    return sum(estimate_tokens(line) + 1 for line in prompt.split("\n"))
+
+
+@pytest.mark.parametrize("seed", range(200))
+def test_prompt_stays_within_budget(seed):
+    rng = random.Random(seed)
+    budget = rng.randint(1, 800)
+
+    prompt, stats = build_activity_prompt(
+        random_records(rng), budget, text_limit=rng.choice([50, 200, 500])
+    )
+
+    assert prompt_tokens(prompt) <= budget
+    assert stats["estimated_tokens"] == prompt_tokens(prompt)
+
+
+def test_repeated_text_is_kept_only_in_latest_segment():
+    records = [
+        record(0, "Code", "main.py", "def build_activity_prompt(records)\n保存文件 main.py"),
+        record(1, "Chrome", "文档", "Python documentation"),
+        record(2, "Code", "main.py", "def build_activity_prompt(records)\n运行测试"),
+    ]
+
+    prompt, stats = build_activity_prompt(records, 1000)
+
+    lines = prompt.split("\n")
+    assert prompt.count("def build_activity_prompt(records)") == 1
+    assert lines[-1] == "UI元素: def build_activity_prompt(records) | 运行测试"
+    # 较早片段中只保留未出现过的文本行
+    assert "UI元素: 保存文件 main.py" in lines
+    assert stats["text_segments"] == 3
+
+
+def test_consecutive_records_are_merged():
+    records = [
+        record(0, "Code", "main.py", "第一行"),
+        record(1, "Code", "main.py", "第一行"),
+        record(5, "Code", "main.py", "第二行"),
+        record(6, "Chrome", "文档"),
+    ]
+
+    prompt, stats = build_activity_prompt(records, 1000)
+
+    assert stats["segments"] == 2
+    assert prompt.split("\n") == [
+        "[2025-03-01 09:00:00] 应用: Code | 窗口: main.py | 持续至 09:05:00，3条记录",
+        "UI元素: 第一行 | 第二行",
+        "[2025-03-01 09:06:00] 应用: Chrome | 窗口: 文档",
+    ]
+
+
+def test_small_budget_keeps_most_recent_headers_in_order():
+    records = [record(minute, f"App{minute}", "w", "text") for minute in range(50)]
+
+    prompt, stats = build_activity_prompt(records, 60)
+
+    headers = [line for line in prompt.split("\n") if line.startswith("[")]
+    assert 0 < stats["included_segments"] < 50
+    assert headers[-1].endswith("应用: App49 | 窗口: w")
+    assert headers == sorted(headers)
+
+
+def test_empty_records():
+    prompt, stats = build_activity_prompt([], 100)
+
+    assert prompt == ""
+    assert stats["estimated_tokens"] == 0
@@ -0,0 +1,154 @@
+"""
+应用使用时间列式实现与逐条记录实现的一致性测试
+
+两种实现对相同的分页记录计算出的小时统计（秒数、切换次数）和留到下一页的记录
+必须完全相同，浮点秒数也要逐位相等
+"""
+
+import asyncio
+import random
+from datetime import datetime, timedelta
+
+import pytest
+
+pytest.importorskip("numpy")
+
+from backend.app.services.usage_analysis_service import UsageAnalysisService
+from backend.app.services.usage_engine import LOCK_SCREEN_APP
+
+APP_NAMES = ["Code", "Chrome", "Slack", "Terminal", LOCK_SCREEN_APP]
+
+
+def generate_records(count, seed, start=datetime(2025, 3, 1, 8, 59, 30)):
+    """生成按时间升序的记录，包含相同时间戳、微秒精度的间隔和跨小时、跨天的间隔"""
+    rng = random.Random(seed)
+    timestamp = start
+    app_name = APP_NAMES[0]
+    records = []
+    for _ in range(count):
+        gap = rng.choice(
+            [
+                timedelta(0),
+                timedelta(microseconds=rng.randint(1, 999999)),
+                timedelta(seconds=rng.randint(1, 120)),
+                timedelta(minutes=rng.randint(30, 200)),
+            ]
+        )
+        timestamp += gap
+        if rng.random() < 0.3:
+            app_name = rng.choice(APP_NAMES)
+        records.append({"timestamp": timestamp, "app_name": app_name})
+    return records
+
+
+def run(records, page_size, use_columnar_engine, shuffle_seed=None):
+    """按_accumulate_ui_stream的方式逐页计算，返回小时统计和最后留下的记录"""
+    service = UsageAnalysisService(None, None)
+    service.use_columnar_engine = use_columnar_engine
+
+    hourly_app_data = {}
+    carry = None
+    for start in range(0, len(records), page_size):
+        page = [
+            {**record, "duration": 0, "is_active": True}
+            for record in records[start:start + page_size]
+        ]
+        if shuffle_seed is not None:
+            random.Random(shuffle_seed + start).shuffle(page)
+        app_usage_data = [carry] if carry else []
+        app_usage_data.extend(page)
+        carry = service._accumulate_page(hourly_app_data, app_usage_data)
+    return hourly_app_data, carry
+
+
+def nonempty(hourly_app_data):
+    """只比较会写入数据库的分组，两种实现可能为没有时长和切换的记录创建空分组"""
+    return {
+        key: data
+        for key, data in hourly_app_data.items()
+        if data["total_time_seconds"] > 0 or data["switch_count"]
+    }
+
+
+@pytest.mark.parametrize("seed", range(5))
+@pytest.mark.parametrize("page_size", [1, 2, 7, 100, 5000])
+def test_columnar_engine_matches_list_engine(seed, page_size):
+    """任意分页方式下两种实现的结果逐位相同"""
+    records = generate_records(2000, seed)
+
+    expected, expected_carry = run(records, page_size, use_columnar_engine=False)
+    actual, actual_carry = run(records, page_size, use_columnar_engine=True)
+
+    assert nonempty(actual) == nonempty(expected)
+    assert actual_carry == expected_carry
+
+
+def test_columnar_engine_matches_unsorted_pages():
+    """页内记录乱序时两种实现都先按时间稳定排序"""
+    records = generate_records(1000, seed=42)
+
+    expected, expected_carry = run(records, 50, False, shuffle_seed=7)
+    actual, actual_carry = run(records, 50, True, shuffle_seed=7)
+
+    assert nonempty(actual) == nonempty(expected)
+    assert actual_carry == expected_carry
+
+
+def test_paging_does_not_change_result():
+    """逐页计算与一次计算全部记录的结果相同"""
+    records = generate_records(1000, seed=3)
+
+    whole, whole_carry = run(records, len(records), use_columnar_engine=True)
+    paged, paged_carry = run(records, 13, use_columnar_engine=True)
+
+    assert nonempty(paged).keys() == nonempty(whole).keys()
+    for key, data in nonempty(whole).items():
+        assert paged[key]["switch_count"] == data["switch_count"]
+        assert paged[key]["total_time_seconds"] == pytest.approx(data["total_time_seconds"])
+    assert paged_carry == whole_carry
+
+
+@pytest.mark.parametrize("use_columnar_engine", [False, True])
+def test_lock_screen_and_switch_rules(use_columnar_engine):
+    """锁屏记录不计时长，时间差计入前一条记录所在小时，切出和切入分别计入各自的小时"""
+    records = [
+        {"timestamp": datetime(2025, 3, 3, 9, 50), "app_name": "Code"},
+        {"timestamp": datetime(2025, 3, 3, 10, 5), "app_name": "Chrome"},
+        {"timestamp": datetime(2025, 3, 3, 10, 20), "app_name": LOCK_SCREEN_APP},
+        {"timestamp": datetime(2025, 3, 3, 11, 0), "app_name": "Chrome"},
+        {"timestamp": datetime(2025, 3, 3, 11, 10), "app_name": "Chrome"},
+    ]
+
+    hourly_app_data, carry = run(records, len(records), use_columnar_engine)
+
+    summary = {
+        key: (data["total_time_seconds"], data["switch_count"])
+        for key, data in nonempty(hourly_app_data).items()
+    }
+    assert summary == {
+        "Code_2025-03-03_09": (900.0, 1),
+        "Chrome_2025-03-03_10": (900.0, 2),
+        "Chrome_2025-03-03_11": (600.0, 1),
+    }
+    assert carry["timestamp"] == datetime(2025, 3, 3, 11, 10)
+    assert carry["duration"] == 0
+
+
+def test_full_recalculation_skips_undecodable_records(monkeypatch):
+    """命中的时间全部无法解析时不清除现有统计，也不访问数据库"""
+
+    async def pages(self, client_id, **kwargs):
+        yield [{"_source": {"timestamp": "invalid", "app": "Code"}, "sort": [1]}]
+
+    monkeypatch.setattr(
+        "backend.app.services.query_service.QueryService.iter_ui_monitoring_pages", pages
+    )
+    service = UsageAnalysisService(None, None)
+
+    processed = asyncio.run(
+        service._recalculate_client_full(
+            "client", datetime(2025, 3, 1), datetime(2025, 3, 2)
+        )
+    )
+
+    assert processed == 0
@@ -0,0 +1,161 @@
+"""
+应用使用统计查询的执行计划测试
+
+用SQLite内存数据库按模型建表，捕获服务实际执行的语句，检查EXPLAIN QUERY PLAN
+是否通过复合索引按客户端和时间范围查找，而不是全表扫描。SQLite的优化器与MySQL不同，
+这里只验证语句的条件写法能够使用这些索引
+"""
+
+import asyncio
+from datetime import date
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+
+from backend.app.db.mysql import Base
+from backend.app.models.app_usage import AppCategory, DailyAppUsage, HourlyAppUsage
+from backend.app.services.app_usage_service import AppUsageService
+from backend.app.services.usage_query_cache import usage_query_cache
+
+# 以(user_id, timestamp)开头的小时统计复合索引
+HOURLY_COMPOSITE_INDEXES = (
+    "ix_hourly_app_usage_user_ts_app",
+    "ix_hourly_app_usage_heatmap",
+)
+
+
+class RecordingSession:
+    """在同步会话上执行语句并记录，供异步服务方法调用"""
+
+    def __init__(self, session: Session):
+        self.session = session
+        self.statements = []
+
+    async def execute(self, statement):
+        self.statements.append(statement)
+        return self.session.execute(statement)
+
+
+@pytest.fixture
+def recorder():
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(
+        engine,
+        tables=[
+            AppCategory.__table__,
+            HourlyAppUsage.__table__,
+            DailyAppUsage.__table__,
+        ],
+    )
+    with Session(engine) as session:
+        yield RecordingSession(session)
+    engine.dispose()
+
+
+def query_plan(recorder: RecordingSession, statement):
+    """返回语句在SQLite中的执行计划，每个元素是一行计划的描述"""
+    sql = str(
+        statement.compile(
+            dialect=recorder.session.bind.dialect,
+            compile_kwargs={"literal_binds": True},
+        )
+    )
+    rows = recorder.session.connection().exec_driver_sql(f"EXPLAIN QUERY PLAN {sql}")
+    return [row[-1] for row in rows]
+
+
+def table_steps(plan, table):
+    return [step for step in plan if f" {table} " in f" {step} "]
+
+
+def assert_client_range_search(plan, table, indexes, columns):
+    """断言表只通过指定索引按客户端和范围查找"""
+    steps = table_steps(plan, table)
+    assert steps, plan
+    for step in steps:
+        assert step.startswith("SEARCH"), plan
+        assert any(f"INDEX {index} " in step for index in indexes), plan
+        assert f"({columns}" in step, plan
+
+
+def test_hourly_usage_uses_client_time_index(recorder):
+    """按客户端查询小时统计时使用(user_id, timestamp)复合索引"""
+    service = AppUsageService(recorder)
+    asyncio.run(
+        service.get_hourly_app_usage(date(2025, 3, 1), date(2025, 3, 2), user_id="c1")
+    )
+
+    assert len(recorder.statements) == 2
+    for statement in recorder.statements:
+        assert_client_range_search(
+            query_plan(recorder, statement),
+            "hourly_app_usage",
+            HOURLY_COMPOSITE_INDEXES,
+            "user_id=? AND timestamp>? AND timestamp<?",
+        )
+
+
+def test_hourly_summary_uses_client_time_index(recorder):
+    """按客户端查询单日的每小时应用统计时使用复合索引"""
+    service = AppUsageService(recorder)
+    asyncio.run(service.get_hourly_app_usage_summary(date(2025, 3, 1), user_id="c1"))
+
+    (statement,) = recorder.statements
+    assert_client_range_search(
+        query_plan(recorder, statement),
+        "hourly_app_usage",
+        HOURLY_COMPOSITE_INDEXES,
+        "user_id=? AND timestamp>? AND timestamp<?",
+    )
+
+
+def test_all_clients_hourly_range_uses_timestamp_index(recorder):
+    """不限制客户端时按timestamp索引查找范围，没有对timestamp调用函数导致全表扫描"""
+    service = AppUsageService(recorder)
+    asyncio.run(service.get_hourly_app_usage_summary(date(2025, 3, 1)))
+
+    (statement,) = recorder.statements
+    steps = table_steps(query_plan(recorder, statement), "hourly_app_usage")
+    assert steps
+    assert all(step.startswith("SEARCH") for step in steps), steps
+    assert all("(timestamp>? AND timestamp<?)" in step for step in steps), steps
+
+
+@pytest.mark.parametrize("top_n", [None, 5])
+def test_daily_usage_uses_client_date_index(recorder, top_n):
+    """长时间范围的每日统计读取每日汇总表，并使用(user_id, usage_date)复合索引"""
+    service = AppUsageService(recorder)
+    asyncio.run(
+        service.get_daily_app_usage(
+            date(2025, 3, 1), date(2025, 3, 31), user_id="c1", top_n=top_n
+        )
+    )
+
+    (statement,) = recorder.statements
+    plan = query_plan(recorder, statement)
+    assert not table_steps(plan, "hourly_app_usage"), plan
+    assert_client_range_search(
+        plan,
+        "daily_app_usage",
+        ("ix_daily_app_usage_user_date",),
+        "user_id=? AND usage_date>? AND usage_date<?",
+    )
+
+
+def test_heatmap_uses_covering_index(recorder):
+    """热力图查询只读取覆盖索引，不回表"""
+    client_id = "heatmap-client"
+    usage_query_cache.invalidate(client_id)
+    service = AppUsageService(recorder)
+    asyncio.run(
+        service.get_usage_heatmap(date(2025, 3, 1), date(2025, 3, 31), user_id=client_id)
+    )
+    usage_query_cache.invalidate(client_id)
+
+    (statement,) = recorder.statements
+    steps = table_steps(query_plan(recorder, statement), "hourly_app_usage")
+    assert steps == [
+        "SEARCH hourly_app_usage USING COVERING INDEX ix_hourly_app_usage_heatmap "
+        "(user_id=? AND timestamp>? AND timestamp<?)"
+    ]